@@ -14,6 +14,9 @@ expand the model dimensions by the expansion factor, and if this expanded
 distance lies below the minimum specified threshold, the threshold distance 
 will be chosen as the supercell dimension instead.
 
+To expand a whole directory of .cif files without dialogs, run
+supercell_expansion.py instead.
+
 The 'pymatgen', 'os', and 'tkinter' packages are required.
 
 @author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
@@ -23,6 +26,7 @@ The 'pymatgen', 'os', and 'tkinter' packages are required.
 import pymatgen as mg
 import os
 from tkinter import filedialog
+from supercell_expansion import expand_structure
 
 ## Specify expansion factor. Setting equal to 1 results in no change.
 expansion_factor = 1.20
@@ -44,34 +48,9 @@ OriginalStructure = None
 OriginalStructure = mg.IStructure.from_file(structure_file)
 
 ## Create ExpandedStructure with larger supercell
-ExpandedStructure = None
-# Calculate expanded supercell dimension
-abc = list(round(expansion_factor * lattice_param, 3) 
-           for lattice_param in OriginalStructure.lattice.abc)
-# If expanded dimension is less than minimum, set dimension equal to minimum
-abc = [lattice_param if lattice_param > min_dimension 
-       else min_dimension for lattice_param in abc]
-latt = mg.Lattice.from_parameters(abc[0], abc[1], abc[2], 90, 90, 90)
-# Create expanded structure object. 
-# One 'dummy' site (to be deleted) is necessary to initialize the object.
-ExpandedStructure = mg.Structure(latt, ["O"], [[0,0,0]])
-# Remove dummy site
-ExpandedStructure.remove_sites([0])
-
-## Add every site from OriginalStructure
-for site in OriginalStructure:  
-    ExpandedStructure.append(site.specie, 
-                             site.coords, 
-                             coords_are_cartesian=True)
-
-# Translate all sites by a distance equal to 
-# half of the expansion distance in each axis
-translation_vector = [0.5*(new_lat_param - old_lat_param) 
-                      for new_lat_param, old_lat_param 
-                      in zip(abc, OriginalStructure.lattice.abc)]
-ExpandedStructure.translate_sites(list(range(ExpandedStructure.num_sites)), 
-                                  translation_vector, 
-                                  frac_coords=False)
+# The expanded structure is built in one step from the site arrays, see
+# supercell_expansion.py (which also expands whole directories headless)
+ExpandedStructure = expand_structure(OriginalStructure, expansion_factor, min_dimension)
 
 # Save ExpandedStructure as .cif file
 expanded_name = structure_name + '_expanded'
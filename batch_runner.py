@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Resumable process-pool batch runner for multislice simulations.
+
+This replaces starting one Python interpreter per .cel file with GNU
+parallel (see parallel-48cores-drp.sh). A fixed pool of worker processes is
+started once; every worker imports numpy/PIL (and drprobe) a single time,
+loads the general MSA and WavImg parameter files, and works inside its own
+scratch directory so that temporary files of the Dr. Probe programs never
+collide.
+
+drprobe is only imported when it is needed: for the drprobe backend (or
+validate_backend), or to read .prm parameter files. With --backend numpy,
+the parameters can instead be given as .json files written by
+multislice_pipeline.save_parameters(), so the batch runs without drprobe.
+
+Structures are scheduled largest file first, so the biggest models do not
+hold up the end of the run. Every finished or failed structure is appended
+to a manifest (manifest.jsonl in the output directory), keyed by the
+absolute path of its .cel file; when the job is started again after a
+time-out, structures that are already done are skipped. Output directories
+are created with exist_ok, so a structure that was interrupted half-way is
+simply simulated again.
+
+At most one structure per worker is in flight. If a worker process dies
+(e.g. killed for running out of memory), the structures in flight are
+recorded as failed and the pool is started again for the rest, so a resumed
+run does not crash on the same structure again (use --retry-failed to
+simulate them anyway).
+
+Usage (see python batch_runner.py --help):
+    python batch_runner.py INPUT_DIR OUTPUT_DIR CLEAN_DIR NOISY_DIR
+        --msa-prm MsaPrm.prm --wav-prm WavPrm.prm --jobs 48 --threads 1
+        [--settings settings.json] [--backend drprobe|numpy]
+
+settings.json may hold any key of multislice_pipeline.DEFAULT_SETTINGS.
+Noisy images are written as single files; stacked noise output
+(NoiseStackWriter) is not shared between processes. With --series-container
+all images go into one HDF5 file (series.h5 in the output directory, see
+series_container.py) instead: every worker collects the images of its
+structure in a SeriesCollector, and the parent process writes them with a
+single SeriesWriter, which a resumed run continues. A structure is recorded
+as done only after its frame is written, flagged complete and flushed; on
+resume, structures that the manifest lists as done but whose frame is not
+complete in the container are simulated again. A container that cannot be
+opened any more (e.g. a job killed during a write) is moved aside to
+series.h5.damaged and all structures are written again.
+
+Only the standard library is imported by the parent process (plus
+multislice_pipeline.py and series_container.py for a series container); the
+workers need the packages of multislice_pipeline.py.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import argparse
+import datetime
+import glob
+import importlib.util
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+MANIFEST_NAME = 'manifest.jsonl'
+CONTAINER_NAME = 'series.h5'
+
+## Environment variables that limit the threads of numpy's BLAS/FFT libraries
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'NUMEXPR_NUM_THREADS']
+
+## State of a worker process, set by _init_worker
+_worker = {}
+
+
+def read_manifest(manifest_path):
+    """Latest manifest record of every structure, keyed by the absolute path of its .cel file."""
+    records = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut off by a killed job
+                    continue
+                records[record['cel']] = record
+    return records
+
+
+def append_manifest(manifest_path, record):
+    with open(manifest_path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def pending_structures(cel_files, records, retry_failed=False):
+    """Structures still to simulate, largest .cel file first."""
+    pending = []
+    for cel_file in cel_files:
+        status = records.get(os.path.abspath(cel_file), {}).get('status')
+        if status == 'done' or (status == 'failed' and not retry_failed):
+            continue
+        pending.append(cel_file)
+    return sorted(pending, key=os.path.getsize, reverse=True)
+
+
+def _init_worker(scratch_root, threads, msa_prm_file, wav_prm_file):
+    """Set thread limits, enter a private scratch directory and load the parameter files."""
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads)
+    scratch_dir = os.path.join(scratch_root, f'worker-{os.getpid()}')
+    os.makedirs(scratch_dir, exist_ok=True)
+    os.chdir(scratch_dir)
+
+    import numpy_multislice
+    import multislice_pipeline
+    numpy_multislice.set_fft_workers(threads)
+    msa_prm_gen, wav_prm_gen = load_parameters(msa_prm_file, wav_prm_file)
+    _worker.update(pipeline=multislice_pipeline, msa_prm_gen=msa_prm_gen,
+                   wav_prm_gen=wav_prm_gen, scratch_dir=scratch_dir)
+
+
+def check_backend(settings, msa_prm_file, wav_prm_file):
+    """
+    Raise an error in the parent process, before any worker starts, if the
+    backend or the parameter files need drprobe and it is not installed.
+    """
+    # The default backend of multislice_pipeline.DEFAULT_SETTINGS
+    needs_drprobe = (settings.get('backend', 'drprobe') == 'drprobe'
+                     or settings.get('validate_backend', False))
+    json_files = msa_prm_file.endswith('.json') and wav_prm_file.endswith('.json')
+    if needs_drprobe and json_files:
+        raise ValueError('The drprobe backend needs .prm parameter files')
+    if (needs_drprobe or not json_files) and importlib.util.find_spec('drprobe') is None:
+        raise ImportError("The 'drprobe' package is needed for the drprobe backend and to read "
+                          '.prm files; for the numpy backend, pass .json parameter files '
+                          '(multislice_pipeline.save_parameters)')
+
+
+def load_parameters(msa_prm_file, wav_prm_file):
+    """
+    General MSA and WavImg parameter objects from .prm files (needs drprobe)
+    or from .json files of multislice_pipeline.save_parameters().
+    """
+    import multislice_pipeline
+    if msa_prm_file.endswith('.json') and wav_prm_file.endswith('.json'):
+        return (multislice_pipeline.read_parameters(msa_prm_file),
+                multislice_pipeline.read_parameters(wav_prm_file))
+    import drprobe as drp
+    msa_prm_gen = drp.msaprm.MsaPrm()
+    msa_prm_gen.load_msa_prm(msa_prm_file)
+    wav_prm_gen = drp.wavimgprm.WavimgPrm()
+    wav_prm_gen.load_wav_prm(wav_prm_file)
+    return msa_prm_gen, wav_prm_gen
+
+
+def _run_structure(cel_file, output_dir, clean_image_dir, noisy_image_dir, settings,
+                   slice_cache_dir=None, slice_cache_budget=None, container_settings=None,
+                   container_wave_dtype=None):
+    """
+    Simulate one structure inside a worker and return its manifest record.
+    With container_settings (the settings of the series container), the
+    images and their noise are returned in record['series_items'] (a
+    series_container.SeriesCollector) instead of being written to files.
+    """
+    name = os.path.splitext(os.path.basename(cel_file))[0]
+    start = time.time()
+    record = {'structure': name, 'cel': cel_file, 'worker': os.getpid()}
+    try:
+        slice_cache = None
+        if slice_cache_dir is not None:
+            from slice_cache import SliceCache
+            slice_cache = SliceCache(slice_cache_dir, max_bytes=slice_cache_budget)
+        collector = None
+        if container_settings is not None:
+            from series_container import SeriesCollector
+            collector = SeriesCollector(container_settings, container_wave_dtype)
+        result = _worker['pipeline'].simulate_structure(
+            cel_file, output_dir, clean_image_dir, noisy_image_dir,
+            _worker['msa_prm_gen'], _worker['wav_prm_gen'], settings,
+            slice_cache=slice_cache, container=collector)
+        record.update(status='done', images=result['images'])
+        if collector is not None:
+            record['series_items'] = collector
+    except Exception:
+        record.update(status='failed', error=traceback.format_exc())
+    record['seconds'] = round(time.time() - start, 2)
+    return record
+
+
+def run_batch(cel_files, output_dir, clean_image_dir, noisy_image_dir, msa_prm_file,
+              wav_prm_file, settings=None, jobs=None, threads=1, scratch_root=None,
+              retry_failed=False, slice_cache_dir=None, slice_cache_budget=None,
+              series_container=False, container_wave_dtype=None):
+    """
+    Simulate cel_files on a pool of jobs worker processes with threads threads
+    each, skipping structures the manifest already lists as done. With
+    series_container the images go into output_dir/series.h5, with exit
+    waves if container_wave_dtype is 'complex64' or 'float16'.
+    Returns the list of new manifest records.
+    """
+    check_backend(settings or {}, msa_prm_file, wav_prm_file)
+    output_dir, clean_image_dir, noisy_image_dir = (
+        os.path.abspath(path) for path in (output_dir, clean_image_dir, noisy_image_dir))
+    for directory in (output_dir, clean_image_dir, noisy_image_dir):
+        os.makedirs(directory, exist_ok=True)
+    scratch_root = os.path.abspath(scratch_root or os.path.join(output_dir, 'scratch'))
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    cel_files = [os.path.abspath(cel_file) for cel_file in cel_files]
+    manifest = read_manifest(manifest_path)
+
+    container = container_settings = None
+    if series_container:
+        container = _open_container(os.path.join(output_dir, CONTAINER_NAME), cel_files,
+                                    settings or {}, msa_prm_file, wav_prm_file,
+                                    container_wave_dtype)
+        container_settings = container.settings
+        manifest = _check_container(manifest, container)
+    pending = pending_structures(cel_files, manifest, retry_failed)
+    print(f'{len(pending)} of {len(cel_files)} structures left to simulate')
+    if not pending:
+        if container is not None:
+            container.close()
+        return []
+
+    jobs = jobs or os.cpu_count()
+    initargs = (scratch_root, threads, os.path.abspath(msa_prm_file),
+                os.path.abspath(wav_prm_file))
+    queue = deque(pending)
+    running = {}
+    records = []
+
+    def finish(record):
+        series_items = record.pop('series_items', None)
+        if series_items is not None:
+            try:
+                # Done only once the frame is on disk
+                series_items.replay(container)
+                container.flush()
+            except RuntimeError:
+                record.update(status='failed', error=traceback.format_exc())
+        record['finished'] = datetime.datetime.now().isoformat(timespec='seconds')
+        append_manifest(manifest_path, record)
+        records.append(record)
+        print(f"[{len(records)}/{len(pending)}] {record['structure']}: "
+              f"{record['status']} ({record['seconds']} s)")
+
+    pool = _start_pool(jobs, initargs)
+    try:
+        while queue or running:
+            while queue and len(running) < jobs:
+                try:
+                    future = pool.submit(_run_structure, queue[0], output_dir, clean_image_dir,
+                                         noisy_image_dir, settings or {}, slice_cache_dir,
+                                         slice_cache_budget, container_settings,
+                                         container_wave_dtype)
+                except BrokenProcessPool:
+                    # A worker died since the last check; its futures report it below
+                    break
+                running[future] = (queue.popleft(), time.time())
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                cel_file, start = running.pop(future)
+                try:
+                    finish(future.result())
+                except BrokenProcessPool:
+                    broken = True
+                    finish(_lost_record(cel_file, start))
+            if broken:
+                # Every structure still in flight was lost with the dead worker
+                for cel_file, start in running.values():
+                    finish(_lost_record(cel_file, start))
+                running.clear()
+                pool.shutdown(wait=True, cancel_futures=True)
+                if queue:
+                    print('A worker process died; starting a new pool')
+                    pool = _start_pool(jobs, initargs)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        if container is not None:
+            container.close()
+    pool.shutdown()
+    return records
+
+
+def _open_container(path, cel_files, settings, msa_prm_file, wav_prm_file, wave_dtype):
+    """SeriesWriter of a batch, continuing an existing container of the same layout."""
+    import multislice_pipeline
+    from series_container import SeriesWriter
+    settings = dict(multislice_pipeline.DEFAULT_SETTINGS, **settings)
+    if settings['sampling_file'] is not None:
+        nx, ny, nz = multislice_pipeline.read_sampling(settings['sampling_file'])
+        settings.update(nx=nx, ny=ny, nz=nz)
+    frame_names = sorted({os.path.splitext(os.path.basename(cel_file))[0]
+                          for cel_file in cel_files})
+    parameters = {'msa_prm_file': os.path.abspath(msa_prm_file),
+                  'wav_prm_file': os.path.abspath(wav_prm_file)}
+    try:
+        return SeriesWriter(path, settings, frame_names=frame_names, parameters=parameters,
+                            wave_dtype=wave_dtype, append=True)
+    except OSError:
+        # HDF5 files are not crash-safe; a job killed during a write can leave
+        # a file that cannot be opened
+        print(f'WARNING: {path} cannot be opened; moved to {path}.damaged and started again')
+        os.replace(path, path + '.damaged')
+        return SeriesWriter(path, settings, frame_names=frame_names, parameters=parameters,
+                            wave_dtype=wave_dtype)
+
+
+def _check_container(manifest, container):
+    """Manifest without the done records whose frame is not complete in the container."""
+    completed = container.completed_frames
+    missing = {cel: record for cel, record in manifest.items()
+               if record['status'] == 'done' and record['structure'] not in completed}
+    if missing:
+        print(f'{len(missing)} structures listed as done are not complete in the '
+              'series container and are simulated again')
+    return {cel: record for cel, record in manifest.items() if cel not in missing}
+
+
+def _start_pool(jobs, initargs):
+    # Fresh interpreters, so the thread limits apply before numpy is imported
+    context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                               initializer=_init_worker, initargs=initargs)
+
+
+def _lost_record(cel_file, start):
+    """Manifest record of a structure whose worker process died."""
+    return {'structure': os.path.splitext(os.path.basename(cel_file))[0], 'cel': cel_file,
+            'status': 'failed', 'seconds': round(time.time() - start, 2),
+            'error': 'The worker process died (e.g. out of memory) while this structure '
+                     'was in flight'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumable batch multislice simulation.')
+    parser.add_argument('input', help='Directory of .cel files or a glob pattern')
+    parser.add_argument('output_dir', help='Directory for per-structure output and the manifest')
+    parser.add_argument('clean_image_dir', help='Directory for the clean .tif images')
+    parser.add_argument('noisy_image_dir', help='Directory for the noisy .tif images')
+    parser.add_argument('--msa-prm', required=True,
+                        help='General MSA parameter file (.prm, or .json for the numpy backend)')
+    parser.add_argument('--wav-prm', required=True,
+                        help='General WavImg parameter file (.prm, or .json for the numpy backend)')
+    parser.add_argument('--settings', help='JSON file with simulation settings')
+    parser.add_argument('--backend', choices=['drprobe', 'numpy'], default=None,
+                        help='Simulation backend (overrides the settings file)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of simulations running at once (default: all cores)')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Threads used by each simulation')
+    parser.add_argument('--scratch', help='Root of the per-worker scratch directories')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='Simulate structures that failed in a previous run again')
+    parser.add_argument('--slice-cache', help='Directory of the slice cache')
+    parser.add_argument('--slice-cache-budget', type=float, default=None,
+                        help='Disk budget of the slice cache in bytes')
+    parser.add_argument('--series-container', action='store_true',
+                        help=f'Write all images to {CONTAINER_NAME} in the output directory (needs h5py)')
+    parser.add_argument('--container-wave-dtype', choices=['complex64', 'float16'], default=None,
+                        help='Also store the exit waves in the series container')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        cel_files = glob.glob(os.path.join(args.input, '*.cel'))
+    else:
+        cel_files = glob.glob(args.input)
+    settings = {}
+    if args.settings:
+        with open(args.settings, 'r') as f:
+            settings = json.load(f)
+    if args.backend is not None:
+        settings['backend'] = args.backend
+    records = run_batch(cel_files, args.output_dir, args.clean_image_dir,
+                        args.noisy_image_dir, args.msa_prm, args.wav_prm,
+                        settings=settings, jobs=args.jobs, threads=args.threads,
+                        scratch_root=args.scratch, retry_failed=args.retry_failed,
+                        slice_cache_dir=args.slice_cache,
+                        slice_cache_budget=args.slice_cache_budget,
+                        series_container=args.series_container,
+                        container_wave_dtype=args.container_wave_dtype)
+    failed = [record['structure'] for record in records if record['status'] == 'failed']
+    if failed:
+        print(f'{len(failed)} structures failed: ' + ', '.join(failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Parallel .cif to .cel batch converter.
+
+This is a cross-platform replacement for 'Convert cif to cel.bat', which
+runs BuildCell into a temporary cel_temp directory, CellMuncher
+--rotate-non-periodic on every file and then deletes the temporary
+directory. Here each .cif file is parsed, expanded to its full unit cell,
+optionally rotated in memory and written straight to a Dr. Probe .cel file
+with the same name, without intermediate files or external programs.
+
+The rotation follows --rotate-non-periodic: the atoms are rotated about the
+given axis through the cell center by the given angle, without periodic
+images, and atoms that end up outside the cell are left out. An angle of 0
+(the default) converts without rotation. The isotropic displacement
+parameters of the .cif file (_atom_site_B_iso_or_equiv or
+_atom_site_U_iso_or_equiv, in A^2) are written as the .cel B factors (nm^2);
+sites without one get B = 0.
+
+Directories are converted on a process pool. The hash of the .cif contents
+and the rotation of every converted file is recorded in
+cif_to_cel_hashes.json in the output directory, which is saved every
+SAVE_INTERVAL conversions and at the end, so an interrupted run keeps what it
+has converted. Outputs that are already up to date are skipped, either when
+the .cel file is newer than the .cif file and was written with the same
+rotation ('mtime', the default; otherwise the hash decides) or when the hash
+matches the recorded one ('hash').
+
+Usage:
+    python cif_to_cel.py CIF_DIR CEL_DIR [--axis 0 0 1 --angle 0]
+        [--jobs N] [--check mtime|hash] [--force]
+
+The 'numpy' and 'pymatgen' packages are required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import numpy_multislice as nms
+from tilt_series import rotation_matrices
+
+HASH_FILE = 'cif_to_cel_hashes.json'
+
+## Number of conversions between saves of the hash file
+SAVE_INTERVAL = 100
+
+
+def _cif_float(value):
+    """Float of a .cif number, without its standard uncertainty, e.g. '0.45(2)'."""
+    return float(re.sub(r'\(.*\)', '', value))
+
+
+def site_b_factors(cif_block):
+    """{atom site label: B in nm^2} from the B_iso or U_iso column of a .cif data block."""
+    labels = cif_block.get('_atom_site_label', [])
+    for key, factor in (('_atom_site_B_iso_or_equiv', 1.0),
+                        ('_atom_site_U_iso_or_equiv', 8 * np.pi**2)):
+        if key in cif_block:
+            values = {}
+            for label, value in zip(labels, cif_block[key]):
+                # '?' and '.' mark unknown values
+                if value not in ('?', '.'):
+                    values[label] = factor * _cif_float(value) / 100
+            return values
+    return {}
+
+
+def cif_to_cel_structure(cif_file, axis=(0, 0, 1), angle=0.0):
+    """Read a .cif file with pymatgen and return its (rotated) unit cell as a CelStructure."""
+    from pymatgen.io.cif import CifParser
+    parser = CifParser(cif_file)
+    structure = parser.parse_structures(primitive=False)[0]
+    b_factors = site_b_factors(next(iter(parser.as_dict().values())))
+    lattice = structure.lattice
+    symbols, coords, occupancy, biso = [], [], [], []
+    # Partially occupied sites become one .cel entry per species
+    for site in structure:
+        for species, occ in site.species.items():
+            symbols.append(species.symbol)
+            coords.append(site.coords)
+            occupancy.append(occ)
+            biso.append(b_factors.get(getattr(site, 'label', None), 0.0))
+    coords = np.array(coords).reshape(-1, 3)
+    symbols = np.array(symbols)
+    occupancy = np.array(occupancy, dtype=float)
+    biso = np.array(biso, dtype=float)
+    frac = lattice.get_fractional_coords(coords)
+    if angle:
+        if not np.any(axis):
+            raise ValueError('A rotation needs a non-zero axis')
+        center = 0.5 * np.array(lattice.matrix).sum(axis=0)
+        rotation = rotation_matrices(axis, [angle])[0]
+        frac = lattice.get_fractional_coords((coords - center) @ rotation.T + center)
+        inside = np.all((frac >= 0) & (frac < 1), axis=1)
+        if not inside.all():
+            print(f'{os.path.basename(cif_file)}: {np.sum(~inside)} atoms rotated out of the cell were left out')
+        frac, symbols = frac[inside], symbols[inside]
+        occupancy, biso = occupancy[inside], biso[inside]
+    # .cel cells are in nm
+    cell = tuple(np.array(lattice.abc) / 10) + tuple(lattice.angles)
+    name = os.path.splitext(os.path.basename(cif_file))[0]
+    return nms.CelStructure(name, cell, list(symbols), frac, occupancy, biso)
+
+
+def conversion_hash(cif_file, axis, angle):
+    """Hash of the .cif contents and the rotation applied to it."""
+    digest = hashlib.sha256()
+    with open(cif_file, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps([list(map(float, axis)), float(angle)]).encode())
+    return digest.hexdigest()
+
+
+def cel_name(cif_file, cel_directory):
+    return os.path.join(cel_directory, os.path.splitext(os.path.basename(cif_file))[0] + '.cel')
+
+
+def rotation_record(axis, angle):
+    return {'axis': list(map(float, axis)), 'angle': float(angle)}
+
+
+def is_up_to_date(cif_file, cel_file, check, hashes, axis, angle):
+    """
+    Whether cel_file is current. The 'mtime' check trusts a newer .cel file
+    only if it was written with the same rotation, and otherwise compares hashes.
+    """
+    if not os.path.isfile(cel_file):
+        return False
+    record = hashes.get(os.path.basename(cif_file))
+    if record is None:
+        return False
+    if (check == 'mtime' and record['rotation'] == rotation_record(axis, angle)
+            and os.path.getmtime(cel_file) >= os.path.getmtime(cif_file)):
+        return True
+    return record['hash'] == conversion_hash(cif_file, axis, angle)
+
+
+def convert_file(cif_file, cel_directory, axis=(0, 0, 1), angle=0.0):
+    """Convert one file; returns (cif base name, hash file record)."""
+    cel_file = cel_name(cif_file, cel_directory)
+    nms.write_cel(cel_file, cif_to_cel_structure(cif_file, axis, angle))
+    return os.path.basename(cif_file), {'hash': conversion_hash(cif_file, axis, angle),
+                                        'rotation': rotation_record(axis, angle)}
+
+
+def save_hashes(hash_path, hashes):
+    """Write the hash file through a temporary file, so it is never left half written."""
+    with open(hash_path + '.tmp', 'w') as f:
+        json.dump(hashes, f, indent=0, sort_keys=True)
+    os.replace(hash_path + '.tmp', hash_path)
+
+
+def convert_directory(cif_directory, cel_directory, axis=(0, 0, 1), angle=0.0,
+                      jobs=None, check='mtime', force=False):
+    """
+    Convert every .cif file of cif_directory that is not up to date.
+    Returns (converted files, skipped files, {file: error message}).
+    """
+    os.makedirs(cel_directory, exist_ok=True)
+    hash_path = os.path.join(cel_directory, HASH_FILE)
+    hashes = {}
+    if os.path.isfile(hash_path):
+        with open(hash_path, 'r') as f:
+            hashes = json.load(f)
+    cif_files = sorted(glob.glob(os.path.join(cif_directory, '*.cif')))
+    todo = [cif_file for cif_file in cif_files if force or not is_up_to_date(
+        cif_file, cel_name(cif_file, cel_directory), check, hashes, axis, angle)]
+    todo_set = set(todo)
+    skipped = [cif_file for cif_file in cif_files if cif_file not in todo_set]
+
+    converted, errors = [], {}
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(convert_file, cif_file, cel_directory, axis, angle): cif_file
+                       for cif_file in todo}
+            for future in as_completed(futures):
+                cif_file = futures[future]
+                try:
+                    name, record = future.result()
+                    hashes[name] = record
+                    converted.append(cif_file)
+                except Exception as e:
+                    errors[cif_file] = f'{type(e).__name__}: {e}'
+                    continue
+                if len(converted) % SAVE_INTERVAL == 0:
+                    save_hashes(hash_path, hashes)
+    finally:
+        save_hashes(hash_path, hashes)
+    return sorted(converted), skipped, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a directory of .cif files to .cel files.')
+    parser.add_argument('cif_directory', help='Directory containing the .cif files')
+    parser.add_argument('cel_directory', help='Directory where the .cel files are saved')
+    parser.add_argument('--axis', type=float, nargs=3, default=(0, 0, 1),
+                        help='Rotation axis (x y z)')
+    parser.add_argument('--angle', type=float, default=0.0, help='Rotation angle in degrees')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--check', choices=['mtime', 'hash'], default='mtime',
+                        help='How to decide that an existing .cel file is up to date '
+                             '(mtime falls back to the hash when the rotation changed)')
+    parser.add_argument('--force', action='store_true', help='Convert all files again')
+    args = parser.parse_args()
+
+    converted, skipped, errors = convert_directory(args.cif_directory, args.cel_directory,
+                                                   args.axis, args.angle, args.jobs,
+                                                   args.check, args.force)
+    print(f'{len(converted)} converted, {len(skipped)} up to date, {len(errors)} failed')
+    for cif_file, error in errors.items():
+        print(f'{cif_file}: {error}')
+
+
+if __name__ == '__main__':
+    main()
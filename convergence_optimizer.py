@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Sampling and slice-thickness convergence search.
+
+nx, ny and nz are normally fixed guesses (512 x 512 pixels, 300 slices).
+This tool simulates a representative .cel file with the NumPy engine
+(numpy_multislice.py) at a series of pixel sizes and slice counts and
+returns the cheapest (nx, ny, nz) whose image stays within a tolerance of a
+finely sampled reference:
+
+    1. reference at the finest nx and nz of the candidate lists
+    2. sampling: nx increases from coarse to fine at the finest nz, until the
+       image error is below half the tolerance
+    3. slices: nz increases from coarse to fine at that nx, until the image
+       error against the reference is below the tolerance
+
+Images are compared on the grid of the finer setting, with the
+contrast-normalized RMS error of numpy_multislice.compare_images: the
+coarser images are Fourier upsampled to it and compared with the full band
+of the finer images, so detail the coarse sampling cannot represent, and
+intensity it aliases, count as error. ny follows nx so that the pixels stay
+square. Every (nx, nz) is simulated at most once, and the finest-nz run of
+the sampling search doubles as the slice-search reference for that nx. Only
+whole runs are reused: the slices of one nz cannot be reused for another,
+because the slice boundaries differ.
+
+The run time of every setting is measured and a cost model
+t = k * nz * nx * ny * log2(nx * ny) is fitted to predict the run time per
+structure ('predicted_seconds_numpy'). The model is fitted to NumPy engine
+runs only and does not predict Dr. Probe run times. The result is written
+to a JSON file; pass it as sampling_file to the time-series script (or the
+'sampling_file' setting of multislice_pipeline.py, see
+multislice_pipeline.read_sampling) to use the values automatically.
+
+Usage:
+    python convergence_optimizer.py CEL_FILE sampling.json [--tolerance 0.02]
+        [--sizes 128 256 512 1024] [--slices 50 100 200 300 400]
+        [--defocus 8] [--wav-prm WavPrm.prm] [--current 512 512 300]
+
+Without --wav-prm, the imaging settings (focal spread, convergence,
+vibration, Cs and C5) of section 1.3 of the time-series script are used.
+
+The 'numpy' package is required; 'drprobe' is needed to read --wav-prm.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import argparse
+import json
+import os
+import time
+import numpy as np
+import numpy_multislice as nms
+from defocus_series import image_series
+
+## Default candidate image sizes (nx) and slice counts
+DEFAULT_SIZES = [128, 192, 256, 384, 512, 768, 1024]
+DEFAULT_SLICES = [25, 50, 100, 150, 200, 300, 400]
+
+
+def fourier_resample(image, nx, ny):
+    """Resample an image to (ny, nx) pixels by cropping or padding its spectrum."""
+    old_ny, old_nx = image.shape[-2:]
+    spectrum = np.fft.fftshift(np.fft.fft2(image), axes=(-2, -1))
+    resampled = np.zeros(image.shape[:-2] + (ny, nx), dtype=complex)
+    cy, cx = min(ny, old_ny), min(nx, old_nx)
+    # Centered windows of the shared frequencies
+    src_y, src_x = old_ny//2 - cy//2, old_nx//2 - cx//2
+    dst_y, dst_x = ny//2 - cy//2, nx//2 - cx//2
+    resampled[..., dst_y:dst_y + cy, dst_x:dst_x + cx] = spectrum[..., src_y:src_y + cy,
+                                                                   src_x:src_x + cx]
+    resampled = np.fft.ifft2(np.fft.ifftshift(resampled, axes=(-2, -1)))
+    return resampled.real * (nx * ny) / (old_nx * old_ny)
+
+
+def matching_ny(structure, nx):
+    """ny giving square pixels for a given nx (rounded to an even number)."""
+    a, b = structure.cell[0], structure.cell[1]
+    return max(2, int(2 * round(nx * b / a / 2)))
+
+
+def cost_units(nx, ny, nz):
+    """Relative cost of a multislice run, nz FFTs of nx * ny pixels."""
+    n_pixels = nx * ny
+    return nz * n_pixels * np.log2(n_pixels)
+
+
+class ConvergenceSearch:
+    """
+    Simulates a structure at (nx, nz) settings on demand, caching every run.
+
+    imaging holds keyword arguments of defocus_series.image_series (e.g. from
+    numpy_multislice.wavimg_settings); the sampling is replaced for every nx.
+    """
+
+    def __init__(self, structure, ht=300, defoci=(0,), imaging=None, absorb=True,
+                 dwf=True, buni=None, tilt=(0, 0)):
+        self.structure = structure
+        self.ht = ht
+        self.defoci = list(defoci)
+        self.imaging = dict(imaging or {})
+        self.imaging.setdefault('aberrations', {})
+        self.imaging['ht'] = ht
+        self.options = dict(absorb=absorb, dwf=dwf, buni=buni, tilt=tilt)
+        self.runs = {}
+
+    def images(self, nx, nz):
+        """Defocus series of the structure at (nx, nz), simulated once."""
+        if (nx, nz) not in self.runs:
+            ny = matching_ny(self.structure, nx)
+            a, b = self.structure.cell[0], self.structure.cell[1]
+            start = time.perf_counter()
+            wave = nms.exit_wave(self.structure, self.ht, nx, ny, nz, **self.options)
+            images = image_series(wave, self.defoci, **dict(self.imaging, sampling=(a/nx, b/ny)))
+            self.runs[(nx, nz)] = {'images': images, 'seconds': time.perf_counter() - start,
+                                   'ny': ny}
+        return self.runs[(nx, nz)]['images']
+
+    def error(self, nx, nz, reference):
+        """
+        Largest rms_error over the defoci of (nx, nz) against the (nx, nz) of
+        reference, on the grid of reference (which must be at least as fine).
+        """
+        reference_images = self.images(*reference)
+        ny, nx_reference = reference_images.shape[-2:]
+        images = fourier_resample(self.images(nx, nz), nx_reference, ny)
+        return max(nms.compare_images(image, reference_image)['rms_error']
+                   for image, reference_image in zip(images, reference_images))
+
+    def cost_model(self):
+        """Seconds per cost unit, fitted by least squares to the timed runs."""
+        units = np.array([cost_units(nx, run['ny'], nz) for (nx, nz), run in self.runs.items()])
+        seconds = np.array([run['seconds'] for run in self.runs.values()])
+        return float(units @ seconds / (units @ units))
+
+    def predicted_seconds(self, nx, ny, nz):
+        return self.cost_model() * cost_units(nx, ny, nz)
+
+
+def find_sampling(structure, tolerance=0.02, sizes=DEFAULT_SIZES, slices=DEFAULT_SLICES,
+                  ht=300, defoci=(0,), imaging=None, absorb=True, dwf=True, buni=None,
+                  tilt=(0, 0), current=None):
+    """
+    Cheapest (nx, ny, nz) of the candidate lists whose images stay within
+    tolerance of the finest setting. current is an optional (nx, ny, nz)
+    whose predicted run time is reported for comparison. Run times are
+    predicted for the NumPy engine. Returns the result dictionary that
+    write_sampling() saves.
+    """
+    sizes, slices = sorted(sizes), sorted(slices)
+    search = ConvergenceSearch(structure, ht, defoci, imaging, absorb, dwf, buni, tilt)
+    reference = (sizes[-1], slices[-1])
+    evaluations = []
+
+    def evaluate(nx, nz, against, limit):
+        error = search.error(nx, nz, against)
+        evaluations.append({'nx': nx, 'ny': matching_ny(structure, nx), 'nz': nz,
+                            'against': list(against), 'error': error,
+                            'seconds': search.runs[(nx, nz)]['seconds']})
+        print(f'nx {nx:5d}, nz {nz:4d}: error {error:.4f} (limit {limit:.4f})')
+        return error <= limit
+
+    # Sampling at the finest slicing, with half of the error budget
+    nx = next((nx for nx in sizes[:-1]
+               if evaluate(nx, slices[-1], reference, tolerance / 2)), sizes[-1])
+    # Slicing at that sampling, against its own finest slicing first (cheap), then the reference
+    nz = slices[-1]
+    for candidate in slices[:-1]:
+        if (evaluate(nx, candidate, (nx, slices[-1]), tolerance / 2)
+                and evaluate(nx, candidate, reference, tolerance)):
+            nz = candidate
+            break
+    error = search.error(nx, nz, reference) if (nx, nz) != reference else 0.0
+    ny = matching_ny(structure, nx)
+    result = {'nx': nx, 'ny': ny, 'nz': nz, 'error': error, 'tolerance': tolerance,
+              'converged': error <= tolerance and (nx, nz) != reference,
+              'predicted_seconds_numpy': search.predicted_seconds(nx, ny, nz),
+              'measured_seconds': search.runs[(nx, nz)]['seconds'],
+              'reference': {'nx': reference[0], 'ny': matching_ny(structure, reference[0]),
+                            'nz': reference[1]},
+              'ht': ht, 'defoci': list(defoci), 'cell': list(structure.cell),
+              'n_atoms': len(structure.symbols), 'evaluations': evaluations}
+    if current is not None:
+        result['current'] = {'nx': current[0], 'ny': current[1], 'nz': current[2],
+                             'predicted_seconds_numpy': search.predicted_seconds(*current)}
+    return result
+
+
+def write_sampling(json_file, result):
+    """Save a find_sampling() result; multislice_pipeline.read_sampling() reads it back."""
+    with open(json_file, 'w') as f:
+        json.dump(result, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the cheapest converged nx, ny and nz.')
+    parser.add_argument('cel_file', help='Representative .cel file')
+    parser.add_argument('output', help='.json file the chosen sampling is written to')
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help='Allowed contrast-normalized RMS image error')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Candidate nx values (ny follows for square pixels)')
+    parser.add_argument('--slices', type=int, nargs='+', default=DEFAULT_SLICES,
+                        help='Candidate nz values')
+    parser.add_argument('--ht', type=float, default=300)
+    parser.add_argument('--buni', type=float, default=0.005)
+    parser.add_argument('--defocus', type=float, nargs='+', default=[8.0])
+    parser.add_argument('--wav-prm', help='WavImg parameter file with the imaging settings (needs drprobe)')
+    parser.add_argument('--current', type=int, nargs=3, default=None,
+                        help='nx ny nz of the current settings, for comparison')
+    args = parser.parse_args()
+
+    structure = nms.read_cel(args.cel_file)
+    if args.wav_prm:
+        import drprobe as drp
+        wav_prm = drp.wavimgprm.WavimgPrm()
+        wav_prm.load_wav_prm(args.wav_prm)
+    else:
+        # Imaging settings of section 1.3 of the time-series script
+        from pipeline_benchmark import benchmark_parameters
+        wav_prm = benchmark_parameters(structure.cell, 1, 1, 1, args.ht, backend='numpy')[1]
+    imaging = nms.wavimg_settings(wav_prm)
+    imaging.pop('sampling')
+    result = find_sampling(structure, args.tolerance, args.sizes, args.slices, args.ht,
+                           args.defocus, imaging, buni=args.buni, current=args.current)
+    result['cel_file'] = os.path.abspath(args.cel_file)
+    write_sampling(args.output, result)
+    print(f"Cheapest setting: nx = {result['nx']}, ny = {result['ny']}, nz = {result['nz']} "
+          f"(error {result['error']:.4f}, predicted {result['predicted_seconds_numpy']:.1f} s "
+          'per structure with the NumPy engine; Dr. Probe run times are not predicted)')
+    if not result['converged']:
+        print('WARNING: no candidate coarser than the reference met the tolerance')
+    if 'current' in result:
+        print(f"Current setting: predicted {result['current']['predicted_seconds_numpy']:.1f} s "
+              'per structure with the NumPy engine')
+
+
+if __name__ == '__main__':
+    main()
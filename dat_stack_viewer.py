@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Memory-mapped reader and batch viewer for .dat images from Dr. Probe.
+
+A time series leaves thousands of raw float32 .dat images in the img
+sub-directories of the output directory. DatStack presents a whole directory
+tree of them as one lazy (frame, ny, nx) stack: every frame is a
+numpy.memmap that is only opened when it is accessed, so nothing is read
+until pixels are actually needed.
+
+The image dimensions are taken from the matching WavImg parameter file if
+one is given (needs the 'drprobe' package), otherwise from the _NXxNY_ part
+of the file names written by the simulation scripts, and finally from the
+file size for square images.
+
+Montages are built from strided (every factor-th row and column) views of
+the memmaps, and the per-frame statistics are accumulated a block of rows at
+a time, so neither loads a full series into memory.
+
+Usage:
+    python dat_stack_viewer.py OUTPUT_DIR [--factor 8] [--columns 10]
+        [--stats stats.csv] [--save montage.png] [--prm WavPrm.prm]
+
+The 'numpy' package is required; 'matplotlib' is needed for plotting.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import argparse
+import csv
+import os
+import re
+import numpy as np
+
+## Rows read at once when computing frame statistics
+STATISTICS_BLOCK_ROWS = 256
+
+
+def infer_dimensions(dat_file, prm_file=None):
+    """(nx, ny) of a .dat image from a WavImg .prm file, the file name or the file size."""
+    if prm_file is not None:
+        import drprobe as drp
+        wav_prm = drp.wavimgprm.WavimgPrm()
+        wav_prm.load_wav_prm(prm_file)
+        return tuple(int(n) for n in wav_prm.output_dim)
+    n_pixels = os.path.getsize(dat_file) // np.dtype(np.float32).itemsize
+    for nx, ny in re.findall(r'_(\d+)x(\d+)_', os.path.basename(dat_file)):
+        if int(nx) * int(ny) == n_pixels:
+            return int(nx), int(ny)
+    side = int(round(np.sqrt(n_pixels)))
+    if side * side != n_pixels:
+        raise ValueError(f'Cannot infer the dimensions of {dat_file}; pass a .prm file')
+    return side, side
+
+
+def find_dat_files(root):
+    """All .dat files below root, sorted by path."""
+    dat_files = []
+    for directory, dirs, files in os.walk(root):
+        dat_files.extend(os.path.join(directory, name) for name in files
+                         if name.lower().endswith('.dat'))
+    return sorted(dat_files)
+
+
+class DatStack:
+    """
+    Lazy (frame, ny, nx) stack of .dat images of equal size.
+
+    stack[i] returns a read-only numpy.memmap of frame i; stack[i:j] and
+    stack[[i, j, ...]] return the frames as a loaded array.
+    """
+
+    def __init__(self, dat_files, nx=None, ny=None, prm_file=None):
+        self.files = list(dat_files)
+        if not self.files:
+            raise ValueError('No .dat files given')
+        if nx is None or ny is None:
+            nx, ny = infer_dimensions(self.files[0], prm_file)
+        self.nx, self.ny = nx, ny
+        self.shape = (len(self.files), ny, nx)
+
+    @classmethod
+    def from_directory(cls, root, **kwargs):
+        return cls(find_dat_files(root), **kwargs)
+
+    def __len__(self):
+        return len(self.files)
+
+    def frame(self, index):
+        return np.memmap(self.files[index], dtype=np.float32, mode='r',
+                         shape=(self.ny, self.nx))
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.frame(index)
+        indices = range(len(self))[index] if isinstance(index, slice) else index
+        return np.stack([np.asarray(self.frame(i)) for i in indices])
+
+    def thumbnail(self, index, factor=8):
+        """Every factor-th row and column of a frame; only those rows are read."""
+        return np.array(self.frame(index)[::factor, ::factor])
+
+    def montage(self, indices=None, factor=8, columns=10, fill=np.nan):
+        """Downsampled frames tiled into one 2-D array, row by row."""
+        indices = range(len(self)) if indices is None else list(indices)
+        thumbs_ny = -(-self.ny // factor)
+        thumbs_nx = -(-self.nx // factor)
+        rows = -(-len(indices) // columns)
+        montage = np.full((rows * thumbs_ny, columns * thumbs_nx), fill, dtype=np.float32)
+        for n, index in enumerate(indices):
+            row, column = divmod(n, columns)
+            montage[row*thumbs_ny:(row + 1)*thumbs_ny,
+                    column*thumbs_nx:(column + 1)*thumbs_nx] = self.thumbnail(index, factor)
+        return montage
+
+    def frame_statistics(self, index):
+        """Mean, standard deviation, contrast (std/mean), min and max of one frame."""
+        frame = self.frame(index)
+        total = total_sq = 0.0
+        minimum, maximum = np.inf, -np.inf
+        for start in range(0, self.ny, STATISTICS_BLOCK_ROWS):
+            block = np.asarray(frame[start:start + STATISTICS_BLOCK_ROWS], dtype=np.float64)
+            total += block.sum()
+            total_sq += np.square(block).sum()
+            minimum, maximum = min(minimum, block.min()), max(maximum, block.max())
+        n_pixels = self.nx * self.ny
+        mean = total / n_pixels
+        std = np.sqrt(max(total_sq / n_pixels - mean**2, 0.0))
+        return {'file': self.files[index], 'mean': mean, 'std': std,
+                'contrast': std / mean if mean else np.nan, 'min': minimum, 'max': maximum}
+
+    def statistics(self):
+        """frame_statistics() of every frame."""
+        return [self.frame_statistics(index) for index in range(len(self))]
+
+
+def write_statistics(statistics, csv_file):
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['file', 'mean', 'std', 'contrast', 'min', 'max'])
+        writer.writeheader()
+        writer.writerows(statistics)
+
+
+def show_montage(stack, factor=8, columns=10, vmin=None, vmax=None, save_file=None):
+    """Plot a montage of the whole stack, optionally saving it to an image file."""
+    import matplotlib.pyplot as plt
+    montage = stack.montage(factor=factor, columns=columns)
+    fig, ax = plt.subplots(figsize=(12, 12 * montage.shape[0] / montage.shape[1]))
+    ax.imshow(montage, cmap='gray', vmin=vmin, vmax=vmax)
+    ax.set_axis_off()
+    if save_file is not None:
+        fig.savefig(save_file, dpi=150, bbox_inches='tight')
+    else:
+        plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='View a directory tree of .dat images.')
+    parser.add_argument('root', help='Directory containing .dat files (searched recursively)')
+    parser.add_argument('--prm', help='WavImg parameter file giving the image dimensions')
+    parser.add_argument('--factor', type=int, default=8, help='Downsampling factor of the montage')
+    parser.add_argument('--columns', type=int, default=10, help='Frames per montage row')
+    parser.add_argument('--vmin', type=float, default=None)
+    parser.add_argument('--vmax', type=float, default=None)
+    parser.add_argument('--stats', help='Write per-frame statistics to this .csv file')
+    parser.add_argument('--save', help='Save the montage to this image file instead of showing it')
+    args = parser.parse_args()
+
+    stack = DatStack.from_directory(args.root, prm_file=args.prm)
+    print(f'{len(stack)} frames of {stack.nx} x {stack.ny} pixels')
+    if args.stats:
+        write_statistics(stack.statistics(), args.stats)
+    show_montage(stack, args.factor, args.columns, args.vmin, args.vmax, args.save)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Vectorized defocus and aberration series from a single exit wave.
+
+Instead of calling wavimg once per defocus value (which re-reads the .wav
+file and writes and re-reads a .dat file every time), the exit wave is
+loaded and Fourier transformed once and the partially coherent transfer
+function is evaluated for a whole grid of defocus values, and optionally Cs
+and C5 values, as batched array operations. The focal spread, beam
+convergence, vibration and objective aperture settings are taken from a
+drprobe WavimgPrm object (see numpy_multislice.wavimg_settings), with the
+quasi-coherent approximation noted in numpy_multislice.py.
+
+The 'numpy' package is required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import itertools
+import numpy as np
+import numpy_multislice as nms
+
+
+def image_series(wave, defoci, sampling, ht, aberrations, cs_values=None,
+                 c5_values=None, focus_spread=0.0, convergence=0.0,
+                 vibration=(0.0, 0.0, 0.0), oa_radius=None, chunk_size=8):
+    """
+    Images of one exit wave for a grid of defocus (and optionally Cs and C5) values.
+
+    Returns a float32 array of shape (n_defocus, ny, nx). If cs_values or
+    c5_values are given, the shape is (n_c5, n_cs, n_defocus, ny, nx), where a
+    missing list falls back to the value in aberrations. All values are in nm.
+    chunk_size settings are evaluated per batched FFT, which bounds the
+    temporary memory to a few complex arrays per setting.
+    """
+    ny, nx = wave.shape[-2:]
+    defaults = nms.round_aberrations(aberrations)
+    cs_list = [defaults['c3']] if cs_values is None else list(cs_values)
+    c5_list = [defaults['c5']] if c5_values is None else list(c5_values)
+    grid = np.array(list(itertools.product(c5_list, cs_list, defoci)), dtype=float)
+    wave_ft = nms.fft2(wave)
+    images = np.empty((len(grid), ny, nx), dtype=np.float32)
+    for start in range(0, len(grid), chunk_size):
+        c5, c3, c1 = grid[start:start + chunk_size].T
+        images[start:start + chunk_size] = nms.images_from_spectrum(
+            wave_ft, sampling, ht, c1, c3, c5, focus_spread, convergence,
+            vibration, oa_radius)
+    if cs_values is None and c5_values is None:
+        return images
+    return images.reshape((len(c5_list), len(cs_list), len(defoci), ny, nx))
+
+
+def image_series_from_wav(wav_file, defoci, wav_prm, **kwargs):
+    """
+    Defocus series of a .wav file written by msa, using the imaging settings
+    of a drprobe WavimgPrm object. Keyword arguments go to image_series().
+    """
+    nx, ny = wav_prm.wave_dim
+    wave = nms.read_wav(wav_file, nx, ny)
+    return image_series(wave, defoci, **nms.wavimg_settings(wav_prm), **kwargs)
+
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Region-of-interest and tiled (domain-decomposed) simulation of large supercells.
+
+Both modes run on the NumPy engine (numpy_multislice.py) and keep the pixel
+size of the full-cell calculation (a/nx, b/ny), so their results can be
+compared pixel by pixel with a full-cell reference.
+
+Region of interest: only a box around a chosen set of atoms (e.g. the
+particle on a large support) plus a padding margin is simulated. The box is
+treated as a periodic cell of its own; the padding keeps the artifacts of the
+cut-off support at the box edges away from the region of interest, and only
+the region itself is returned.
+
+Tiles: the full field of view is split into a grid of tiles. Every tile is
+simulated with an overlap margin on a separate process, and the tile cores
+are stitched into the full exit wave, which is then imaged as usual. The
+default overlap is the lateral spread of the wave over the specimen
+thickness (see spread_width), plus the walk-off of a tilted beam and the
+range of the atomic potentials. Without a reference, the seam error (the
+difference between each tile and its neighbours within the overlap)
+estimates the stitching error; a warning is issued when it exceeds
+SEAM_TOLERANCE.
+
+Both modes report the error against a full-cell reference run
+(numpy_multislice.compare_images) when one is requested. Cells are treated
+as orthogonal, as elsewhere in the NumPy engine.
+
+Usage:
+    python domain_decomposition.py roi CEL_FILE --nx 2048 --ny 2048 --nz 300
+        --species Pt --padding 1.0 [--reference]
+    python domain_decomposition.py tiles CEL_FILE --nx 4096 --ny 4096 --nz 300
+        --tiles 2 2 [--overlap 64] [--jobs 4] [--reference]
+
+The 'numpy' package is required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import argparse
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import numpy_multislice as nms
+from defocus_series import image_series
+
+try:
+    from scipy.fft import next_fast_len
+except ImportError:
+    next_fast_len = None
+
+## Lateral range (nm) of the band-limited projected potential of an atom,
+## added to the spread width for the default tile overlap
+POTENTIAL_RANGE = 0.5
+
+## Seam error above which simulate_tiled warns that the overlap is too small
+SEAM_TOLERANCE = 0.02
+
+
+def fast_size(n):
+    """Smallest FFT-friendly size >= n (even if scipy is missing)."""
+    if next_fast_len is not None:
+        return next_fast_len(int(n))
+    return int(n) + int(n) % 2
+
+
+def spread_width(structure, ht, nx, ny):
+    """
+    Lateral distance (nm) a wave component at the band limit travels through
+    the whole cell thickness, thickness * wavelength * q_max.
+    """
+    a, b, c = structure.cell[0:3]
+    q_max = nms.BANDWIDTH_LIMIT * min(nx / (2*a), ny / (2*b))
+    return c * nms.electron_wavelength(ht) * q_max
+
+
+def walk_off(structure, tilt=(0, 0)):
+    """Lateral distance (nm) a tilted beam moves through the cell thickness, c * tan(|tilt|)."""
+    return structure.cell[2] * np.tan(np.radians(np.hypot(*tilt)))
+
+
+def default_overlap(structure, ht, nx, ny, tilt=(0, 0)):
+    """Tile overlap (pixels) covering the spread width, the beam walk-off and POTENTIAL_RANGE."""
+    a, b = structure.cell[0], structure.cell[1]
+    width = spread_width(structure, ht, nx, ny) + walk_off(structure, tilt) + POTENTIAL_RANGE
+    return int(np.ceil(width / min(a/nx, b/ny)))
+
+
+def sub_structure(structure, ix0, iy0, nx_box, ny_box, nx, ny):
+    """
+    Atoms of a box of nx_box x ny_box pixels starting at pixel (ix0, iy0) of
+    the full (nx, ny) grid, as a CelStructure of the box size. The full cell
+    is periodic, so boxes may run over its edges.
+    """
+    a, b = structure.cell[0], structure.cell[1]
+    dx, dy = a / nx, b / ny
+    width, height = nx_box * dx, ny_box * dy
+    # Positions relative to the box origin, wrapped into the full cell
+    x = np.mod(structure.xyz[:, 0] * a - ix0 * dx, a)
+    y = np.mod(structure.xyz[:, 1] * b - iy0 * dy, b)
+    inside = (x < width) & (y < height)
+    xyz = np.column_stack([x[inside] / width, y[inside] / height, structure.xyz[inside, 2]])
+    return structure._replace(cell=(width, height) + tuple(structure.cell[2:]),
+                              symbols=list(np.asarray(structure.symbols)[inside]), xyz=xyz,
+                              occupancy=np.asarray(structure.occupancy)[inside],
+                              biso=np.asarray(structure.biso)[inside])
+
+
+def box_wave(structure, ix0, iy0, nx_box, ny_box, nx, ny, ht, nz, absorb=True,
+             dwf=True, buni=None, tilt=(0, 0), fft_workers=None):
+    """Exit wave (ny_box, nx_box) of a box of the full pixel grid."""
+    if fft_workers is not None:
+        nms.set_fft_workers(fft_workers)
+    box = sub_structure(structure, ix0, iy0, nx_box, ny_box, nx, ny)
+    return nms.exit_wave(box, ht, nx_box, ny_box, nz, absorb=absorb, dwf=dwf,
+                         buni=buni, tilt=tilt)
+
+
+def roi_window(structure, atom_mask, nx, ny, padding=1.0):
+    """
+    Pixel window of the region of interest and of the padded simulation box.
+
+    The region is the bounding box of the selected atoms; the simulation box
+    adds padding (nm) on every side and is rounded up to FFT-friendly sizes.
+    Returns (ix0, iy0, nx_box, ny_box) of the box and the (x, y) slices of
+    the region inside the box.
+    """
+    a, b = structure.cell[0], structure.cell[1]
+    dx, dy = a / nx, b / ny
+    xy = structure.xyz[np.asarray(atom_mask), 0:2] * [a, b]
+    if len(xy) == 0:
+        raise ValueError('No atoms selected for the region of interest')
+    x_min, y_min = xy.min(axis=0)
+    x_max, y_max = xy.max(axis=0)
+    roi_x0, roi_x1 = int(np.floor(x_min / dx)), int(np.ceil(x_max / dx)) + 1
+    roi_y0, roi_y1 = int(np.floor(y_min / dy)), int(np.ceil(y_max / dy)) + 1
+    pad_x, pad_y = int(np.ceil(padding / dx)), int(np.ceil(padding / dy))
+    nx_box = min(fast_size(roi_x1 - roi_x0 + 2*pad_x), nx)
+    ny_box = min(fast_size(roi_y1 - roi_y0 + 2*pad_y), ny)
+    ix0, x = _centred(roi_x0, roi_x1, nx_box, nx)
+    iy0, y = _centred(roi_y0, roi_y1, ny_box, ny)
+    return (ix0, iy0, nx_box, ny_box), (x, y)
+
+
+def _centred(roi_start, roi_stop, n_box, n):
+    """
+    Origin (0 <= origin < n) of a box of n_box pixels centred on a region of
+    the n-pixel cell, and the slice of the region inside the box. A box as
+    large as the cell starts at 0, and the region is clipped to the box.
+    """
+    span = min(roi_stop - roi_start, n_box)
+    if n_box >= n:
+        start = min(roi_start, n - span)
+        return 0, slice(start, start + span)
+    start = (n_box - span) // 2
+    return (roi_start - start) % n, slice(start, start + span)
+
+
+def full_pixels(full_array, ix0, iy0, nx_box, ny_box):
+    """The pixels of a box (which may wrap around the cell) from a full-cell array."""
+    ny, nx = full_array.shape[-2:]
+    rows = np.mod(np.arange(iy0, iy0 + ny_box), ny)
+    columns = np.mod(np.arange(ix0, ix0 + nx_box), nx)
+    return full_array[..., rows[:, None], columns[None, :]]
+
+
+def simulate_roi(structure, atom_mask, ht, nx, ny, nz, padding=1.0, absorb=True,
+                 dwf=True, buni=None, tilt=(0, 0), defoci=(0,), imaging=None,
+                 reference=False):
+    """
+    Simulate the padded region of interest around the atoms of atom_mask.
+
+    imaging holds keyword arguments of defocus_series.image_series (e.g. from
+    numpy_multislice.wavimg_settings); by default a coherent image at the
+    full-cell sampling is calculated. Returns a dictionary with the exit wave
+    and images of the region ('wave', 'images'), the box and region pixel
+    windows, the costs relative to the full cell and, with reference=True,
+    the errors of every image against a full-cell run ('errors').
+    """
+    box, region = roi_window(structure, atom_mask, nx, ny, padding)
+    ix0, iy0, nx_box, ny_box = box
+    kwargs = dict(ht=ht, nz=nz, absorb=absorb, dwf=dwf, buni=buni, tilt=tilt)
+    imaging = _imaging(structure, nx, ny, ht, imaging)
+
+    wave = box_wave(structure, ix0, iy0, nx_box, ny_box, nx, ny, **kwargs)
+    images = image_series(wave, list(defoci), **imaging)
+    x, y = region
+    result = {'box': box, 'region': ((x.start + ix0) % nx, (y.start + iy0) % ny,
+                                     x.stop - x.start, y.stop - y.start),
+              'wave': wave[y, x], 'images': images[:, y, x],
+              'pixel_fraction': nx_box * ny_box / (nx * ny)}
+    if reference:
+        full_wave = nms.exit_wave(structure, ht, nx, ny, nz, absorb=absorb, dwf=dwf,
+                                  buni=buni, tilt=tilt)
+        full_images = full_pixels(image_series(full_wave, list(defoci), **imaging),
+                                  ix0, iy0, nx_box, ny_box)[:, y, x]
+        result['errors'] = [nms.compare_images(image, full_image)
+                            for image, full_image in zip(result['images'], full_images)]
+    return result
+
+
+def tile_windows(nx, ny, tiles, overlap):
+    """
+    (ix0, iy0, nx_box, ny_box, core x slice, core y slice) of every tile,
+    where the box includes overlap pixels on every side and the core slices
+    index the box. The full grid must divide evenly into the tiles.
+    """
+    tiles_x, tiles_y = tiles
+    if nx % tiles_x or ny % tiles_y:
+        raise ValueError(f'{nx} x {ny} pixels cannot be split evenly into {tiles_x} x {tiles_y} tiles')
+    core_x, core_y = nx // tiles_x, ny // tiles_y
+    nx_box = min(fast_size(core_x + 2*overlap), nx)
+    ny_box = min(fast_size(core_y + 2*overlap), ny)
+    margin_x, margin_y = (nx_box - core_x) // 2, (ny_box - core_y) // 2
+    return [(i * core_x - margin_x, j * core_y - margin_y, nx_box, ny_box,
+             slice(margin_x, margin_x + core_x), slice(margin_y, margin_y + core_y))
+            for j in range(tiles_y) for i in range(tiles_x)]
+
+
+def stitch(tile_waves, windows, nx, ny):
+    """Full exit wave from the cores of the tile waves."""
+    wave = np.empty((ny, nx), dtype=np.complex64)
+    for tile_wave, (ix0, iy0, nx_box, ny_box, x, y) in zip(tile_waves, windows):
+        wave[iy0 + y.start:iy0 + y.stop, ix0 + x.start:ix0 + x.stop] = tile_wave[y, x]
+    return wave
+
+
+def seam_error(tile_waves, windows, wave):
+    """
+    Largest RMS difference, relative to the RMS wave amplitude, between a
+    tile and the stitched wave (i.e. its neighbours) within its overlap margin.
+    """
+    scale = np.sqrt(np.mean(np.abs(wave)**2))
+    errors = []
+    for tile_wave, (ix0, iy0, nx_box, ny_box, x, y) in zip(tile_waves, windows):
+        margin = np.ones((ny_box, nx_box), dtype=bool)
+        margin[y, x] = False
+        if not margin.any():
+            continue
+        difference = tile_wave - full_pixels(wave, ix0, iy0, nx_box, ny_box)
+        errors.append(np.sqrt(np.mean(np.abs(difference[margin])**2)) / scale)
+    return float(max(errors, default=0.0))
+
+
+def simulate_tiled(structure, ht, nx, ny, nz, tiles=(2, 2), overlap=None, absorb=True,
+                   dwf=True, buni=None, tilt=(0, 0), defoci=(0,), imaging=None,
+                   max_workers=None, fft_workers=1, reference=False,
+                   seam_tolerance=SEAM_TOLERANCE):
+    """
+    Simulate the full cell as overlapping tiles on a process pool.
+
+    overlap (pixels) defaults to default_overlap(): the spread width of the
+    wave over the cell thickness, the walk-off of a tilted beam and
+    POTENTIAL_RANGE. A RuntimeWarning is issued when the seam error exceeds
+    seam_tolerance; increase the overlap then. Returns a dictionary with the
+    stitched exit wave and images, the tile windows, the seam error and, with
+    reference=True, the errors of every image against a single full-cell run
+    ('errors').
+    """
+    if overlap is None:
+        overlap = default_overlap(structure, ht, nx, ny, tilt)
+    windows = tile_windows(nx, ny, tiles, overlap)
+    kwargs = dict(ht=ht, nz=nz, absorb=absorb, dwf=dwf, buni=buni, tilt=tilt,
+                  fft_workers=fft_workers)
+    imaging = _imaging(structure, nx, ny, ht, imaging)
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        futures = [pool.submit(box_wave, structure, ix0, iy0, nx_box, ny_box, nx, ny, **kwargs)
+                   for ix0, iy0, nx_box, ny_box, x, y in windows]
+        tile_waves = [future.result() for future in futures]
+    wave = stitch(tile_waves, windows, nx, ny)
+    result = {'wave': wave, 'images': image_series(wave, list(defoci), **imaging),
+              'windows': windows, 'overlap': overlap,
+              'seam_error': seam_error(tile_waves, windows, wave)}
+    del tile_waves
+    if result['seam_error'] > seam_tolerance:
+        warnings.warn(f"Seam error {result['seam_error']:.3f} exceeds {seam_tolerance} with "
+                      f'{overlap} pixels overlap; increase the overlap', RuntimeWarning)
+    if reference:
+        full_wave = nms.exit_wave(structure, ht, nx, ny, nz, absorb=absorb, dwf=dwf,
+                                  buni=buni, tilt=tilt)
+        full_images = image_series(full_wave, list(defoci), **imaging)
+        result['errors'] = [nms.compare_images(image, full_image)
+                            for image, full_image in zip(result['images'], full_images)]
+    return result
+
+
+def _imaging(structure, nx, ny, ht, imaging=None):
+    """Imaging keyword arguments, by default coherent and aberration-free at the full-cell sampling."""
+    imaging = dict(imaging or {})
+    imaging.setdefault('ht', ht)
+    imaging.setdefault('sampling', (structure.cell[0] / nx, structure.cell[1] / ny))
+    imaging.setdefault('aberrations', {})
+    return imaging
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Region-of-interest or tiled simulation of a .cel file.')
+    parser.add_argument('mode', choices=['roi', 'tiles'])
+    parser.add_argument('cel_file')
+    parser.add_argument('--nx', type=int, default=2048)
+    parser.add_argument('--ny', type=int, default=2048)
+    parser.add_argument('--nz', type=int, default=300)
+    parser.add_argument('--ht', type=float, default=300)
+    parser.add_argument('--buni', type=float, default=0.005)
+    parser.add_argument('--defocus', type=float, nargs='+', default=[0.0])
+    parser.add_argument('--wav-prm', help='WavImg parameter file with the imaging settings (needs drprobe)')
+    parser.add_argument('--species', default='Pt', help='Atoms defining the region of interest')
+    parser.add_argument('--padding', type=float, default=1.0, help='Padding around the region in nm')
+    parser.add_argument('--tiles', type=int, nargs=2, default=(2, 2))
+    parser.add_argument('--overlap', type=int, default=None, help='Tile overlap in pixels')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of tile processes')
+    parser.add_argument('--seam-tolerance', type=float, default=SEAM_TOLERANCE,
+                        help='Seam error above which a warning is issued')
+    parser.add_argument('--tilt', type=float, nargs=2, default=(0, 0), help='Beam tilt in degrees')
+    parser.add_argument('--reference', action='store_true',
+                        help='Also run the full cell and report the errors')
+    parser.add_argument('--output', help='Save the images of the first defocus to this .dat file')
+    args = parser.parse_args()
+
+    structure = nms.read_cel(args.cel_file)
+    imaging = None
+    if args.wav_prm:
+        import drprobe as drp
+        wav_prm = drp.wavimgprm.WavimgPrm()
+        wav_prm.load_wav_prm(args.wav_prm)
+        imaging = nms.wavimg_settings(wav_prm)
+        imaging['sampling'] = (structure.cell[0] / args.nx, structure.cell[1] / args.ny)
+    kwargs = dict(buni=args.buni, tilt=tuple(args.tilt), defoci=args.defocus, imaging=imaging,
+                  reference=args.reference)
+    if args.mode == 'roi':
+        atom_mask = np.array([nms.element(symbol) == args.species for symbol in structure.symbols])
+        result = simulate_roi(structure, atom_mask, args.ht, args.nx, args.ny, args.nz,
+                              padding=args.padding, **kwargs)
+        print(f"Region (x, y, width, height) {result['region']} in a box {result['box']}, "
+              f"{100 * result['pixel_fraction']:.1f}% of the full-cell pixels")
+    else:
+        result = simulate_tiled(structure, args.ht, args.nx, args.ny, args.nz, tuple(args.tiles),
+                                args.overlap, max_workers=args.jobs,
+                                seam_tolerance=args.seam_tolerance, **kwargs)
+        print(f"{len(result['windows'])} tiles with {result['overlap']} pixels overlap, "
+              f"seam error {result['seam_error']:.2e}")
+    for defocus, errors in zip(args.defocus, result.get('errors', [])):
+        print(f'Defocus {defocus} nm: {errors}')
+    if args.output:
+        nms.write_dat(args.output, result['images'][0])
+        print(f"Saved {os.path.basename(args.output)} ({result['images'].shape[-1]} x "
+              f"{result['images'].shape[-2]} pixels)")
+
+
+if __name__ == '__main__':
+    main()
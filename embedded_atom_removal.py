@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Spatial-index clash detection between a rotated particle and its support.
+
+Deleting every particle atom below a fixed fractional coordinate (b < 0.49)
+ignores the real shape of the support surface. Here a periodic KD-tree is
+built over the support atoms of every species, and a particle atom is
+flagged when it lies closer than a species-pair cutoff to any support atom,
+using periodic boundaries of the (orthogonal) supercell. Because the support
+does not move during a tilt series, the index is built once and the rotated
+particle coordinates of many orientations are checked against it in one
+batched query.
+
+Cutoffs are given in Angstrom as a dictionary keyed by (particle species,
+support species); pairs that are not listed use default_cutoff.
+
+The 'numpy' and 'scipy' packages are required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import numpy as np
+from scipy.spatial import cKDTree
+
+## Example overlap cutoffs in Angstrom for Pt on CeO2, shorter than the Pt-O and Pt-Ce bond lengths
+CEO2_PT_CUTOFFS = {('Pt', 'O'): 1.7, ('Pt', 'Ce'): 2.6}
+
+
+def pair_cutoff(cutoffs, particle_species, support_species, default_cutoff):
+    """Cutoff of a species pair, looked up in either order."""
+    if (particle_species, support_species) in cutoffs:
+        return cutoffs[(particle_species, support_species)]
+    return cutoffs.get((support_species, particle_species), default_cutoff)
+
+
+class SupportIndex:
+    """
+    Periodic KD-trees over the support atoms, one per support species.
+
+    support_species is a sequence of element symbols, support_coords the
+    Cartesian coordinates (n, 3) in Angstrom and box the (a, b, c) lengths of
+    the orthogonal supercell. periodic=False treats the cell as isolated.
+    """
+
+    def __init__(self, support_species, support_coords, box, cutoffs=None,
+                 default_cutoff=2.0, periodic=True):
+        self.box = np.asarray(box, dtype=float)
+        self.periodic = periodic
+        self.cutoffs = dict(cutoffs or {})
+        self.default_cutoff = default_cutoff
+        support_species = np.asarray(support_species)
+        support_coords = self.wrap(np.asarray(support_coords, dtype=float))
+        self.trees, self.indices = {}, {}
+        for species in np.unique(support_species):
+            members = np.flatnonzero(support_species == species)
+            self.indices[species] = members
+            self.trees[species] = cKDTree(support_coords[members],
+                                          boxsize=self.box if periodic else None)
+
+    @classmethod
+    def from_structure(cls, structure, particle_species='Pt', **kwargs):
+        """Index over all non-particle sites of an orthogonal pymatgen structure."""
+        if not np.allclose(structure.lattice.angles, 90):
+            raise ValueError('Periodic clash detection needs an orthogonal supercell')
+        species = np.array([site.specie.symbol for site in structure])
+        support = species != particle_species
+        return cls(species[support], structure.cart_coords[support],
+                   structure.lattice.abc, **kwargs)
+
+    def wrap(self, coords):
+        if not self.periodic:
+            return coords
+        # The tree needs coordinates in [0, box); mod can round up to box itself
+        return np.mod(coords, self.box) % self.box
+
+    def nearest(self, particle_species, particle_coords):
+        """
+        Distance to, and index of, the nearest support atom that is closer than
+        the pair cutoff, for every particle atom. particle_coords may carry
+        leading batch dimensions (..., n, 3), e.g. one row per orientation,
+        in which case particle_species has length n. Atoms without a clash get
+        distance inf and index -1.
+        """
+        particle_species = np.asarray(particle_species)
+        coords = self.wrap(np.asarray(particle_coords, dtype=float))
+        batch_shape = coords.shape[:-2]
+        coords = coords.reshape((-1,) + coords.shape[-2:])
+        distances = np.full(coords.shape[:2], np.inf)
+        nearest = np.full(coords.shape[:2], -1, dtype=int)
+        for species in np.unique(particle_species):
+            atoms = np.flatnonzero(particle_species == species)
+            points = coords[:, atoms].reshape(-1, 3)
+            for support_species, tree in self.trees.items():
+                cutoff = pair_cutoff(self.cutoffs, species, support_species, self.default_cutoff)
+                distance, index = tree.query(points, k=1, distance_upper_bound=cutoff)
+                distance = distance.reshape(len(coords), len(atoms))
+                index = index.reshape(len(coords), len(atoms))
+                closer = distance < distances[:, atoms]
+                block_distances = distances[:, atoms]
+                block_nearest = nearest[:, atoms]
+                block_distances[closer] = distance[closer]
+                block_nearest[closer] = self.indices[support_species][index[closer]]
+                distances[:, atoms], nearest[:, atoms] = block_distances, block_nearest
+        return (distances.reshape(batch_shape + distances.shape[1:]),
+                nearest.reshape(batch_shape + nearest.shape[1:]))
+
+    def clashes(self, particle_species, particle_coords):
+        """Boolean mask of particle atoms closer than their pair cutoff to the support."""
+        distances, _ = self.nearest(particle_species, particle_coords)
+        return np.isfinite(distances)
+
+    def report(self, particle_species, particle_coords):
+        """
+        List of (particle atom, species, nearest support atom, distance) of
+        every clash. Batched particle_coords (..., n, 3) give one such list per
+        configuration, nested like the batch dimensions.
+        """
+        distances, nearest = self.nearest(particle_species, particle_coords)
+        return _clash_report(np.asarray(particle_species), distances, nearest)
+
+
+def _clash_report(particle_species, distances, nearest):
+    if distances.ndim > 1:
+        return [_clash_report(particle_species, configuration_distances, configuration_nearest)
+                for configuration_distances, configuration_nearest in zip(distances, nearest)]
+    return [(int(atom), str(particle_species[atom]), int(nearest[atom]), float(distances[atom]))
+            for atom in np.flatnonzero(np.isfinite(distances))]
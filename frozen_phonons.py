@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Frozen-phonon averaging with streaming accumulation.
+
+Instead of damping the scattering factors of a single static structure with
+Debye-Waller factors, N configurations are generated in which every atom is
+displaced from its site by a random Gaussian offset with the mean square
+displacement of its B factor, sigma^2 = B / (8 pi^2) along each direction.
+Each configuration is simulated with the NumPy engine (numpy_multislice.py)
+without Debye-Waller damping, and the images and exit waves are averaged.
+
+Only running sums are kept (Welford's algorithm): the mean and variance of
+the exit wave and of the images of every defocus. At most max_workers
+configurations are simulated at the same time, so neither the N
+configurations nor their N wavefunctions are ever held in memory or written
+to disk. The averaged image contains the thermal diffuse scattering that the
+static Debye-Waller calculation leaves out.
+
+Configuration i of a structure always uses the same random displacements,
+whatever the number of workers, because its seed is spawned from a
+SeedSequence of the base seed and the structure name.
+
+The 'numpy' package is required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import numpy_multislice as nms
+from defocus_series import image_series
+
+
+def configuration_seeds(base_seed, structure_name, n_configurations):
+    """One independent SeedSequence per configuration of a structure."""
+    sequence = np.random.SeedSequence([base_seed, zlib.crc32(structure_name.encode())])
+    return sequence.spawn(n_configurations)
+
+
+def displacement_b_factors(structure, b_factors=None, buni=None):
+    """
+    Per-atom B factors (nm^2) of the displacements: from a {species: B}
+    dictionary, a uniform buni, or the B column of the .cel file, in that order.
+    """
+    if b_factors is not None:
+        return np.array([b_factors[symbol] for symbol in structure.symbols], dtype=float)
+    return nms.atom_b_factors(structure, dwf=True, buni=buni)
+
+
+def displaced_structure(structure, b_values, seed):
+    """Copy of a CelStructure with Gaussian displacements, sigma^2 = B / (8 pi^2) per direction."""
+    rng = np.random.default_rng(seed)
+    sigma = np.sqrt(b_values / (8 * np.pi**2))
+    displacement = rng.standard_normal((len(b_values), 3)) * sigma[:, None]
+    # The NumPy engine treats cells as orthogonal
+    xyz = structure.xyz + displacement / np.asarray(structure.cell[0:3], dtype=float)
+    return structure._replace(xyz=xyz)
+
+
+class FrozenPhononAccumulator:
+    """
+    Running mean and variance of exit waves and images (Welford's algorithm).
+
+    The wave variance is the mean of |psi - <psi>|^2, the image variance is
+    per pixel over the configurations.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean_wave = self.wave_m2 = None
+        self.mean_images = self.images_m2 = None
+
+    def update(self, wave, images=None):
+        self.count += 1
+        wave = np.asarray(wave, dtype=np.complex128)
+        if self.mean_wave is None:
+            self.mean_wave = np.zeros_like(wave)
+            self.wave_m2 = np.zeros(wave.shape)
+        delta = wave - self.mean_wave
+        self.mean_wave += delta / self.count
+        self.wave_m2 += (np.conj(delta) * (wave - self.mean_wave)).real
+        if images is not None:
+            images = np.asarray(images, dtype=np.float64)
+            if self.mean_images is None:
+                self.mean_images = np.zeros_like(images)
+                self.images_m2 = np.zeros_like(images)
+            delta = images - self.mean_images
+            self.mean_images += delta / self.count
+            self.images_m2 += delta * (images - self.mean_images)
+
+    @property
+    def wave_variance(self):
+        return self.wave_m2 / self.count
+
+    @property
+    def image_variance(self):
+        return self.images_m2 / self.count
+
+
+def frozen_phonon_average(structure, n_configurations, ht, nx, ny, nz, absorb=True,
+                          tilt=(0, 0), defoci=None, imaging=None, b_factors=None,
+                          buni=None, seed=0, structure_name=None, max_workers=2):
+    """
+    Average N frozen-phonon configurations of a CelStructure.
+
+    defoci and imaging (keyword arguments of defocus_series.image_series,
+    e.g. from numpy_multislice.wavimg_settings) are optional; without them
+    only the exit waves are accumulated. b_factors is an optional
+    {species: B in nm^2} dictionary, see displacement_b_factors.
+    Returns a FrozenPhononAccumulator.
+    """
+    structure_name = structure.title if structure_name is None else structure_name
+    b_values = displacement_b_factors(structure, b_factors, buni)
+    seeds = configuration_seeds(seed, structure_name, n_configurations)
+
+    def simulate(configuration_seed):
+        configuration = displaced_structure(structure, b_values, configuration_seed)
+        # The displacements replace the Debye-Waller damping
+        wave = nms.exit_wave(configuration, ht, nx, ny, nz, absorb=absorb, dwf=False,
+                             tilt=tilt)
+        images = None
+        if defoci is not None:
+            images = image_series(wave, defoci, **imaging)
+        return wave, images
+
+    accumulator = FrozenPhononAccumulator()
+    # The FFTs release the GIL; at most max_workers configurations are in flight,
+    # and they are accumulated in configuration order
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = deque()
+        for configuration_seed in seeds:
+            running.append(pool.submit(simulate, configuration_seed))
+            if len(running) >= max_workers:
+                accumulator.update(*running.popleft().result())
+        while running:
+            accumulator.update(*running.popleft().result())
+    return accumulator
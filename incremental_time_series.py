@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Per-slice incremental re-simulation for atom-hopping time series.
+
+Consecutive frames of an adatom-hopping series differ by only a few moved
+atoms, so most of the nz phase gratings of a frame are identical to those of
+the previous frame. IncrementalSimulator keeps the phase gratings of the last
+frame together with a fingerprint of the atoms in every slice. For each new
+frame only the slices whose atoms changed are rebuilt. The wavefunction
+entering every checkpoint_interval-th slice is also kept, so propagation
+restarts from the last checkpoint before the first changed slice instead of
+from the entrance surface. Slices below the first change still have to be
+propagated, but none of them has to be sliced again.
+
+This mode uses the NumPy backend (numpy_multislice.py); the Dr. Probe
+programs have no way to restart from an intermediate wavefunction with
+partially replaced slice files.
+
+The 'numpy' package is required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import hashlib
+import numpy as np
+import numpy_multislice as nms
+
+## Fractional coordinates are compared to this many decimals (the .cel precision)
+FINGERPRINT_DECIMALS = 6
+
+
+def slice_fingerprints(structure, nz, dwf=True, buni=None):
+    """Hash of the atoms (symbol, position, occupancy, B) in each of the nz slices."""
+    slices = nms.slice_indices(structure, nz)
+    b_factors = nms.atom_b_factors(structure, dwf, buni)
+    values = np.round(np.column_stack([np.mod(structure.xyz, 1.0),
+                                       structure.occupancy, b_factors]),
+                      FINGERPRINT_DECIMALS)
+    symbols = np.asarray([nms.element(symbol) for symbol in structure.symbols])
+    # Sort atoms within each slice so that the atom order in the file does not matter
+    order = np.lexsort(tuple(values.T[::-1]) + (symbols, slices))
+    bounds = np.searchsorted(slices[order], np.arange(nz + 1))
+    fingerprints = []
+    for islice in range(nz):
+        atoms = order[bounds[islice]:bounds[islice + 1]]
+        digest = hashlib.sha1(values[atoms].tobytes())
+        digest.update(' '.join(symbols[atoms]).encode())
+        fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+class IncrementalSimulator:
+    """
+    Exit-wave calculator that reuses phase gratings and intermediate
+    wavefunctions of the previously simulated frame.
+
+    Frames must share the cell dimensions; a change of cell triggers a full
+    simulation. grating_file optionally backs the stored phase gratings with a
+    memory-mapped .npy file instead of RAM (nz*ny*nx*8 bytes).
+    """
+
+    def __init__(self, ht, nx, ny, nz, absorb=True, dwf=True, buni=None,
+                 tilt=(0, 0), checkpoint_interval=10, grating_file=None):
+        self.ht, self.nx, self.ny, self.nz = ht, nx, ny, nz
+        self.absorb, self.dwf, self.buni, self.tilt = absorb, dwf, buni, tilt
+        self.checkpoint_interval = checkpoint_interval
+        if grating_file is None:
+            self.gratings = np.ones((nz, ny, nx), dtype=np.complex64)
+        else:
+            self.gratings = np.lib.format.open_memmap(grating_file, mode='w+',
+                                                      dtype=np.complex64,
+                                                      shape=(nz, ny, nx))
+        self.cell = None
+        self.fingerprints = None
+        self.checkpoints = {}
+        self.wave = None
+        self.last_changed = []
+
+    def changed_slices(self, structure):
+        """Slice indices whose atoms differ from the previous frame."""
+        fingerprints = slice_fingerprints(structure, self.nz, self.dwf, self.buni)
+        if self.cell != tuple(structure.cell) or self.fingerprints is None:
+            return list(range(self.nz)), fingerprints
+        changed = [islice for islice, (old, new)
+                   in enumerate(zip(self.fingerprints, fingerprints)) if old != new]
+        return changed, fingerprints
+
+    def simulate(self, structure):
+        """Exit wave of the next frame, recomputing only what changed."""
+        changed, fingerprints = self.changed_slices(structure)
+        self.last_changed = changed
+        if not changed:
+            return self.wave.copy()
+        a, b, c = structure.cell[0:3]
+        if self.cell != tuple(structure.cell):
+            self.kernel = nms.propagator(self.nx, self.ny, a, b, c/self.nz, self.ht, self.tilt)
+            self.checkpoints = {0: nms.plane_wave(self.nx, self.ny)}
+        self.gratings[changed] = nms.transmission_functions(structure, self.ht, self.nx,
+                                                            self.ny, self.nz, self.absorb,
+                                                            self.dwf, self.buni, changed)
+        # Restart from the last checkpoint that lies above the first changed slice
+        first = changed[0]
+        start = max(islice for islice in self.checkpoints if islice <= first)
+        self.checkpoints = {islice: wave for islice, wave in self.checkpoints.items()
+                            if islice <= start}
+        wave = self.checkpoints[start]
+        for islice in range(start, self.nz):
+            if islice % self.checkpoint_interval == 0 and islice not in self.checkpoints:
+                self.checkpoints[islice] = wave
+            wave = nms.multislice(wave, self.gratings[islice:islice + 1], self.kernel)
+        self.cell = tuple(structure.cell)
+        self.fingerprints = fingerprints
+        self.wave = wave
+        return wave.copy()
+
+
+def simulate_series(cel_files, ht, nx, ny, nz, **kwargs):
+    """
+    Generator of (cel_file, exit_wave, number of re-sliced slices) for an
+    ordered list of .cel files, simulated incrementally.
+    """
+    simulator = IncrementalSimulator(ht, nx, ny, nz, **kwargs)
+    for cel_file in cel_files:
+        wave = simulator.simulate(nms.read_cel(cel_file))
+        yield cel_file, wave, len(simulator.last_changed)
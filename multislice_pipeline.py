@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Per-structure simulation pipeline of the time-series script as a function.
+
+simulate_structure() runs sections 2.1 - 2.5 of
+produce_multislice_images_for_noisy_time-series_0202021JLV.py for one .cel
+file: back-up of the cel file, slicing, multislice calculation, slice
+clean-up, imaging and clean/noisy TIFF output. Every step is a separate
+stage function working on a job dictionary, so the interactive script and
+the batch runners share the same code and only differ in how structures
+and stages are scheduled.
+
+All sub-directories are created with exist_ok, so a structure can be
+simulated again (e.g. after an interrupted run) without removing its
+previous output first. With a series container no per-structure
+directories are created: the numpy backend works in memory, and the
+Dr. Probe programs work in a scratch directory that is removed once the
+images are in the container.
+
+The 'numpy' and 'PIL' packages are required. The 'drprobe' package (and the
+Dr. Probe programs) are only required for the 'drprobe' backend.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import copy
+import json
+import os
+import shutil
+import tempfile
+import types
+import numpy as np
+from PIL import Image
+import numpy_multislice as nms
+from slice_cache import slice_key
+from defocus_series import image_series, image_series_from_wav
+from noise_realizations import noisy_realizations, realization_seed
+from frozen_phonons import frozen_phonon_average
+
+try:
+    import drprobe as drp
+except ImportError:
+    drp = None
+
+## Default settings, matching section 1.1 of the time-series script
+DEFAULT_SETTINGS = {'ht': 300,                  # High tension in kV
+                    'nx': 512, 'ny': 512,       # Pixel dimensions of waves and images
+                    'nz': 300,                  # Number of slices
+                    'dwf': True, 'buni': 0.005, # Debye-Waller factors, uniform B in nm^2
+                    'absorb': True,             # Absorptive form factors
+                    'output': True,             # Chatty drprobe output
+                    'defoci': [8],              # Defocus values in nm
+                    'vac_levels': [1, 4, 16],   # Vacuum levels in electron counts
+                    'n_realizations': 1,        # Noise realizations per image and level
+                    'noise_seed': 20210122,     # Base seed of the noise realizations
+                    'backend': 'drprobe',       # 'drprobe' or 'numpy'
+                    'validate_backend': False,  # Compare numpy images against drprobe
+                    'validation_tolerance': 0.05,
+                    'vectorized_imaging': False,# Batched defocus series from the drprobe .wav
+                    'keep_slices': False,       # Keep the per-structure slc directory
+                    'frozen_phonons': 0,        # Frozen-phonon configurations (numpy, 0 = off)
+                    'phonon_b_factors': None,   # {species: B in nm^2} of the displacements
+                    'phonon_workers': 2,        # Configurations simulated at the same time
+                    'phonon_seed': 20210122,    # Base seed of the displacements
+                    'sampling_file': None}      # nx, ny, nz from convergence_optimizer.py
+
+
+def image_name(structure_name, defocus, settings):
+    """File name of the .dat image of a structure at one defocus."""
+    return (f"{structure_name}_{settings['nz']}slc_{settings['nx']}x{settings['ny']}"
+            f"_{defocus}nmDefocus.dat")
+
+
+def read_sampling(json_file):
+    """(nx, ny, nz) from a file written by convergence_optimizer.py."""
+    with open(json_file, 'r') as f:
+        result = json.load(f)
+    return result['nx'], result['ny'], result['nz']
+
+
+def save_parameters(json_file, prm):
+    """Save the attributes of a drprobe MsaPrm or WavimgPrm object as JSON (see read_parameters)."""
+    with open(json_file, 'w') as f:
+        json.dump(vars(prm), f, indent=1, default=str)
+
+
+def read_parameters(json_file):
+    """
+    Parameter object saved by save_parameters(), as a namespace with the
+    attributes of the drprobe object. Enough for the numpy backend, which
+    does not need drprobe to read its parameters this way.
+    """
+    with open(json_file, 'r') as f:
+        attributes = json.load(f)
+    if 'aberrations_dict' in attributes:
+        # JSON object keys are strings
+        attributes['aberrations_dict'] = {int(index): tuple(value) for index, value
+                                          in attributes['aberrations_dict'].items()}
+    return types.SimpleNamespace(**attributes)
+
+
+def apply_sampling(settings, msa_prm, wav_prm):
+    """
+    Use the nx, ny and nz of settings['sampling_file'] in a settings
+    dictionary and its MSA and WavImg parameter objects, in the same way as
+    section 1.3 of the time-series script. The frame size of msa_prm sets
+    the pixel size of the wave.
+    """
+    nx, ny, nz = read_sampling(settings['sampling_file'])
+    settings.update(nx=nx, ny=ny, nz=nz)
+    msa_prm.scan_columns, msa_prm.scan_rows = nx, ny
+    msa_prm.number_of_slices = msa_prm.tot_number_of_slices = nz
+    wav_prm.wave_dim = wav_prm.output_dim = (nx, ny)
+    wav_prm.wave_sampling = (msa_prm.h_scan_frame_size/nx, msa_prm.v_scan_frame_size/ny)
+    return settings
+
+
+def simulate_structure(cel_path, output_dir, clean_image_dir, noisy_image_dir,
+                       msa_prm_gen, wav_prm_gen, settings, slice_cache=None,
+                       incremental_simulator=None, noise_writer=None, container=None):
+    """
+    Simulate the images of one structure.
+
+    msa_prm_gen and wav_prm_gen are the general drprobe parameter objects of
+    section 1.3, settings a dictionary with the keys of DEFAULT_SETTINGS.
+    slice_cache (a slice_cache.SliceCache), incremental_simulator (an
+    incremental_time_series.IncrementalSimulator, numpy backend only) and
+    noise_writer (a noise_realizations.NoiseStackWriter) are optional.
+    With container (a series_container.SeriesWriter) the images, noise
+    realizations and optionally the exit wave go into one file per series
+    instead of .dat and .tif files.
+
+    The stages below run one after another here; pipelined_runner.py runs
+    the same stages of different structures concurrently.
+
+    Returns a dictionary with the structure name and the list of .dat images.
+    """
+    job = prepare_stage(cel_path, output_dir, clean_image_dir, noisy_image_dir,
+                        msa_prm_gen, wav_prm_gen, settings, container)
+    try:
+        slice_stage(job, slice_cache)
+        propagate_stage(job, incremental_simulator)
+    finally:
+        cleanup_stage(job)
+    image_stage(job)
+    write_stage(job, noise_writer, container)
+    return {'structure': job['structure_name'], 'images': job['dat_files']}
+
+
+def prepare_stage(cel_path, output_dir, clean_image_dir, noisy_image_dir,
+                  msa_prm_gen, wav_prm_gen, settings, container=None):
+    """
+    2.1) Set up the directories of a structure and back up its cel file.
+    container is the series container the job is written to (or any other
+    value than None); then only a scratch directory is set up, for drprobe.
+    Returns the job dictionary that is handed from stage to stage.
+    """
+    settings = dict(DEFAULT_SETTINGS, **settings)
+    cel_file = os.path.basename(cel_path)
+    # Remove the file extension to isolate the structure name
+    structure_name = os.path.splitext(cel_file)[0]
+    run_drprobe = settings['backend'] == 'drprobe' or settings['validate_backend']
+    if settings['frozen_phonons'] and run_drprobe:
+        raise ValueError("frozen_phonons needs the 'numpy' backend without validate_backend")
+    if container is None:
+        structure_dir = os.path.join(output_dir, structure_name)
+    elif run_drprobe:
+        # The Dr. Probe programs read and write files; removed by write_container
+        structure_dir = tempfile.mkdtemp(prefix=f'.{structure_name}-', dir=output_dir)
+    else:
+        structure_dir = None
+    job = {'cel_path': cel_path, 'structure_name': structure_name,
+           'structure_dir': structure_dir, 'settings': settings,
+           'clean_image_dir': clean_image_dir, 'noisy_image_dir': noisy_image_dir,
+           # Private copies, so concurrent structures do not share file names
+           'msa_prm': copy.deepcopy(msa_prm_gen), 'wav_prm': copy.deepcopy(wav_prm_gen),
+           # The r'"{}"' formatting is necessary to enclose the path in double quotes.
+           'cel_original': r'"{}"'.format(cel_path),
+           'slc_dir': None if structure_dir is None else os.path.join(structure_dir, 'slc'),
+           'slice_prefix': None, 'exit_wave': None, 'images': [], 'dat_files': [],
+           'slice_cache': None, 'cached_slices': False, 'cache_prefixes': [],
+           'run_drprobe': run_drprobe, 'container': container is not None}
+    if settings['sampling_file'] is not None:
+        # Converged nx, ny and nz replace those of the settings and parameter files
+        apply_sampling(settings, job['msa_prm'], job['wav_prm'])
+    if job['container']:
+        # The container keeps the settings instead of a cel back-up
+        return job
+
+    structure_cel_dir = os.path.join(structure_dir, 'cel')
+    os.makedirs(structure_cel_dir, exist_ok=True)
+    if settings['backend'] == 'drprobe':
+        cel_copy = r'"{}"'.format(os.path.join(structure_cel_dir, cel_file))
+        drp.commands.cellmuncher(job['cel_original'], cel_copy, output=settings['output'])
+    else:
+        shutil.copyfile(cel_path, os.path.join(structure_cel_dir, cel_file))
+    return job
+
+
+def slice_stage(job, slice_cache=None, slices_to_disk=False, slices_in_memory=False):
+    """
+    2.2) Slice the structure into the slice cache or the slc directory.
+
+    For the numpy backend the phase gratings are only written out when a
+    slice cache is used or slices_to_disk is True. With slices_in_memory they
+    are kept in job['gratings'] for the propagate stage (pipelined_runner.py
+    slices and propagates different structures at the same time); otherwise
+    they are built on the fly during propagation.
+    """
+    settings = job['settings']
+    ht, nx, ny, nz = settings['ht'], settings['nx'], settings['ny'], settings['nz']
+    absorb, dwf, buni = settings['absorb'], settings['dwf'], settings['buni']
+    job['slice_cache'] = slice_cache
+    job['cached_slices'] = slice_cache is not None
+
+    if settings['backend'] == 'numpy':
+        job['structure'] = nms.read_cel(job['cel_path'])
+        build = lambda prefix: nms.write_transmission_functions(
+            prefix + '.npy', job['structure'], ht, nx, ny, nz,
+            absorb=absorb, dwf=dwf, buni=buni)
+        # Frozen-phonon configurations are sliced on the fly during propagation
+        if slice_cache is not None and not settings['frozen_phonons']:
+            key = slice_key(job['cel_path'], ht, nx, ny, nz, absorb, dwf, buni, backend='numpy')
+            job['grating_prefix'] = slice_cache.get_or_create(key, build)
+            job['cache_prefixes'].append(job['grating_prefix'])
+        elif slices_to_disk and job['slc_dir'] is not None and not settings['frozen_phonons']:
+            os.makedirs(job['slc_dir'], exist_ok=True)
+            job['grating_prefix'] = os.path.join(job['slc_dir'], job['structure_name'] + '_slc')
+            build(job['grating_prefix'])
+        elif slices_in_memory and not settings['frozen_phonons']:
+            job['gratings'] = nms.transmission_functions(job['structure'], ht, nx, ny, nz,
+                                                         absorb, dwf, buni)
+
+    if job['run_drprobe']:
+        build = lambda prefix: drp.commands.celslc(job['cel_original'], prefix,
+                                                   ht, nx, ny, nz,
+                                                   absorb=absorb, dwf=dwf, buni=buni,
+                                                   output=settings['output'])
+        if slice_cache is not None:
+            # A cache hit skips celslc completely
+            key = slice_key(job['cel_path'], ht, nx, ny, nz, absorb, dwf, buni)
+            job['slice_prefix'] = slice_cache.get_or_create(key, build)
+            job['cache_prefixes'].append(job['slice_prefix'])
+        else:
+            os.makedirs(job['slc_dir'], exist_ok=True)
+            job['slice_prefix'] = os.path.join(job['slc_dir'], job['structure_name'] + '_slc')
+            build(job['slice_prefix'])
+
+
+def propagate_stage(job, incremental_simulator=None):
+    """2.3) Calculate the exit wave (in memory for numpy, a .wav file for drprobe)."""
+    settings = job['settings']
+    ht, nx, ny, nz = settings['ht'], settings['nx'], settings['ny'], settings['nz']
+    structure_name = job['structure_name']
+    msa_prm = job['msa_prm']
+
+    if settings['backend'] == 'numpy':
+        structure = job['structure']
+        tilt = (msa_prm.tilt_x, msa_prm.tilt_y)
+        if settings['frozen_phonons']:
+            frozen_phonon_stage(job)
+        elif incremental_simulator is not None:
+            job['exit_wave'] = incremental_simulator.simulate(structure)
+            print(f'{structure_name}: {len(incremental_simulator.last_changed)} '
+                  f'of {nz} slices changed')
+        elif job.get('gratings') is not None or job.get('grating_prefix') is not None:
+            gratings = job.pop('gratings', None)
+            if gratings is None:
+                gratings = np.load(job['grating_prefix'] + '.npy', mmap_mode='r')
+            kernel = nms.propagator(nx, ny, structure.cell[0], structure.cell[1],
+                                    structure.cell[2]/nz, ht, tilt)
+            job['exit_wave'] = nms.multislice(nms.plane_wave(nx, ny), gratings, kernel)
+            del gratings
+        else:
+            job['exit_wave'] = nms.exit_wave(structure, ht, nx, ny, nz,
+                                             absorb=settings['absorb'], dwf=settings['dwf'],
+                                             buni=settings['buni'], tilt=tilt)
+
+    if job['run_drprobe']:
+        structure_prm_dir = os.path.join(job['structure_dir'], 'prm')
+        os.makedirs(structure_prm_dir, exist_ok=True)
+        # Specify location of phase gratings generated in section 2.2
+        msa_prm.slice_files = job['slice_prefix']
+        msa_prm_path_and_name = os.path.join(structure_prm_dir, 'MsaPrm_'+structure_name+'.prm')
+        msa_prm.save_msa_prm(msa_prm_path_and_name)
+
+        structure_wav_dir = os.path.join(job['structure_dir'], 'wav')
+        os.makedirs(structure_wav_dir, exist_ok=True)
+        wav_path = os.path.join(structure_wav_dir, structure_name)
+        # Calculate exit surface wavefunction and save it in wav_path
+        drp.commands.msa(msa_prm_path_and_name, wav_path,
+                         ctem=True, output=settings['output'], silent=False)
+
+        # Wave parameter file pointing to the exit wave after the full multislice simulation
+        wav_prm = job['wav_prm']
+        wav_prm.wave_files = wav_path + '_sl' + f'{nz:03d}' + '.wav'
+        job['wav_prm_file'] = os.path.join(structure_prm_dir, 'WavPrm_'+structure_name+'.prm')
+        wav_prm.save_wavimg_prm(job['wav_prm_file'])
+
+
+def frozen_phonon_stage(job):
+    """
+    Average the exit wave and defocus series over frozen-phonon configurations
+    (numpy backend). Only the mean and variance of the exit wave are saved.
+    """
+    settings = job['settings']
+    msa_prm = job['msa_prm']
+    accumulator = frozen_phonon_average(job['structure'], settings['frozen_phonons'],
+                                        settings['ht'], settings['nx'], settings['ny'],
+                                        settings['nz'], absorb=settings['absorb'],
+                                        tilt=(msa_prm.tilt_x, msa_prm.tilt_y),
+                                        defoci=settings['defoci'],
+                                        imaging=nms.wavimg_settings(job['wav_prm']),
+                                        b_factors=settings['phonon_b_factors'],
+                                        buni=settings['buni'], seed=settings['phonon_seed'],
+                                        structure_name=job['structure_name'],
+                                        max_workers=settings['phonon_workers'])
+    job['exit_wave'] = accumulator.mean_wave.astype(np.complex64)
+    job['phonon_images'] = accumulator.mean_images.astype(np.float32)
+    if job['container']:
+        # The mean exit wave goes into the container
+        return
+    structure_wav_dir = os.path.join(job['structure_dir'], 'wav')
+    os.makedirs(structure_wav_dir, exist_ok=True)
+    wav_path = os.path.join(structure_wav_dir, job['structure_name'])
+    np.save(wav_path + '_fp_mean.npy', job['exit_wave'])
+    np.save(wav_path + '_fp_variance.npy', accumulator.wave_variance.astype(np.float32))
+
+
+def cleanup_stage(job):
+    """
+    2.5) Delete the slice sub-directory to save space. Cached slices are kept
+    for reuse, and released so that the cache may evict them again.
+    """
+    job.pop('gratings', None)
+    while job['cache_prefixes']:
+        job['slice_cache'].release(job['cache_prefixes'].pop())
+    if job['cached_slices'] or job['settings']['keep_slices']:
+        return
+    if job['slc_dir'] is not None and os.path.isdir(job['slc_dir']):
+        try:
+            shutil.rmtree(job['slc_dir'])
+        except OSError as e:
+            print("Error: %s - %s." % (e.filename, e.strerror))
+
+
+def image_stage(job):
+    """2.4) Calculate the defocus series; images are kept in job['images']."""
+    calculate_images(job)
+    load_images(job)
+
+
+def calculate_images(job):
+    """
+    First half of the image stage: run wavimg for every defocus (.dat files)
+    and/or calculate the numpy defocus series (job['numpy_img_stack']).
+    """
+    settings = job['settings']
+    backend = settings['backend']
+    defoci = settings['defoci']
+    wav_prm = job['wav_prm']
+    structure_img_dir = ''
+    if job['structure_dir'] is not None:
+        structure_img_dir = os.path.join(job['structure_dir'], 'img')
+        os.makedirs(structure_img_dir, exist_ok=True)
+
+    # Calculate the whole defocus series from the exit wave at once
+    job['numpy_img_stack'] = None
+    if job.get('phonon_images') is not None:
+        # Incoherent average over the frozen-phonon configurations
+        job['numpy_img_stack'] = job.pop('phonon_images')
+    elif backend == 'numpy':
+        job['numpy_img_stack'] = image_series(job['exit_wave'], defoci,
+                                              **nms.wavimg_settings(wav_prm))
+    elif settings['vectorized_imaging']:
+        job['numpy_img_stack'] = image_series_from_wav(wav_prm.wave_files, defoci, wav_prm)
+
+    job['run_wavimg'] = ((backend == 'drprobe' and not settings['vectorized_imaging'])
+                         or settings['validate_backend'])
+    job['img_files'] = []
+    for defocus in defoci:
+        output_img = os.path.join(structure_img_dir,
+                                  image_name(job['structure_name'], defocus, settings))
+        if job['run_wavimg']:
+            drp.commands.wavimg(job['wav_prm_file'], output_img,
+                                foc=defocus, sil=False, output=settings['output'])
+        job['img_files'].append((output_img, defocus))
+
+
+def load_images(job):
+    """
+    Second half of the image stage: reload the wavimg .dat files, compare
+    them with the numpy images when validating and fill job['images'].
+    """
+    settings = job['settings']
+    nx, ny = settings['nx'], settings['ny']
+    numpy_img_stack = job.pop('numpy_img_stack')
+    for i_defocus, (output_img, defocus) in enumerate(job.pop('img_files')):
+        img_name = os.path.basename(output_img)
+        if job['run_wavimg']:
+            drprobe_img_array = np.fromfile(output_img, dtype=np.single).reshape((nx, ny))
+
+        if numpy_img_stack is not None:
+            clean_img_array = numpy_img_stack[i_defocus]
+            if settings['validate_backend']:
+                # Compare against drprobe, then keep the numpy image
+                errors = nms.compare_images(clean_img_array, drprobe_img_array)
+                print(f'{img_name}: numpy vs. drprobe {errors}')
+                if errors['rms_error'] > settings['validation_tolerance']:
+                    print(f'WARNING: {img_name} exceeds the validation tolerance '
+                          f"of {settings['validation_tolerance']}")
+            # The .dat file is written in the write stage
+            job['images'].append((output_img, defocus, clean_img_array, True))
+        else:
+            job['images'].append((output_img, defocus, drprobe_img_array, False))
+
+
+def write_stage(job, noise_writer=None, container=None):
+    """
+    Write the .dat, clean .tif and noisy .tif files of the images in
+    job['images'], or add the images (and exit wave) to a series container.
+    """
+    if container is not None:
+        write_container(job, container)
+        return
+    write_clean_images(job)
+    write_noisy_images(job, noise_writer)
+
+
+def write_clean_images(job):
+    """First half of the write stage: the .dat files and clean .tif files."""
+    # The exit wave is not needed any more
+    job['exit_wave'] = None
+    for output_img, defocus, clean_img_array, write_dat in job['images']:
+        img_name = os.path.basename(output_img)
+        if write_dat:
+            nms.write_dat(output_img, clean_img_array)
+        job['dat_files'].append(output_img)
+
+        # Save the clean image as a tif file
+        Image.fromarray(np.flip(clean_img_array, 0)).save(
+            os.path.join(job['clean_image_dir'], img_name[:-4] + '.tif'))
+
+
+def write_noisy_images(job, noise_writer=None):
+    """Second half of the write stage: the noise realizations of every image."""
+    for output_img, defocus, clean_img_array, write_dat in job['images']:
+        img_name = os.path.basename(output_img)
+        save_noisy_images(np.flip(clean_img_array, 0), job['structure_name'], img_name[:-4],
+                          defocus, job['noisy_image_dir'], job['settings'], noise_writer)
+    job['images'] = []
+
+
+def write_container(job, container):
+    """
+    Queue the images of a job (and optionally its exit wave) in a SeriesWriter
+    (or series_container.SeriesCollector), flag the frame complete and
+    remove the drprobe scratch directory.
+    """
+    structure_name = job['structure_name']
+    if container.store_exit_waves:
+        exit_wave = job['exit_wave']
+        if exit_wave is None:
+            # drprobe backend: read the .wav file written by msa
+            settings = job['settings']
+            exit_wave = nms.read_wav(job['wav_prm'].wave_files, settings['nx'], settings['ny'])
+        container.write_exit_wave(exit_wave, structure_name)
+    job['exit_wave'] = None
+    for output_img, defocus, clean_img_array, write_dat in job['images']:
+        container.write_image(np.flip(clean_img_array, 0), structure_name, defocus)
+    container.mark_complete(structure_name)
+    job['images'] = []
+    if job['container'] and job['structure_dir'] is not None:
+        shutil.rmtree(job['structure_dir'], ignore_errors=True)
+
+
+def save_noisy_images(clean_img_array, structure_name, img_base_name, defocus,
+                      noisy_image_dir, settings, noise_writer=None):
+    """Write the noise realizations of a clean image, either stacked or as single TIFFs."""
+    settings = dict(DEFAULT_SETTINGS, **settings)
+    if noise_writer is not None:
+        noise_writer.write(clean_img_array, structure_name, img_base_name, defocus)
+        return
+    n_realizations = settings['n_realizations']
+    for vac_level in settings['vac_levels']:
+        level_dir = os.path.join(noisy_image_dir, f'vac_int-{vac_level:02d}counts')
+        os.makedirs(level_dir, exist_ok=True)
+        seed = realization_seed(settings['noise_seed'], structure_name, defocus, vac_level)
+        noisy_img_stack = noisy_realizations(clean_img_array, vac_level, n_realizations, seed)
+        for realization, noisy_img_array in enumerate(noisy_img_stack):
+            suffix = f'_r{realization:03d}' if n_realizations > 1 else ''
+            noisy_img = Image.fromarray(noisy_img_array.astype(np.int32))
+            noisy_img.save(os.path.join(level_dir, img_base_name
+                                        + f'_noisy_vac_int-{vac_level:02d}counts'
+                                        + suffix + '.tif'))
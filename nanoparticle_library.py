@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Parallel generator of nanoparticle libraries for size/shape/twin-energy sweeps.
+
+Generate_multiply_twinned_Pt_NPs.py builds a single wulffpack Decahedron of
+fixed size. Here a whole grid of particles is produced: every combination of
+shape ('decahedron', 'icosahedron' or 'single_crystal'), surface-energy set,
+twin energy and size (number of atoms) is built and written straight to
+.cel and/or .cif files, centered in an orthogonal box with vacuum padding.
+A manifest.csv in the output directory lists every particle.
+
+The Wulff construction depends only on the shape, surface energies and twin
+energy; the size just rescales it. The grid is therefore grouped by shape
+key and each task solves its construction once and then carves all the sizes
+of that group from it. Splitting a group over several tasks with
+'sizes_per_task' spreads large sweeps over more workers, at the cost of
+solving the construction once per task. Twin energies do not apply to single
+crystals, so those are built once per surface-energy set.
+
+Usage:
+    python nanoparticle_library.py SETTINGS.json OUTPUT_DIR [--jobs N]
+
+where SETTINGS.json holds the keys of DEFAULT_SETTINGS, with surface
+energies given as {"set name": {"1,0,0": 2.036, "1,1,1": 2.0, ...}}.
+
+The 'numpy', 'ase' and 'wulffpack' packages are required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import argparse
+import csv
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import numpy_multislice as nms
+from tilt_series import write_cif
+
+## Default library settings; sizes are requested numbers of atoms, lengths in Angstrom
+DEFAULT_SETTINGS = {'element': 'Pt',
+                    'lattice_parameter': 3.912,
+                    'shapes': ['decahedron', 'icosahedron', 'single_crystal'],
+                    'sizes': [325],
+                    'twin_energies': [0.04],
+                    'surface_energies': {'Pt': {(1, 0, 0): 2.036,
+                                                (1, 1, 1): 2.0,
+                                                (1, 1, 0): 2.5}},
+                    'padding': 10.0,
+                    'box': None,
+                    'formats': ['cel', 'cif'],
+                    'sizes_per_task': None}
+
+SHAPES = ('decahedron', 'icosahedron', 'single_crystal')
+
+MANIFEST_FIELDS = ['name', 'shape', 'surface_energies', 'twin_energy', 'requested_atoms',
+                   'natoms', 'a', 'b', 'c', 'cel_file', 'cif_file']
+
+
+def wulff_construction(shape, surface_energies, twin_energy, element, lattice_parameter):
+    """
+    Solved wulffpack particle of a shape key.
+    surface_energies is a tuple of ((h, k, l), energy) pairs.
+    """
+    from ase.build import bulk
+    from wulffpack import Decahedron, Icosahedron, SingleCrystal
+    prim = bulk(element, a=lattice_parameter)
+    energies = dict(surface_energies)
+    if shape == 'decahedron':
+        return Decahedron(energies, twin_energy=twin_energy, primitive_structure=prim)
+    if shape == 'icosahedron':
+        return Icosahedron(energies, twin_energy=twin_energy, primitive_structure=prim)
+    if shape == 'single_crystal':
+        return SingleCrystal(energies, primitive_structure=prim)
+    raise ValueError(f'Unknown particle shape {shape}; use one of {SHAPES}')
+
+
+def particle_name(element, shape, natoms, energy_name, twin_energy):
+    name = f'{element}_{shape}_{natoms}atoms_{energy_name}'
+    if twin_energy is not None:
+        name += f'_twin{twin_energy:.3f}'
+    return name
+
+
+def boxed_particle(atoms, padding=10.0, box=None):
+    """
+    (cell lengths, fractional coordinates) of a particle centered in an
+    orthogonal box, either of size box or of its extent plus padding on each side.
+    """
+    positions = atoms.get_positions()
+    extent = positions.max(axis=0) - positions.min(axis=0)
+    if box is None:
+        box = extent + 2 * padding
+    box = np.broadcast_to(np.asarray(box, dtype=float), (3,))
+    if np.any(extent >= box):
+        raise ValueError(f'Particle extent {extent} does not fit in box {box}')
+    center = 0.5 * (positions.max(axis=0) + positions.min(axis=0))
+    return box, (positions - center) / box + 0.5
+
+
+def write_particle(atoms, output_dir, name, padding=10.0, box=None, formats=('cel', 'cif')):
+    """Write a particle to .cel and/or .cif files; returns (box, cel file, cif file)."""
+    box, frac = boxed_particle(atoms, padding, box)
+    symbols = atoms.get_chemical_symbols()
+    cel_file = cif_file = ''
+    if 'cel' in formats:
+        cel_file = os.path.join(output_dir, name + '.cel')
+        # .cel files are in nm
+        cel = nms.CelStructure(name, tuple(box / 10) + (90.0, 90.0, 90.0), symbols, frac,
+                               np.ones(len(symbols)), np.zeros(len(symbols)))
+        nms.write_cel(cel_file, cel)
+    if 'cif' in formats:
+        cif_file = os.path.join(output_dir, name + '.cif')
+        write_cif(cif_file, box, (90.0, 90.0, 90.0), symbols, frac, name)
+    return box, cel_file, cif_file
+
+
+def build_group(output_dir, shape, energy_name, surface_energies, twin_energy, sizes, settings):
+    """Build and write every size of one shape key; returns manifest rows."""
+    particle = wulff_construction(shape, surface_energies, twin_energy,
+                                  settings['element'], settings['lattice_parameter'])
+    rows = []
+    for size in sizes:
+        particle.natoms = size
+        atoms = particle.atoms
+        name = particle_name(settings['element'], shape, size, energy_name, twin_energy)
+        box, cel_file, cif_file = write_particle(atoms, output_dir, name, settings['padding'],
+                                                 settings['box'], settings['formats'])
+        rows.append({'name': name, 'shape': shape, 'surface_energies': energy_name,
+                     'twin_energy': '' if twin_energy is None else twin_energy,
+                     'requested_atoms': size, 'natoms': len(atoms),
+                     'a': box[0], 'b': box[1], 'c': box[2],
+                     'cel_file': os.path.basename(cel_file),
+                     'cif_file': os.path.basename(cif_file)})
+    return rows
+
+
+def library_groups(settings):
+    """(shape, energy set name, energy tuple, twin energy, sizes) of every task."""
+    sizes = sorted(settings['sizes'])
+    per_task = settings['sizes_per_task'] or len(sizes)
+    groups = []
+    for shape, (energy_name, energies) in itertools.product(settings['shapes'],
+                                                            settings['surface_energies'].items()):
+        if shape not in SHAPES:
+            raise ValueError(f'Unknown particle shape {shape}; use one of {SHAPES}')
+        energies = tuple(sorted((tuple(int(i) for i in miller), float(energy))
+                                for miller, energy in energies.items()))
+        twin_energies = [None] if shape == 'single_crystal' else settings['twin_energies']
+        for twin_energy in twin_energies:
+            for start in range(0, len(sizes), per_task):
+                groups.append((shape, energy_name, energies, twin_energy,
+                               sizes[start:start + per_task]))
+    return groups
+
+
+def generate_library(output_dir, settings=None, jobs=None):
+    """
+    Build the particle grid of settings (see DEFAULT_SETTINGS) on a process pool.
+    Returns (manifest rows, {task: error message}).
+    """
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    os.makedirs(output_dir, exist_ok=True)
+    rows, errors = [], {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(build_group, output_dir, shape, energy_name, energies,
+                               twin_energy, sizes, settings):
+                   (shape, energy_name, twin_energy, tuple(sizes))
+                   for shape, energy_name, energies, twin_energy, sizes in library_groups(settings)}
+        for future in as_completed(futures):
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                errors[futures[future]] = f'{type(e).__name__}: {e}'
+    rows.sort(key=lambda row: row['name'])
+    with open(os.path.join(output_dir, 'manifest.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows, errors
+
+
+def load_settings(settings_file):
+    """Library settings from a .json file; Miller indices are written as 'h,k,l' keys."""
+    with open(settings_file, 'r') as f:
+        settings = json.load(f)
+    if 'surface_energies' in settings:
+        settings['surface_energies'] = {
+            name: {tuple(int(i) for i in miller.split(',')): energy
+                   for miller, energy in energies.items()}
+            for name, energies in settings['surface_energies'].items()}
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a library of nanoparticle models.')
+    parser.add_argument('settings', help='.json file with the library settings')
+    parser.add_argument('output_dir', help='Directory where the particles are saved')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes')
+    args = parser.parse_args()
+
+    rows, errors = generate_library(args.output_dir, load_settings(args.settings), args.jobs)
+    print(f'{len(rows)} particles written, {len(errors)} groups failed')
+    for group, error in errors.items():
+        print(f'{group}: {error}')
+
+
+if __name__ == '__main__':
+    main()
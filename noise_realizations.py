@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Batched, reproducible Poisson noise realizations of simulated images.
+
+Every (structure, defocus, vacuum level) combination gets its own
+numpy.random.Generator, seeded from a base seed and a hash of those three
+values. All realizations of a combination are drawn in a single vectorized
+call, and any noisy frame can be reproduced later from its structure name,
+defocus, vacuum level and realization index without storing the other frames.
+
+NoiseStackWriter streams the frames of each vacuum level into one multi-frame
+TIFF file (with a .csv index of what each frame is) instead of writing one
+file per realization. The frames are streamed with the 'tifffile' package
+if it is installed, and otherwise appended to the same files with PIL
+(slower for long series, as PIL walks the existing pages on every append).
+
+The 'numpy' and 'PIL' packages are required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import csv
+import os
+import threading
+import zlib
+import numpy as np
+from PIL import Image
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+
+def realization_seed(base_seed, structure_name, defocus, vac_level):
+    """SeedSequence of one (structure, defocus, vacuum level) combination."""
+    label = f'{structure_name}|{defocus}|{vac_level}'
+    return np.random.SeedSequence([base_seed, zlib.crc32(label.encode())])
+
+
+def noise_dtype(max_counts):
+    """Smallest unsigned integer type that holds max_counts."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_counts <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+
+def noisy_realizations(clean_img_array, vac_level, n_realizations, seed):
+    """
+    n_realizations Poisson realizations of clean_img_array * vac_level,
+    drawn in one call. clean_img_array may be an image or a stack of images;
+    the realizations are added as a new leading axis. seed is anything
+    accepted by numpy.random.default_rng (e.g. realization_seed()).
+    """
+    rng = np.random.default_rng(seed)
+    expected = np.clip(np.asarray(clean_img_array, dtype=float) * vac_level, 0, None)
+    counts = rng.poisson(expected, size=(n_realizations,) + expected.shape)
+    return counts.astype(noise_dtype(counts.max(initial=0)))
+
+
+def noisy_frame(clean_img_array, vac_level, realization, base_seed, structure_name, defocus):
+    """Reproduce a single noisy frame written by NoiseStackWriter."""
+    seed = realization_seed(base_seed, structure_name, defocus, vac_level)
+    return noisy_realizations(clean_img_array, vac_level, realization + 1, seed)[realization]
+
+
+class NoiseStackWriter:
+    """
+    Writes noisy realizations into one multi-frame TIFF per vacuum level.
+
+    Files are named vac_int-XXcounts.tif inside noisy_image_dir, each with a
+    vac_int-XXcounts_frames.csv index listing the image name, defocus,
+    realization and base seed of every frame. Use as a context manager or
+    call close() when done. write() may be called from several threads.
+    """
+
+    def __init__(self, noisy_image_dir, vac_levels, n_realizations=1, base_seed=0):
+        self.noisy_image_dir = noisy_image_dir
+        self.vac_levels = list(vac_levels)
+        self.n_realizations = n_realizations
+        self.base_seed = base_seed
+        self.stacks, self.indices, self.index_files, self.frame_counts = {}, {}, {}, {}
+        # Images may be written from several I/O threads
+        self.lock = threading.Lock()
+        for vac_level in self.vac_levels:
+            name = f'vac_int-{vac_level:02d}counts'
+            index_file = open(os.path.join(noisy_image_dir, name + '_frames.csv'), 'w', newline='')
+            self.index_files[vac_level] = index_file
+            self.indices[vac_level] = csv.writer(index_file)
+            self.indices[vac_level].writerow(['frame', 'image', 'defocus', 'realization',
+                                              'base_seed', 'file'])
+            self.frame_counts[vac_level] = 0
+            if tifffile is not None:
+                self.stacks[vac_level] = tifffile.TiffWriter(
+                    os.path.join(noisy_image_dir, name + '.tif'), bigtiff=True)
+
+    def write(self, clean_img_array, structure_name, img_name, defocus):
+        """Draw and store the realizations of one clean image at every vacuum level."""
+        with self.lock:
+            self._write(clean_img_array, structure_name, img_name, defocus)
+
+    def _write(self, clean_img_array, structure_name, img_name, defocus):
+        for vac_level in self.vac_levels:
+            seed = realization_seed(self.base_seed, structure_name, defocus, vac_level)
+            frames = noisy_realizations(clean_img_array, vac_level, self.n_realizations, seed)
+            name = f'vac_int-{vac_level:02d}counts'
+            # Frames of one stack must share a dtype, so stacks are always uint16
+            if frames.max(initial=0) > np.iinfo(np.uint16).max:
+                raise ValueError(f'Counts at vacuum level {vac_level} exceed the uint16 range')
+            file_name = name + '.tif'
+            if tifffile is not None:
+                for frame in frames.astype(np.uint16):
+                    self.stacks[vac_level].write(frame, contiguous=True)
+            else:
+                images = [Image.fromarray(frame) for frame in frames.astype(np.uint16)]
+                images[0].save(os.path.join(self.noisy_image_dir, file_name), save_all=True,
+                               append_images=images[1:], append=self.frame_counts[vac_level] > 0)
+            for realization in range(self.n_realizations):
+                self.indices[vac_level].writerow([self.frame_counts[vac_level], img_name,
+                                                  defocus, realization, self.base_seed,
+                                                  file_name])
+                self.frame_counts[vac_level] += 1
+
+    def close(self):
+        for stack in self.stacks.values():
+            stack.close()
+        for index_file in self.index_files.values():
+            index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+In-process NumPy multislice engine.
+
+This module is an alternative backend to the Dr. Probe subprocess chain
+(celslc -> msa -> wavimg) used in the time-series simulation script. A .cel
+file is read directly, projected potentials are built slice by slice in
+reciprocal space from the Kirkland electron scattering factors, the wave is
+propagated with (batched) FFTs, and the objective-lens transfer function is
+applied to the exit wave in memory. Nothing is written to disk unless the
+caller asks for it, so the per-structure process spawns and the slice, wave
+and image file round-trips are avoided.
+
+Approximations compared to Dr. Probe:
+    - Absorption is modelled with a fixed ratio (ABSORPTION_RATIO) between the
+      absorptive and elastic potential instead of the Weickenmeier-Kohl
+      absorptive form factors used by celslc.
+    - Partial coherence is included with the quasi-coherent envelope
+      approximation instead of an explicit TCC calculation.
+    - Only orthogonal cells and the round aberrations C1, C3 (Cs) and C5
+      (aberration indices 1, 5 and 11 in the Dr. Probe numbering) are supported.
+Use compare_images() (or the validation mode of the time-series script) to
+check the result against the Dr. Probe path for a given set of parameters.
+
+The 'numpy' package is required. If 'scipy' is installed, its multi-threaded
+FFT is used instead of numpy.fft.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import os
+import re
+from collections import namedtuple
+import numpy as np
+
+try:
+    import scipy.fft as _fft_module
+    _FFT_KWARGS = {'workers': -1}
+except ImportError:
+    _fft_module = np.fft
+    _FFT_KWARGS = {}
+
+## Physical constants
+HC = 1.23984198             # Planck constant times speed of light in keV nm
+M0C2 = 510.99895            # Electron rest energy in keV
+
+## Ratio between absorptive and elastic potential when absorb=True
+ABSORPTION_RATIO = 0.1
+
+## Fraction of the Nyquist frequency kept by the anti-aliasing band-width limit
+BANDWIDTH_LIMIT = 2/3
+
+## Parametrization file shipped next to this module
+FORM_FACTOR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'kirkland_form_factors.txt')
+_form_factors = {}
+
+## Container for the contents of a .cel file
+#  cell is (a, b, c, alpha, beta, gamma) in nm and degrees,
+#  xyz holds fractional coordinates, biso is the Debye-Waller B in nm^2.
+CelStructure = namedtuple('CelStructure',
+                          ['title', 'cell', 'symbols', 'xyz', 'occupancy', 'biso'])
+
+
+def read_cel(cel_file):
+    """Read a Dr. Probe .cel file into a CelStructure."""
+    with open(cel_file, 'r') as f:
+        lines = f.read().splitlines()
+    title = lines[0]
+    cell = tuple(float(value) for value in lines[1].split()[1:7])
+    symbols, rows = [], []
+    for line in lines[2:]:
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0].startswith('*'):
+            break
+        # Occupancy and B are optional in the .cel format
+        values = [float(value) for value in fields[1:6]] + [1.0, 0.0][len(fields[4:6]):]
+        symbols.append(fields[0])
+        rows.append(values[:5])
+    rows = np.array(rows, dtype=float).reshape(-1, 5)
+    return CelStructure(title, cell, symbols, rows[:, 0:3], rows[:, 3], rows[:, 4])
+
+
+def write_cel(cel_file, structure):
+    """Write a CelStructure to a Dr. Probe .cel file."""
+    lines = [structure.title,
+             ' 0 ' + ' '.join(f'{value:.6f}' for value in structure.cell)]
+    for symbol, (x, y, z), occ, biso in zip(structure.symbols, structure.xyz,
+                                          structure.occupancy, structure.biso):
+        lines.append(f'{symbol:<4s} {x:.6f} {y:.6f} {z:.6f} {occ:.6f} {biso:.6f}'
+                     ' 0.000000 0.000000 0.000000')
+    lines.append('*')
+    with open(cel_file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def element(symbol):
+    """Strip charges and labels (e.g. 'O2-', 'Ce1') from a .cel atom symbol."""
+    match = re.match(r'[A-Z][a-z]?', symbol.strip().capitalize())
+    if match is None:
+        raise ValueError(f'Cannot determine the element of atom symbol "{symbol}"')
+    return match.group(0)
+
+
+def electron_wavelength(ht):
+    """Relativistic electron wavelength in nm for a high tension ht in kV."""
+    return HC / np.sqrt(ht * (2 * M0C2 + ht))
+
+
+def interaction_constant(ht):
+    """Relativistic factor gamma times wavelength (nm), converting f/area to phase."""
+    return (1 + ht / M0C2) * electron_wavelength(ht)
+
+
+def scattering_factor(symbol, q):
+    """Kirkland electron scattering factor in nm for spatial frequencies q in 1/nm."""
+    if not _form_factors:
+        for row in np.genfromtxt(FORM_FACTOR_FILE, dtype=str, comments='#'):
+            _form_factors[row[0]] = row[1:].astype(float)
+    p = _form_factors[element(symbol)]
+    q2 = (np.asarray(q) / 10)**2        # Parametrization uses 1/Angstrom
+    f = (p[0] / (q2 + p[1]) + p[2] / (q2 + p[3]) + p[4] / (q2 + p[5])
+         + p[6] * np.exp(-p[7] * q2) + p[8] * np.exp(-p[9] * q2)
+         + p[10] * np.exp(-p[11] * q2))
+    return f / 10                       # Angstrom to nm
+
+
+def set_fft_workers(workers):
+    """Number of threads used by each FFT (scipy only; -1 uses all cores)."""
+    if _fft_module is not np.fft:
+        _FFT_KWARGS['workers'] = workers
+
+
+def fft2(array):
+    return _fft_module.fft2(array, axes=(-2, -1), **_FFT_KWARGS)
+
+
+def ifft2(array):
+    return _fft_module.ifft2(array, axes=(-2, -1), **_FFT_KWARGS)
+
+
+def spatial_frequencies(nx, ny, a, b):
+    """Return (qx, qy) frequency grids of shape (ny, nx) in 1/nm."""
+    qx = np.fft.fftfreq(nx, d=a/nx)
+    qy = np.fft.fftfreq(ny, d=b/ny)
+    return np.meshgrid(qx, qy)
+
+
+def bandwidth_mask(nx, ny, a, b):
+    """Anti-aliasing aperture at BANDWIDTH_LIMIT of the Nyquist frequency."""
+    qx, qy = spatial_frequencies(nx, ny, a, b)
+    q_max = BANDWIDTH_LIMIT * min(nx / (2*a), ny / (2*b))
+    return (qx**2 + qy**2) <= q_max**2
+
+
+def slice_indices(structure, nz):
+    """Index of the slice each atom falls in when the cell is cut into nz slices."""
+    z = np.mod(structure.xyz[:, 2], 1.0)
+    return np.minimum((z * nz).astype(int), nz - 1)
+
+
+def atom_b_factors(structure, dwf=True, buni=None):
+    """Per-atom Debye-Waller B (nm^2) following the celslc dwf/buni switches."""
+    if not dwf:
+        return np.zeros(len(structure.symbols))
+    if buni is not None:
+        return np.full(len(structure.symbols), float(buni))
+    return np.asarray(structure.biso, dtype=float)
+
+
+def projected_phase(symbols, xy, occupancy, b_factors, nx, ny, a, b, ht):
+    """
+    Projected phase shift (radians) of a set of atoms on an (ny, nx) grid.
+
+    xy are Cartesian in-plane positions in nm. The structure factor of every
+    (element, B) group is summed in reciprocal space as an outer product of
+    the x and y phase factors, which keeps the cost at one matrix multiply
+    per group instead of one FFT per atom.
+    """
+    qx_1d = np.fft.fftfreq(nx, d=a/nx)
+    qy_1d = np.fft.fftfreq(ny, d=b/ny)
+    qx, qy = np.meshgrid(qx_1d, qy_1d)
+    q2 = qx**2 + qy**2
+    q = np.sqrt(q2)
+    elements = np.array([element(symbol) for symbol in symbols])
+    potential = np.zeros((ny, nx), dtype=complex)
+    form_factors = {}
+    for el, b_value in set(zip(elements, b_factors)):
+        group = (elements == el) & (b_factors == b_value)
+        ex = np.exp(-2j*np.pi * np.outer(xy[group, 0], qx_1d))
+        ey = np.exp(-2j*np.pi * np.outer(xy[group, 1], qy_1d))
+        structure_factor = (ey * occupancy[group, None]).T @ ex
+        if el not in form_factors:
+            form_factors[el] = scattering_factor(el, q)
+        potential += form_factors[el] * np.exp(-b_value * q2 / 4) * structure_factor
+    potential *= bandwidth_mask(nx, ny, a, b)
+    # Discrete inverse transform of the continuous integral over q
+    return interaction_constant(ht) * nx * ny / (a * b) * ifft2(potential).real
+
+
+def transmission_functions(structure, ht, nx, ny, nz, absorb=True, dwf=True,
+                           buni=None, slices=None):
+    """
+    Phase gratings of a structure cut into nz slices along c.
+
+    Returns a complex64 array of shape (len(slices), ny, nx). By default all
+    nz slices are computed; pass a subset of slice indices to build only
+    those (e.g. to stream a thick structure through in chunks).
+    """
+    a, b = structure.cell[0], structure.cell[1]
+    if slices is None:
+        slices = range(nz)
+    atom_slices = slice_indices(structure, nz)
+    xy = np.mod(structure.xyz[:, 0:2], 1.0) * [a, b]
+    b_factors = atom_b_factors(structure, dwf, buni)
+    occupancy = np.asarray(structure.occupancy, dtype=float)
+    symbols = np.asarray(structure.symbols)
+    mask = bandwidth_mask(nx, ny, a, b)
+    absorption = ABSORPTION_RATIO if absorb else 0.0
+    gratings = np.ones((len(slices), ny, nx), dtype=np.complex64)
+    for i, islice in enumerate(slices):
+        in_slice = atom_slices == islice
+        if not np.any(in_slice):
+            continue
+        phase = projected_phase(symbols[in_slice], xy[in_slice], occupancy[in_slice],
+                                b_factors[in_slice], nx, ny, a, b, ht)
+        grating = np.exp((1j - absorption) * phase)
+        gratings[i] = ifft2(fft2(grating) * mask)
+    return gratings
+
+
+def write_transmission_functions(npy_file, structure, ht, nx, ny, nz, absorb=True,
+                                 dwf=True, buni=None, chunk_size=16):
+    """
+    Save all nz phase gratings to a .npy file, chunk_size slices at a time.
+    The file can be read back with np.load(npy_file, mmap_mode='r') and passed
+    straight to multislice().
+    """
+    gratings = np.lib.format.open_memmap(npy_file, mode='w+', dtype=np.complex64,
+                                         shape=(nz, ny, nx))
+    for start in range(0, nz, chunk_size):
+        slices = range(start, min(start + chunk_size, nz))
+        gratings[start:slices.stop] = transmission_functions(structure, ht, nx, ny, nz,
+                                                             absorb, dwf, buni, slices)
+    gratings.flush()
+    del gratings
+
+
+def propagator(nx, ny, a, b, dz, ht, tilt=(0, 0)):
+    """Fresnel propagator over a slice of thickness dz (nm), tilt in degrees."""
+    wavelength = electron_wavelength(ht)
+    qx, qy = spatial_frequencies(nx, ny, a, b)
+    tx, ty = np.tan(np.radians(tilt))
+    kernel = np.exp(-1j*np.pi * wavelength * dz * (qx**2 + qy**2)
+                    + 2j*np.pi * dz * (qx * tx + qy * ty))
+    return (kernel * bandwidth_mask(nx, ny, a, b)).astype(np.complex64)
+
+
+def multislice(wave, gratings, kernel):
+    """
+    Propagate wave through a stack of phase gratings.
+
+    wave may carry leading batch dimensions (..., ny, nx); every FFT then
+    acts on the whole batch at once.
+    """
+    for grating in gratings:
+        wave = ifft2(fft2(wave * grating) * kernel).astype(np.complex64)
+    return wave
+
+
+def plane_wave(nx, ny, batch=()):
+    return np.ones(tuple(batch) + (ny, nx), dtype=np.complex64)
+
+
+def exit_wave(structure, ht, nx, ny, nz, absorb=True, dwf=True, buni=None,
+              tilt=(0, 0), chunk_size=16, wave=None):
+    """
+    Exit-plane wavefunction of a structure, the in-memory equivalent of
+    celslc followed by msa. Slices are built and consumed chunk_size at a time
+    so that only a few phase gratings are held in memory.
+    """
+    a, b, c = structure.cell[0:3]
+    kernel = propagator(nx, ny, a, b, c/nz, ht, tilt)
+    if wave is None:
+        wave = plane_wave(nx, ny)
+    for start in range(0, nz, chunk_size):
+        slices = range(start, min(start + chunk_size, nz))
+        gratings = transmission_functions(structure, ht, nx, ny, nz,
+                                          absorb, dwf, buni, slices)
+        wave = multislice(wave, gratings, kernel)
+    return wave
+
+
+def aberration_function(q, wavelength, c1=0.0, c3=0.0, c5=0.0):
+    """Round-aberration phase chi(q) for C1, C3 and C5 in nm."""
+    lq = wavelength * q
+    return 2*np.pi / wavelength * (c1 * lq**2 / 2 + c3 * lq**4 / 4 + c5 * lq**6 / 6)
+
+
+def round_aberrations(aberrations_dict, defocus=None):
+    """Pull (C1, C3, C5) in nm out of a Dr. Probe aberrations dictionary."""
+    supported = {1: 'c1', 5: 'c3', 11: 'c5'}
+    values = {'c1': 0.0, 'c3': 0.0, 'c5': 0.0}
+    for index, (x, y) in aberrations_dict.items():
+        if index in supported:
+            values[supported[index]] = x
+        elif x != 0 or y != 0:
+            raise ValueError(f'Aberration index {index} is not supported by the NumPy backend')
+    if defocus is not None:
+        values['c1'] = defocus
+    return values
+
+
+def wavimg_settings(wav_prm):
+    """
+    Imaging settings of a drprobe WavimgPrm object as keyword arguments for
+    image_from_wave(). Switched-off effects (flag 0) are returned as zero.
+    """
+    temp_flag, focus_spread = wav_prm.temp_coherence
+    spat_flag, convergence = wav_prm.spat_coherence
+    vib_flag, vib_x, vib_y, vib_angle = wav_prm.vibration
+    return {'ht': wav_prm.high_tension,
+            'sampling': tuple(wav_prm.wave_sampling),
+            'aberrations': dict(wav_prm.aberrations_dict),
+            'focus_spread': focus_spread if temp_flag else 0.0,
+            'convergence': convergence if spat_flag else 0.0,
+            'vibration': (vib_x, vib_y, vib_angle) if vib_flag else (0.0, 0.0, 0.0),
+            'oa_radius': wav_prm.oa_radius}
+
+
+def image_from_wave(wave, sampling, ht, aberrations, defocus=None,
+                    focus_spread=0.0, convergence=0.0, vibration=(0.0, 0.0, 0.0),
+                    oa_radius=None):
+    """
+    TEM image intensity of an exit wave, the in-memory equivalent of wavimg.
+
+    sampling is the (x, y) pixel size in nm, focus_spread the focal spread in
+    nm, convergence the beam convergence semi-angle in mrad, vibration the
+    (x, y, angle) image vibration amplitudes in nm and degrees and oa_radius
+    the objective aperture radius in mrad. defocus (nm) overrides the C1 entry
+    of aberrations, in the same way as the foc argument of wavimg.
+    """
+    coefficients = round_aberrations(aberrations, defocus)
+    return images_from_spectrum(fft2(wave), sampling, ht,
+                                [coefficients['c1']], [coefficients['c3']],
+                                [coefficients['c5']], focus_spread, convergence,
+                                vibration, oa_radius)[0]
+
+
+def images_from_spectrum(wave_ft, sampling, ht, c1, c3, c5, focus_spread=0.0,
+                         convergence=0.0, vibration=(0.0, 0.0, 0.0), oa_radius=None):
+    """
+    Image intensities for several aberration settings of one exit wave.
+
+    wave_ft is the Fourier transform of the exit wave, and c1, c3 and c5 are
+    equally long sequences of aberration values in nm. All settings are
+    evaluated with one batched transfer-function product and inverse FFT, and
+    an array of shape (len(c1), ny, nx) is returned. The remaining arguments
+    are the same as for image_from_wave().
+    """
+    ny, nx = wave_ft.shape[-2:]
+    a, b = nx * sampling[0], ny * sampling[1]
+    wavelength = electron_wavelength(ht)
+    c1, c3, c5 = (np.asarray(values, dtype=float).reshape(-1, 1, 1) for values in (c1, c3, c5))
+    qx, qy = spatial_frequencies(nx, ny, a, b)
+    q = np.sqrt(qx**2 + qy**2)
+    chi = aberration_function(q, wavelength, c1, c3, c5)
+    # Quasi-coherent envelopes for focal spread and beam convergence
+    gradient = c1 * wavelength * q + c3 * wavelength**3 * q**3 + c5 * wavelength**5 * q**5
+    envelope = (np.exp(-0.5 * (np.pi * wavelength * focus_spread * q**2)**2)
+                * np.exp(-(np.pi * convergence * 1e-3 / wavelength * gradient)**2))
+    if oa_radius is not None:
+        envelope = envelope * (q * wavelength <= oa_radius * 1e-3)
+    image_wave = ifft2(wave_ft * envelope * np.exp(-1j * chi))
+    intensity = np.abs(image_wave)**2
+    # Gaussian image vibration acts on the intensity spectrum
+    vib_x, vib_y, vib_angle = vibration
+    if vib_x or vib_y:
+        cos, sin = np.cos(np.radians(vib_angle)), np.sin(np.radians(vib_angle))
+        qu, qv = qx * cos + qy * sin, -qx * sin + qy * cos
+        damping = np.exp(-2 * np.pi**2 * ((vib_x * qu)**2 + (vib_y * qv)**2))
+        intensity = ifft2(fft2(intensity) * damping).real
+    return intensity.astype(np.float32)
+
+
+def write_dat(dat_file, image):
+    """Write an image as raw float32, the format wavimg uses for .dat files."""
+    np.ascontiguousarray(image, dtype=np.float32).tofile(dat_file)
+
+
+def write_wav(wav_file, wave):
+    """Write a wavefunction as raw complex64, the format msa uses for .wav files."""
+    np.ascontiguousarray(wave, dtype=np.complex64).tofile(wav_file)
+
+
+def read_wav(wav_file, nx, ny):
+    """Read a raw complex64 .wav file written by msa or write_wav()."""
+    return np.fromfile(wav_file, dtype=np.complex64).reshape((ny, nx))
+
+
+def compare_images(image, reference):
+    """
+    Differences between an image and a reference image.
+
+    Returns a dictionary with the RMS difference relative to the reference
+    contrast ('rms_error'), the largest absolute difference ('max_abs_error')
+    and the normalized cross-correlation ('correlation').
+    """
+    image = np.asarray(image, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    difference = image - reference
+    contrast = reference.std() if reference.std() > 0 else 1.0
+    image_centered = image - image.mean()
+    reference_centered = reference - reference.mean()
+    norm = np.sqrt(np.sum(image_centered**2) * np.sum(reference_centered**2))
+    return {'rms_error': float(np.sqrt(np.mean(difference**2)) / contrast),
+            'max_abs_error': float(np.abs(difference).max()),
+            'correlation': float(np.sum(image_centered * reference_centered) / norm)
+                           if norm > 0 else 1.0}
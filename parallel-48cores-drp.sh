@@ -18,4 +18,15 @@ module purge
 module load anaconda/py3 drprobe/1.0
 
 # Peform Multi-slice calculations
-parallel -kj $SLURM_CPUS_ON_NODE python /home/rmanzorr/MSpar_Sim/code/MS_Sims_single_1024x1024.py ::: /home/rmanzorr/MSpar_Sim/input/models/3nm/04x/Pt*.cel
\ No newline at end of file
+# Previous approach: one Python interpreter per .cel file through GNU parallel
+# parallel -kj $SLURM_CPUS_ON_NODE python /home/rmanzorr/MSpar_Sim/code/MS_Sims_single_1024x1024.py ::: /home/rmanzorr/MSpar_Sim/input/models/3nm/04x/Pt*.cel
+
+# Persistent worker pool. Re-submitting the job after a time-out resumes from the manifest in the output directory.
+SIM_DIR=/home/rmanzorr/MSpar_Sim
+python $SIM_DIR/code/batch_runner.py "$SIM_DIR/input/models/3nm/04x/Pt*.cel" \
+    $SIM_DIR/output/3nm/04x $SIM_DIR/output/3nm/04x_clean $SIM_DIR/output/3nm/04x_noisy \
+    --msa-prm $SIM_DIR/input/prm/MsaPrm_1024x1024.prm \
+    --wav-prm $SIM_DIR/input/prm/WavPrm_1024x1024.prm \
+    --settings $SIM_DIR/input/prm/settings_1024x1024.json \
+    --jobs $SLURM_CPUS_ON_NODE --threads 1 \
+    --scratch ${TMPDIR:-/tmp}/batch_runner_$SLURM_JOB_ID
\ No newline at end of file
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Stage-level benchmark of the simulation pipeline.
+
+Synthetic .cel structures are generated over a grid of atom counts, image
+sizes (nx = ny) and numbers of slices, and every structure is pushed through
+the stages of multislice_pipeline.py one at a time:
+
+    prepare (cellmuncher / copy), slice (celslc), propagate (msa),
+    cleanup (rmtree of the slices), image (wavimg or the numpy defocus
+    series), load (.dat reload), write_clean (.dat and clean TIFF encoding),
+    write_noise (noise realizations and noisy TIFF encoding)
+
+For every stage the wall time, the peak resident memory of this process
+(sampled while the stage runs) and the bytes written (net growth of the
+output directories; negative for the clean-up) are recorded to a JSON file.
+The peak memory of the Dr. Probe subprocesses can only be read as a maximum
+over all finished subprocesses, so it is recorded once for the whole run.
+
+The default grid stops at 1024 x 1024 pixels. Larger sizes are opt-in
+through --sizes: at 2048 x 2048 pixels and 200 slices the phase gratings
+alone take about 6.7 GB of scratch space.
+
+A stored baseline can be given with --baseline; stages whose time or memory
+grew by more than the tolerance are listed as regressions and the script
+exits with status 1, so it can guard performance changes in a job script.
+
+The 'drprobe' backend is used when the drprobe package and the celslc
+program are available. Otherwise the in-memory NumPy engine
+(numpy_multislice.py) stands in for the Dr. Probe programs, with parameter
+objects built from the same settings as section 1.3 of the time-series
+script.
+
+Usage:
+    python pipeline_benchmark.py results.json [--atoms 500 5000]
+        [--sizes 256 512 1024] [--nz 50 200] [--backend auto]
+        [--baseline baseline.json] [--tolerance 0.2]
+
+The 'numpy' and 'PIL' packages are required; 'psutil' is used for memory
+sampling where /proc is not available.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+import numpy as np
+import numpy_multislice as nms
+import multislice_pipeline as pipeline
+from slice_cache import directory_size
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+## Interval between memory samples, in seconds
+RSS_SAMPLE_INTERVAL = 0.005
+
+STAGES = ['prepare', 'slice', 'propagate', 'cleanup', 'image', 'load', 'write_clean',
+          'write_noise']
+
+## Default image sizes (nx = ny)
+DEFAULT_SIZES = [256, 512, 1024]
+
+
+def current_rss():
+    """Resident memory of this process in bytes."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+
+def children_peak_rss():
+    """
+    Peak resident memory in bytes of the largest subprocess finished so far
+    (0 if unknown). It never decreases, so it cannot be split by stage.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PeakMemory:
+    """Context manager sampling the peak resident memory of this process in a thread."""
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        return False
+
+
+def synthetic_cel(cel_file, n_atoms, cell=(5.0, 5.0, 5.0), element='Pt', biso=0.005, seed=0):
+    """Write a .cel file of n_atoms atoms at random positions in a cell (nm)."""
+    rng = np.random.default_rng(seed)
+    structure = nms.CelStructure(f'synthetic {n_atoms} {element} atoms',
+                                 tuple(cell) + (90.0, 90.0, 90.0), [element] * n_atoms,
+                                 rng.random((n_atoms, 3)), np.ones(n_atoms),
+                                 np.full(n_atoms, biso))
+    nms.write_cel(cel_file, structure)
+
+
+def benchmark_parameters(cell, nx, ny, nz, ht=300, backend='drprobe'):
+    """
+    General MSA and WavImg parameter objects of a benchmark case, set up as
+    in section 1.3 of the time-series script. Without drprobe, plain
+    namespaces with the same attributes are returned for the NumPy backend.
+    """
+    a, b = cell[0], cell[1]
+    if backend == 'drprobe':
+        msa_prm, wav_prm = pipeline.drp.msaprm.MsaPrm(), pipeline.drp.wavimgprm.WavimgPrm()
+    else:
+        msa_prm, wav_prm = types.SimpleNamespace(), types.SimpleNamespace()
+    msa_prm.wavelength = nms.electron_wavelength(ht)
+    msa_prm.focus_spread = 4
+    msa_prm.h_scan_frame_size, msa_prm.v_scan_frame_size = a, b
+    msa_prm.tilt_x, msa_prm.tilt_y = 2, -1
+    msa_prm.scan_columns, msa_prm.scan_rows = nx, ny
+    msa_prm.temp_coherence_flag, msa_prm.spat_coherence_flag = 0, 0
+    msa_prm.slice_files = ''
+    msa_prm.number_of_slices = msa_prm.tot_number_of_slices = nz
+    msa_prm.det_readout_period = 0
+    msa_prm.aberrations_dict = {1: (0, 0), 5: (-9000, 0), 11: (5000000, 0)}
+
+    wav_prm.high_tension = ht
+    wav_prm.wave_dim = wav_prm.output_dim = (nx, ny)
+    wav_prm.wave_sampling = (a/nx, b/ny)
+    wav_prm.output_format = 0
+    wav_prm.coherence_model = 1
+    wav_prm.temp_coherence = (1, 4)
+    wav_prm.spat_coherence = (1, 0.2)
+    wav_prm.mtf = (0, 1, '')
+    wav_prm.vibration = (1, 0.05, 0.05, 0)
+    wav_prm.oa_radius = 250
+    wav_prm.aberrations_dict = {1: (0, 0), 5: (-9000, 0), 11: (5000000, 0)}
+    return msa_prm, wav_prm
+
+
+def select_backend(backend='auto'):
+    """'drprobe' if the package and the celslc program are available, otherwise 'numpy'."""
+    if backend != 'auto':
+        return backend
+    if pipeline.drp is not None and shutil.which('celslc') is not None:
+        return 'drprobe'
+    return 'numpy'
+
+
+def run_case(work_dir, n_atoms, nx, nz, settings, cell=(5.0, 5.0, 5.0), seed=0):
+    """Run the stages of one synthetic structure; returns {stage: measurements}."""
+    settings = dict(pipeline.DEFAULT_SETTINGS, **settings)
+    settings.update(nx=nx, ny=nx, nz=nz)
+    input_dir = os.path.join(work_dir, 'cel')
+    output_dir = os.path.join(work_dir, 'output')
+    clean_image_dir = os.path.join(work_dir, 'clean')
+    noisy_image_dir = os.path.join(work_dir, 'noisy')
+    for directory in (input_dir, output_dir, clean_image_dir, noisy_image_dir):
+        os.makedirs(directory, exist_ok=True)
+    cel_path = os.path.join(input_dir, f'synthetic_{n_atoms}atoms.cel')
+    synthetic_cel(cel_path, n_atoms, cell, seed=seed)
+    msa_prm, wav_prm = benchmark_parameters(cell, nx, nx, nz, settings['ht'], settings['backend'])
+
+    job = {}
+    stage_functions = {
+        'prepare': lambda: job.update(pipeline.prepare_stage(
+            cel_path, output_dir, clean_image_dir, noisy_image_dir, msa_prm, wav_prm, settings)),
+        # The numpy gratings go to disk so that slicing and clean-up are measured
+        'slice': lambda: pipeline.slice_stage(job, slices_to_disk=True),
+        'propagate': lambda: pipeline.propagate_stage(job),
+        'cleanup': lambda: pipeline.cleanup_stage(job),
+        'image': lambda: pipeline.calculate_images(job),
+        'load': lambda: pipeline.load_images(job),
+        'write_clean': lambda: pipeline.write_clean_images(job),
+        'write_noise': lambda: pipeline.write_noisy_images(job)}
+
+    measurements = {}
+    for stage in STAGES:
+        size_before = directory_size(work_dir)
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            stage_functions[stage]()
+            wall_time = time.perf_counter() - start
+        measurements[stage] = {'wall_s': wall_time,
+                               'peak_rss_mb': memory.peak / 2**20,
+                               'bytes_written': directory_size(work_dir) - size_before}
+    return measurements
+
+
+def run_benchmark(atom_counts, sizes, slice_counts, backend='auto', repeats=1,
+                  scratch=None, settings=None, cell=(5.0, 5.0, 5.0)):
+    """
+    Benchmark every (atoms, nx = ny, nz) combination. Each case is run
+    repeats times; the fastest wall time and the largest memory of every
+    stage are kept. Returns the results dictionary written to JSON.
+    """
+    backend = select_backend(backend)
+    settings = dict(settings or {}, backend=backend, output=False)
+    results = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+               'host': platform.node(), 'platform': platform.platform(),
+               'cpu_count': os.cpu_count(), 'backend': backend, 'cases': []}
+    for n_atoms, nx, nz in itertools.product(atom_counts, sizes, slice_counts):
+        stages = {}
+        for repeat in range(repeats):
+            work_dir = tempfile.mkdtemp(prefix='benchmark-', dir=scratch)
+            try:
+                measurements = run_case(work_dir, n_atoms, nx, nz, settings, cell, seed=repeat)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            for stage, values in measurements.items():
+                if stage not in stages:
+                    stages[stage] = values
+                    continue
+                stages[stage]['wall_s'] = min(stages[stage]['wall_s'], values['wall_s'])
+                stages[stage]['peak_rss_mb'] = max(stages[stage]['peak_rss_mb'],
+                                                   values['peak_rss_mb'])
+        case = {'name': case_name(n_atoms, nx, nz), 'atoms': n_atoms, 'nx': nx, 'ny': nx,
+                'nz': nz, 'stages': stages,
+                'total_wall_s': sum(values['wall_s'] for values in stages.values())}
+        print(f"{case['name']}: " + ', '.join(f"{stage} {values['wall_s']:.3f} s"
+                                             for stage, values in stages.items()))
+        results['cases'].append(case)
+    # Largest Dr. Probe subprocess of the whole run
+    results['children_peak_rss_mb'] = children_peak_rss() / 2**20
+    return results
+
+
+def case_name(n_atoms, nx, nz):
+    return f'{n_atoms}atoms_{nx}x{nx}_{nz}slc'
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2, min_seconds=0.05):
+    """
+    Stages of results that are slower or use more memory than in baseline by
+    more than the relative tolerance. Time differences below min_seconds are
+    ignored as noise. Returns a list of (case, stage, quantity, baseline, current).
+    """
+    baseline_cases = {case['name']: case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        if case['name'] not in baseline_cases:
+            continue
+        for stage, values in case['stages'].items():
+            reference = baseline_cases[case['name']]['stages'].get(stage)
+            if reference is None:
+                continue
+            if (values['wall_s'] > (1 + tolerance) * reference['wall_s']
+                    and values['wall_s'] - reference['wall_s'] > min_seconds):
+                regressions.append((case['name'], stage, 'wall_s',
+                                    reference['wall_s'], values['wall_s']))
+            if values['peak_rss_mb'] > (1 + tolerance) * reference['peak_rss_mb']:
+                regressions.append((case['name'], stage, 'peak_rss_mb',
+                                    reference['peak_rss_mb'], values['peak_rss_mb']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the simulation pipeline stage by stage.')
+    parser.add_argument('results', help='.json file the results are written to')
+    parser.add_argument('--atoms', type=int, nargs='+', default=[500, 5000])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Image sizes nx = ny (2048 at 200 slices needs about 6.7 GB of scratch)')
+    parser.add_argument('--nz', type=int, nargs='+', default=[50, 200], help='Numbers of slices')
+    parser.add_argument('--cell', type=float, nargs=3, default=(5.0, 5.0, 5.0),
+                        help='Synthetic cell dimensions in nm')
+    parser.add_argument('--backend', choices=['auto', 'drprobe', 'numpy'], default='auto')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--scratch', default=None, help='Directory for the temporary output')
+    parser.add_argument('--settings', help='.json file with multislice_pipeline settings')
+    parser.add_argument('--baseline', help='Earlier results .json file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative increase of time and memory')
+    args = parser.parse_args()
+
+    settings = {}
+    if args.settings:
+        with open(args.settings, 'r') as f:
+            settings = json.load(f)
+    results = run_benchmark(args.atoms, args.sizes, args.nz, args.backend, args.repeats,
+                            args.scratch, settings, args.cell)
+    with open(args.results, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for name, stage, quantity, reference, current in regressions:
+            print(f'REGRESSION {name} {stage}: {quantity} {reference:.3f} -> {current:.3f}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
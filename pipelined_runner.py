@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Pipelined execution of the per-structure simulation stages.
+
+In the time-series script every structure goes through cel back-up,
+slicing, multislice propagation, imaging and file output one after another,
+so CPU-heavy and I/O-heavy stages never overlap. Here each stage of
+multislice_pipeline.py runs in its own thread(s) and the structures flow
+through bounded queues:
+
+    prepare -> slice -> propagate (+ slice clean-up) -> image -> write (I/O pool)
+
+While structure N is propagating, structure N+1 is being sliced and the
+images of structure N-1 are encoded and written by an I/O thread pool. The
+Dr. Probe programs run as subprocesses and numpy releases the GIL in its
+FFTs and matrix products, so threads are sufficient to keep the cores busy.
+
+The slice files of a structure are deleted as soon as its propagation is
+done, or when its slicing or propagation fails. The numpy backend keeps the
+phase gratings in memory instead (nz * ny * nx * 8 bytes per structure)
+and hands them from the slice to the propagate stage. At most max_sliced
+structures can be sliced but not yet propagated, which bounds the disk (or
+memory) used by slices to about (max_sliced + number of propagate workers +
+number of slice workers) structures.
+
+The incremental mode is not available here because it needs the frames in
+strict order.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import multislice_pipeline as pipeline
+
+## Marks the end of the structure stream in a queue
+_DONE = object()
+
+
+class _Stage:
+    """Worker threads that apply function to jobs from inbox and pass them to outbox."""
+
+    def __init__(self, name, function, inbox, outbox, n_workers, failures):
+        self.name, self.function = name, function
+        self.inbox, self.outbox = inbox, outbox
+        self.failures = failures
+        self.remaining = n_workers
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self.run, name=f'{name}-{i}', daemon=True)
+                        for i in range(n_workers)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def run(self):
+        while True:
+            job = self.inbox.get()
+            if job is _DONE:
+                # Let the sibling workers see the end marker too
+                self.inbox.put(_DONE)
+                with self.lock:
+                    self.remaining -= 1
+                    if self.remaining == 0:
+                        self.outbox.put(_DONE)
+                return
+            try:
+                job = self.function(job)
+            except Exception:
+                name = job['structure_name'] if isinstance(job, dict) else str(job)
+                self.failures.append((name, self.name, traceback.format_exc()))
+                print(f'{name}: {self.name} stage failed')
+                continue
+            self.outbox.put(job)
+
+
+def run_pipelined(cel_files, output_dir, clean_image_dir, noisy_image_dir,
+                  msa_prm_gen, wav_prm_gen, settings, slice_cache=None,
+                  noise_writer=None, container=None, slice_workers=1, propagate_workers=1,
+                  image_workers=1, io_workers=4, max_sliced=1, queue_size=2):
+    """
+    Simulate cel_files with overlapping stages.
+
+    The arguments are those of multislice_pipeline.simulate_structure plus
+    the number of threads per stage, the number of sliced-but-not-propagated
+    structures allowed (max_sliced) and the size of the other queues.
+    Returns (list of finished structure names, list of (structure, stage, traceback)).
+    """
+    failures = []
+    finished = []
+    sources = queue.Queue(maxsize=queue_size)
+    prepared = queue.Queue(maxsize=queue_size)
+    # Structures with slice files on disk that are waiting for propagation
+    sliced = queue.Queue(maxsize=max_sliced)
+    propagated = queue.Queue(maxsize=queue_size)
+    imaged = queue.Queue(maxsize=queue_size)
+
+    def prepare(cel_path):
+        return pipeline.prepare_stage(cel_path, output_dir, clean_image_dir, noisy_image_dir,
+                                      msa_prm_gen, wav_prm_gen, settings, container)
+
+    def slice_job(job):
+        try:
+            pipeline.slice_stage(job, slice_cache, slices_in_memory=True)
+        except Exception:
+            # The job does not reach the propagate stage, which would clean up
+            pipeline.cleanup_stage(job)
+            raise
+        return job
+
+    def propagate(job):
+        try:
+            pipeline.propagate_stage(job)
+        finally:
+            pipeline.cleanup_stage(job)
+        return job
+
+    def image(job):
+        pipeline.image_stage(job)
+        return job
+
+    stages = [_Stage('prepare', prepare, sources, prepared, 1, failures),
+              _Stage('slice', slice_job, prepared, sliced, slice_workers, failures),
+              _Stage('propagate', propagate, sliced, propagated, propagate_workers, failures),
+              _Stage('image', image, propagated, imaged, image_workers, failures)]
+    for stage in stages:
+        stage.start()
+
+    def feed():
+        for cel_file in cel_files:
+            sources.put(cel_file)
+        sources.put(_DONE)
+    feeder = threading.Thread(target=feed, name='feed', daemon=True)
+    feeder.start()
+
+    # Limits the images held in memory while waiting for an I/O thread
+    pending_writes = threading.BoundedSemaphore(2 * io_workers)
+
+    def write(job):
+        try:
+            pipeline.write_stage(job, noise_writer, container)
+            finished.append(job['structure_name'])
+        except Exception:
+            failures.append((job['structure_name'], 'write', traceback.format_exc()))
+            print(f"{job['structure_name']}: write stage failed")
+        finally:
+            pending_writes.release()
+
+    # TIFF encoding and noise writes go to the I/O thread pool
+    with ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='write') as io_pool:
+        while True:
+            job = imaged.get()
+            if job is _DONE:
+                break
+            pending_writes.acquire()
+            io_pool.submit(write, job)
+    feeder.join()
+    return finished, failures
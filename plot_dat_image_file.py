@@ -4,16 +4,20 @@ Created on Tue Nov  3 10:03:19 2020
 
 View .dat file from DrProbe simulations
 
+The image dimensions are inferred from the file name or file size
+(see dat_stack_viewer.py, which also views whole directories of .dat files).
+
 @author: Josh
 """
 
 import numpy as np
 import matplotlib.pyplot as plt
+from dat_stack_viewer import infer_dimensions
 
 image_file = r'C:\Users\Josh\Downloads\image.dat'
 
-nx = ny = 512
+nx, ny = infer_dimensions(image_file)
 
-img = np.fromfile(image_file, dtype=np.single).reshape((nx,ny))
+img = np.fromfile(image_file, dtype=np.single).reshape((ny, nx))
 
 plt.imshow(img, cmap='gray', vmin=0.8, vmax=1.2)
\ No newline at end of file
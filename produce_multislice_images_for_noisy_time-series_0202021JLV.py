@@ -11,11 +11,15 @@ Created on Fri Jan 22 12:23:00 2021
 import drprobe as drp
 import numpy as np
 import os
-import shutil
 import sys
-from PIL import Image
 from random import randint
 from tkinter import filedialog
+from slice_cache import SliceCache
+from incremental_time_series import IncrementalSimulator
+from noise_realizations import NoiseStackWriter
+from multislice_pipeline import simulate_structure, read_sampling
+from pipelined_runner import run_pipelined
+from series_container import SeriesWriter
 
 # Initialize constant parameters
 ht = 300;                   # High tension is 300 kV
@@ -27,6 +31,50 @@ output = True;              # Give chatty output during simulations
 Cs = -9000                 # Cs = -9 um
 C5 = 5000000                # C5 = 5 mm
 
+# Sampling file written by convergence_optimizer.py for a representative structure.
+# If given, nx, ny and nz above are replaced by the cheapest converged values.
+sampling_file = None
+if sampling_file is not None:
+    nx, ny, nz = read_sampling(sampling_file)
+
+# Simulation backend. 'drprobe' runs celslc, msa and wavimg as external programs,
+# 'numpy' runs the in-process engine in numpy_multislice.py without writing
+# slices or wavefunctions to disk.
+backend = 'drprobe'
+# If True, every numpy image is also simulated with drprobe and compared.
+# A warning is printed when the contrast-normalized RMS error exceeds the tolerance.
+validate_backend = False
+validation_tolerance = 0.05
+
+# Directory of the content-addressed slice cache. Structures that were already
+# sliced with the same ht, nx, ny, nz, absorb, dwf and buni are not sliced again.
+# Set to None to slice every structure into its own slc directory and delete it afterwards.
+slice_cache_dir = None
+slice_cache_budget = 200e9  # Disk budget of the slice cache in bytes (least recently used entries are evicted)
+
+# Incremental mode (numpy backend only). Structures are simulated in file name order
+# and only the slices whose atoms changed since the previous structure are rebuilt.
+# Propagation restarts from the stored wavefunction every checkpoint_interval slices.
+incremental = False
+checkpoint_interval = 10
+
+# Frozen-phonon averaging (numpy backend only). Every structure is simulated with
+# frozen_phonons randomly displaced configurations (mean square displacement B/(8 pi^2)
+# per direction, B = buni) and the images are averaged. 0 uses the static structure.
+frozen_phonons = 0
+phonon_workers = 2          # Configurations simulated at the same time
+
+# If True, the drprobe exit wave is loaded once and the whole defocus series is
+# calculated in one batched array operation instead of one wavimg call per defocus.
+# The numpy backend always does this.
+vectorized_imaging = False
+
+# If True, the stages of consecutive structures overlap (slicing N+1 while N propagates
+# and N-1 is written by an I/O thread pool). Not combined with the incremental mode.
+pipelined = False
+io_workers = 4              # Threads encoding and writing TIFF files
+max_sliced = 1              # Structures allowed to wait with slice files on disk
+
 #%% 1.2) Specify input and output directories
 
 # Input directory containing .cel files to be simulated
@@ -55,8 +103,25 @@ defoci = [8]
 
 # Range of vacuum levels in terms of electron counts
 vac_levels = [1, 4, 16]
-for vac_level in vac_levels:
-    os.mkdir(os.path.join(noisy_image_dir, f'vac_int-{vac_level:02d}counts'))
+
+# Number of noise realizations per image and vacuum level, and the base seed from
+# which a seed for every structure, defocus and vacuum level is derived
+n_realizations = 1
+noise_seed = 20210122
+
+# If True, all noisy frames of a vacuum level are written to one multi-frame
+# stack (vac_int-XXcounts.tif with a _frames.csv index) instead of single files
+stack_noisy_images = False
+if stack_noisy_images:
+    noise_writer = NoiseStackWriter(noisy_image_dir, vac_levels,
+                                    n_realizations=n_realizations, base_seed=noise_seed)
+
+# If True, all clean images, noise realizations and parameters of the series are
+# written to one compressed HDF5 file (series.h5 in the output directory, needs h5py)
+# instead of .dat and .tif files. Exit waves are added as complex64 or float16
+# when container_wave_dtype is set, otherwise left out (None).
+series_container = False
+container_wave_dtype = None
 
 # Read lattice parameters from cel file
 a, b, c = np.genfromtxt(r'G:\SimMovies\data\raw\atom_hopping_RhCeO2_20210122\seq_structures_cel\RhCeO2_seq0000_adatom_CN-5.cel', skip_header=1, skip_footer=1, usecols=(1, 2, 3))[0]
@@ -120,129 +185,64 @@ wav_prm_gen.load_wav_prm(os.path.normpath(filedialog.askopenfilename()))
 
 #%% 2) Perform Image Simulations
 
-# For every structure in the input directory
-for cel_file in os.listdir(input_dir):
-   
-    ## Set-up parent directory for this structure
-    # Remove the file extension to isolate the structure name
-    structure_name = cel_file[:-4]
-    # Name of directory for this structure, to be within the output directory
-    structure_dir = os.path.join(output_dir, structure_name)     
-    # Create structure's directory with name specified above       
-    os.mkdir(structure_dir)
-
-    ## 2.1) Create back-up of cel file in output directory
-    
-    # Set-up cel sub-directory
-    structure_cel_dir = os.path.join(structure_dir, 'cel')
-    # Create cel directory with name specified above
-    os.mkdir(structure_cel_dir)
-    # Name of full directory to original cel file
-    cel_original = r'"{}"'.format(os.path.join(input_dir, cel_file))
-    # The r'"{}"' formatting is necessary to enclose the path in double quotes.
-    cel_copy = r'"{}"'.format(os.path.join(structure_cel_dir, cel_file))
-    # Create back-up cel in back-up directory
-    drp.commands.cellmuncher(cel_original, cel_copy, output=True)                                      
-    
-    ## 2.2) Slice cel and save slices in \slc directory
-    # Set-up slice sub-directory
-    structure_slc_dir = os.path.join(structure_dir, 'slc')
-    os.mkdir(structure_slc_dir)
-    slice_name = structure_name + '_slc'
-    slice_path_and_name = os.path.join(structure_slc_dir,slice_name)
-    
-    # Slice cel and save slices in the slice directory
-    drp.commands.celslc(cel_original, slice_path_and_name,                      
-                        ht, nx, ny, nz, 
-                        absorb=absorb, dwf=dwf, buni=buni, 
-                        output=True)
-    
-    
-    ## 2.3) Perform multislice simulation
-    # Parameter initialization
-    # Set up name of parameter (or 'prm') sub-directory for this structure
-    structure_prm_dir = os.path.join(structure_dir, 'prm')
-    # Create parameter directory with name specified above
-    os.mkdir(structure_prm_dir)
-    # Load general parameter file to be edited
-    msa_prm = msa_prm_gen
-    # Specify location of phase gratings generated in section 2.2
-    msa_prm.slice_files = slice_path_and_name
-    # Name the MSA parameter file to be saved
-    msa_prm_name = 'MsaPrm_'+structure_name+'.prm'
-    # Path location to where the MSA parameter file should be saved 
-    msa_prm_path_and_name = os.path.join(structure_prm_dir, msa_prm_name)
-    # Save the parameter file with the slice locations
-    msa_prm.save_msa_prm(msa_prm_path_and_name)
-    
-    ## Set-up wave function sub-directory
-    # Set up name of wave function (or 'wav') sub-directory for this structure
-    structure_wav_dir = os.path.join(structure_dir, 'wav')
-    # Create wave function directory with name specified above
-    os.mkdir(structure_wav_dir)
-    # Specify name (and path) of output wavefunction
-    wav_path = os.path.join(structure_wav_dir,structure_name)
-    
-    # Calculate exit surface wavefunction and save it in wav_path
-    drp.commands.msa(msa_prm_path_and_name, wav_path,
-                     ctem = True, output = True, 
-                     silent = False)
-    
-    
-    ## 2.4) Generate simulated images
-    # Parameter initialization
-    # Load general wav parameter file for image simulation
-    wav_prm = wav_prm_gen
-    # Name of wave file and location after full multislice simulation
-    wav_prm.wave_files = wav_path + '_sl' + f'{nz:03d}' + '.wav'
-    # Set name of wave paramter file
-    wav_prm_name = 'WavPrm_'+structure_name+'.prm'
-    # Path location to where the wav parameter file should be saved
-    wav_prm_path_and_name = os.path.join(structure_prm_dir, wav_prm_name)
-    # Save the parameter file with the slice locations
-    wav_prm.save_wavimg_prm(wav_prm_path_and_name)
-    
-    ## Set-up image sub-directory
-    # Set up name of image (or 'img') sub-directory for this structure
-    structure_img_dir = os.path.join(structure_dir, 'img')                     
-    # Create image  directory with name specified above
-    os.mkdir(structure_img_dir)
-    
-    # Simulate images
-    for defocus in defoci:
-            # Specify name (img_name) of path (output_img) of output image
-            img_name = structure_name+'_'+str(nz)+'slc_'+str(nx)+'x'+str(ny)+'_'+str(defocus)+'nmDefocus'+'.dat'
-            output_img = os.path.join(structure_img_dir,img_name)
-            
-            # Calculate image
-            drp.commands.wavimg(wav_prm_path_and_name, output_img, 
-                                foc = defocus,
-                                sil = False, output=True)
-            
-            # Save the clean image as a tif file
-            clean_img_array = np.fromfile(output_img, dtype=np.single).reshape((nx, ny))
-            clean_img_array = np.flip(clean_img_array,0)
-            clean_img = Image.fromarray(clean_img_array) 
-            clean_img.save(os.path.join(clean_image_dir, img_name[:-4] + '.tif'))
-            
-            # Save a noise realizations of the image
-            for vac_level in vac_levels:
-                noisy_img_array = np.random.poisson(clean_img_array*vac_level)
-                noisy_img = Image.fromarray(noisy_img_array) 
-                noisy_img.save(os.path.join(noisy_image_dir, 
-                                            f'vac_int-{vac_level:02d}counts',
-                                            img_name[:-4] 
-                                            + f'_noisy_vac_int-{vac_level:02d}counts.tif'
-                                            )
-                               )
-            
-            # Save every 1 in 10 images randomly for diagnostics
-            # if randint(0,100) > 90:
-            #     shutil.copyfile(output_img, os.path.join(output_check_dir,img_name))
-    
-    ## 2.5) Clean up slice directory
-    # Delete slice sub-directory to save space
-    try:
-        shutil.rmtree(structure_slc_dir)
-    except OSError as e:
-        print ("Error: %s - %s." % (e.filename, e.strerror))
+# Collect the settings of section 1 for the per-structure pipeline
+settings = {'ht': ht, 'nx': nx, 'ny': ny, 'nz': nz,
+            'dwf': dwf, 'buni': buni, 'absorb': absorb, 'output': output,
+            'defoci': defoci, 'vac_levels': vac_levels,
+            'n_realizations': n_realizations, 'noise_seed': noise_seed,
+            'backend': backend, 'validate_backend': validate_backend,
+            'validation_tolerance': validation_tolerance,
+            'vectorized_imaging': vectorized_imaging,
+            'frozen_phonons': frozen_phonons, 'phonon_workers': phonon_workers,
+            'sampling_file': sampling_file}
+
+# Open the slice cache
+slice_cache = None
+if slice_cache_dir is not None:
+    slice_cache = SliceCache(slice_cache_dir, max_bytes=slice_cache_budget)
+    slice_cache.clear_stale()
+
+# Set up the incremental simulator, which keeps the slices of the previous structure
+incremental_simulator = None
+if backend == 'numpy' and incremental:
+    incremental_simulator = IncrementalSimulator(ht, nx, ny, nz,
+                                                 absorb=absorb, dwf=dwf, buni=buni,
+                                                 tilt=(msa_prm_gen.tilt_x, msa_prm_gen.tilt_y),
+                                                 checkpoint_interval=checkpoint_interval)
+
+# For every structure in the input directory (in order, as frames of the time series)
+# Sections 2.1 - 2.5 (cel back-up, slicing, multislice, imaging, noise and clean-up)
+# are carried out by simulate_structure in multislice_pipeline.py
+cel_paths = [os.path.join(input_dir, cel_file) for cel_file in sorted(os.listdir(input_dir))]
+container = None
+if series_container:
+    container = SeriesWriter(os.path.join(output_dir, 'series.h5'), settings,
+                             frame_names=[os.path.splitext(os.path.basename(cel_path))[0]
+                                          for cel_path in cel_paths],
+                             parameters={'msa_prm': msa_prm_gen, 'wav_prm': wav_prm_gen},
+                             wave_dtype=container_wave_dtype)
+if pipelined and incremental_simulator is None:
+    finished, failures = run_pipelined(cel_paths, output_dir,
+                                       clean_image_dir, noisy_image_dir,
+                                       msa_prm_gen, wav_prm_gen, settings,
+                                       slice_cache=slice_cache,
+                                       noise_writer=noise_writer if stack_noisy_images else None,
+                                       container=container,
+                                       io_workers=io_workers, max_sliced=max_sliced)
+    for structure_name, stage, error in failures:
+        print(f'{structure_name} failed in the {stage} stage:\n{error}')
+else:
+    for cel_path in cel_paths:
+        simulate_structure(cel_path, output_dir,
+                           clean_image_dir, noisy_image_dir,
+                           msa_prm_gen, wav_prm_gen, settings,
+                           slice_cache=slice_cache,
+                           incremental_simulator=incremental_simulator,
+                           noise_writer=noise_writer if stack_noisy_images else None,
+                           container=container)
+
+# Close the noisy image stacks and the series container
+if stack_noisy_images:
+    noise_writer.close()
+if container is not None:
+    container.close()
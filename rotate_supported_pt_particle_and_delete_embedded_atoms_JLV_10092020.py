@@ -15,82 +15,68 @@ This file should be the base file upon which all rotations will be applied.
 After 30 seconds or so, the script will prompt the user again to select a directory.
 This directory is where all of the files will be saved.
 
+The rotations of the whole tilt grid are calculated at once by tilt_series.py,
+so dense grids (e.g. 0.5 degree steps) are practical.
+
 @author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
 """
 
 ## Import necessary modules
-import pymatgen as mg
 import os
 from tkinter import filedialog
+import tilt_series
+from embedded_atom_removal import SupportIndex, CEO2_PT_CUTOFFS
 
 ## Initiliaze and import base structure from .cif file
-#  and determine indices corresponding to Pt
 structure_file = os.path.normpath(filedialog.askopenfilename())
 structure_name = os.path.splitext(os.path.basename(structure_file))[0] # Base structure name without .cif extension
-BaseStructure = mg.IStructure.from_file(structure_file) # Make base structure immutable
-BaseStructureDict = BaseStructure.as_dict()
-PtIndices = BaseStructure.indices_from_symbol("Pt")
+BaseStructure = tilt_series.read_structure(structure_file) # Keeps the occupancies and B factors
 
 ## Choose a directory to save the .cif files after rotating.
 save_directory = os.path.normpath(filedialog.askdirectory())
 
 ## Specify if you want to delete Pt beneath the CeO2 support surface before saving
-DeleteEmbeddedPt = True
+#  'clash' removes Pt closer than a species-pair cutoff (Angstrom) to any support atom,
+#  'plane' (or True, as before) removes Pt whose fractional b coordinate is below 0.49,
+#  None (or False) keeps all Pt
+DeleteEmbeddedPt = 'clash'
+ClashCutoffs = CEO2_PT_CUTOFFS  # e.g. {('Pt', 'O'): 1.7, ('Pt', 'Ce'): 2.6}
+
+## Specify if a Dr. Probe .cel file should be written next to every .cif file
+WriteCel = False
 
 ## Initialize range of tilts to rotate the nanoparticle in each axis
 a_tilts_list = [0, 2, 4] # Amount to tilt about A axis (degrees)
 b_tilts_list = [0, 2] # Amount to tilt about B axis (degrees)
 c_tilts_list = [0] # Amount to tilt about C axis (degrees)
+# Dense grids can be given as arrays, e.g. numpy.arange(0, 10.5, 0.5)
 
 ## Designate an anchor point about which to perform the rotations
 #  Here we choose the center of the supercell
 anchor = list(0.5*supercell_dimension for supercell_dimension in BaseStructure.lattice.abc)
 
-## Initalize directions of tilt axes
-a_axis = [1, 0, 0] # Principle axis for A
-b_axis = [0, 1, 0] # Principle axis for B
-c_axis = [0, 0, 1] # Principle axis for C
-
 #! The next step of the script is to perform the rotations.
 #! Ensure that all inialization above is complete before proceeding.
 
 ## Perform rotations on Pt. Rotations are sequentially applied in A, B, and then C directions
-for c_tilt in c_tilts_list:
-    for b_tilt in b_tilts_list:
-        for a_tilt in a_tilts_list:
-            RotatedStructure = None
-            RotatedStructure = mg.Structure.from_dict(BaseStructureDict) # Copy structure to do the rotations on it instead of the base one.
-            
-            if a_tilt != 0:
-                a_theta = a_tilt*2*3.14159/360 # Convert from degrees to radians
-                # Rotate about A axis
-                RotatedStructure.rotate_sites(anchor=anchor,axis=a_axis,indices=PtIndices,theta=a_theta,to_unit_cell=True)
-                
-            if b_tilt != 0:
-                b_theta = b_tilt*2*3.14159/360 # Convert from degrees to radians
-                # Rotate about B axis
-                RotatedStructure.rotate_sites(anchor=anchor,axis=b_axis,indices=PtIndices,theta=b_theta,to_unit_cell=True)
-                
-            if c_tilt != 0:
-                c_theta = c_tilt*2*3.14159/360 # Convert from degrees to radians
-                # Rotate about C axis
-                RotatedStructure.rotate_sites(anchor=anchor,axis=c_axis,indices=PtIndices,theta=c_theta,to_unit_cell=True)
-
-            # Get file name after rotating
-            degrees_tilted = f'{a_tilt:03d}a{b_tilt:03d}b{c_tilt:03d}c'
-            rotated_name = structure_name + f'_{degrees_tilted}'
-                            
-            if DeleteEmbeddedPt:
-                # On-going work in progress...
-                PtIndices = RotatedStructure.indices_from_symbol("Pt")
-                sites_to_remove = []
-                for index in PtIndices:
-                    if RotatedStructure[index].b < 0.49:
-                        sites_to_remove.append(index)
-                tuple(sites_to_remove)
-                RotatedStructure.remove_sites(sites_to_remove)
-                rotated_name += '_NoBuriedPt'
-                        
-            # Save .cif file with rotated Pt atoms to the save directory
-            save_filename = os.path.join(save_directory, rotated_name + '.cif')
-            RotatedStructure.to(filename=save_filename)
\ No newline at end of file
+remove_atoms, clash_index, suffix = None, None, ''
+if DeleteEmbeddedPt is True:
+    DeleteEmbeddedPt = 'plane'
+if DeleteEmbeddedPt not in ('clash', 'plane', None, False):
+    raise ValueError(f"DeleteEmbeddedPt must be 'clash', 'plane' or None, not {DeleteEmbeddedPt!r}")
+if DeleteEmbeddedPt == 'plane':
+    # Remove Pt sites whose fractional b coordinate is below 0.49
+    remove_atoms = lambda index, species, frac: tilt_series.below_plane(species, frac, 'Pt', 1, 0.49)
+    suffix = '_NoBuriedPt'
+elif DeleteEmbeddedPt == 'clash':
+    # Periodic KD-tree over the support atoms, built once for all tilts
+    clash_index = SupportIndex.from_structure(BaseStructure, particle_species='Pt',
+                                              cutoffs=ClashCutoffs)
+    suffix = '_NoBuriedPt'
+
+# Save .cif files with rotated Pt atoms to the save directory
+tilt_series.write_tilt_series(BaseStructure, save_directory, structure_name,
+                              a_tilts_list, b_tilts_list, c_tilts_list,
+                              particle_species='Pt', anchor=anchor,
+                              remove_atoms=remove_atoms, suffix=suffix,
+                              write_cel=WriteCel, clash_index=clash_index)
\ No newline at end of file
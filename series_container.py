@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Single-file, chunked and compressed container for the results of a series.
+
+Instead of one cel/slc/prm/wav/img directory per structure and one .dat and
+several .tif files per image, all results of a time series go into one HDF5
+file:
+
+    /frames         structure name of every frame
+    /defoci         defocus values (nm)
+    /vac_levels     vacuum levels (electron counts)
+    /clean          float32 (frame, defocus, ny, nx)
+    /noisy          uint16  (frame, defocus, vac_level, realization, ny, nx)
+    /exit_waves     optional, complex64 (frame, ny, nx) or float16 (frame, ny, nx, 2)
+    /complete       bool (frame,), set once all data of a frame are written
+
+The simulation settings and parameter files are stored as JSON attributes.
+Every image is one compressed chunk, so any frame, defocus and dose can be
+read without touching the rest of the file. Noisy frames are drawn with the
+seeds of noise_realizations.py and are identical to the TIFF output.
+
+HDF5 files cannot be written safely from several threads, so SeriesWriter
+hands every write to a single writer thread through a bounded queue. The
+noise realizations are drawn by the threads that queue the images, so the
+writer thread only writes finished arrays. Several processes cannot open one
+container either: worker processes (batch_runner.py) write into a
+SeriesCollector, which is returned to the parent process and replayed into
+its single SeriesWriter.
+
+mark_complete() queues the /complete flag of a frame after its data, and
+flush() blocks until everything queued so far is written and the file is
+flushed, so a frame flagged complete is on disk. With append=True an
+existing container with the same layout is continued, so resumed batch runs
+keep the frames already written (completed_frames lists them).
+
+The 'numpy' package is required; the 'h5py' package is needed to write or
+read containers.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import json
+import os
+import queue
+import threading
+import numpy as np
+from noise_realizations import noisy_realizations, realization_seed
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+## Marks the end of the write queue
+_CLOSE = object()
+
+## Settings that fix the layout of a container
+LAYOUT_KEYS = ['nx', 'ny', 'defoci', 'vac_levels', 'n_realizations', 'noise_seed']
+
+
+def _require_h5py():
+    if h5py is None:
+        raise ImportError("The 'h5py' package is needed for series containers")
+
+
+def _json_attribute(value):
+    """JSON text of a settings dictionary or parameter object."""
+    if hasattr(value, '__dict__') and not isinstance(value, dict):
+        value = vars(value)
+    return json.dumps(value, default=str)
+
+
+def noisy_stack(clean_img_array, structure_name, defocus, settings):
+    """
+    uint16 noise realizations (vac_level, realization, ny, nx) of a clean
+    image, as stored in /noisy, with the vac_levels, n_realizations and
+    noise_seed of settings.
+    """
+    stack = []
+    for vac_level in settings['vac_levels']:
+        seed = realization_seed(settings['noise_seed'], structure_name, defocus, vac_level)
+        frames = noisy_realizations(clean_img_array, vac_level, settings['n_realizations'], seed)
+        if frames.max(initial=0) > np.iinfo(np.uint16).max:
+            raise ValueError(f'Counts at vacuum level {vac_level} exceed the uint16 range')
+        stack.append(frames.astype(np.uint16))
+    return np.stack(stack)
+
+
+class SeriesWriter:
+    """
+    Writes the images (and optionally exit waves) of a series into one HDF5 file.
+
+    settings holds the keys of multislice_pipeline.DEFAULT_SETTINGS (nx, ny,
+    defoci, vac_levels, n_realizations, noise_seed). frame_names fixes the
+    frame order (e.g. the sorted .cel files); structures that are not listed
+    are appended in the order they arrive. parameters is an optional
+    dictionary of extra metadata (e.g. {'msa_prm': msa_prm_gen}).
+    wave_dtype is None (no exit waves), 'complex64' or 'float16'.
+    compression is 'gzip' or 'lzf'. With append=True an existing file is
+    continued if its layout matches settings and wave_dtype (a ValueError
+    is raised otherwise). Call close() (or use as a context manager) to
+    flush the file.
+    """
+
+    def __init__(self, path, settings, frame_names=None, parameters=None,
+                 wave_dtype=None, compression='gzip', queue_size=8, append=False):
+        _require_h5py()
+        if wave_dtype not in (None, 'complex64', 'float16'):
+            raise ValueError("wave_dtype must be None, 'complex64' or 'float16'")
+        self.path = path
+        self.settings = settings
+        self.wave_dtype = wave_dtype
+        self.defoci = list(settings['defoci'])
+        self.vac_levels = list(settings['vac_levels'])
+        self.n_realizations = settings['n_realizations']
+        self.noise_seed = settings['noise_seed']
+        frame_names = list(frame_names or [])
+
+        if append and os.path.isfile(path):
+            self.file = h5py.File(path, 'a')
+            try:
+                self._check_layout()
+            except ValueError:
+                self.file.close()
+                raise
+            self.frame_index = {name.decode() if isinstance(name, bytes) else name: i
+                                for i, name in enumerate(self.file['frames'][:])}
+            if 'complete' not in self.file:
+                # Written before frames were flagged; nothing is known to be complete
+                self.file.create_dataset('complete', shape=(len(self.frame_index),),
+                                         maxshape=(None,), dtype=bool)
+            for name in frame_names:
+                self._frame(name)
+        else:
+            self.frame_index = {name: i for i, name in enumerate(frame_names)}
+            self._create(frame_names, parameters, compression)
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='series-writer', daemon=True)
+        self.thread.start()
+
+    def _create(self, frame_names, parameters, compression):
+        settings, wave_dtype = self.settings, self.wave_dtype
+        nx, ny = settings['nx'], settings['ny']
+        n_frames = len(frame_names)
+        self.file = h5py.File(self.path, 'w')
+        self.file.attrs['settings'] = _json_attribute(settings)
+        for key, value in (parameters or {}).items():
+            self.file.attrs[key] = _json_attribute(value)
+        string_dtype = h5py.string_dtype()
+        self.file.create_dataset('frames', data=np.array(frame_names, dtype=object),
+                                 dtype=string_dtype, maxshape=(None,))
+        self.file.create_dataset('defoci', data=np.array(self.defoci, dtype=float))
+        self.file.create_dataset('vac_levels', data=np.array(self.vac_levels, dtype=float))
+        self.file.create_dataset('complete', shape=(n_frames,), maxshape=(None,), dtype=bool)
+        options = {'compression': compression, 'shuffle': True}
+        self.file.create_dataset('clean', shape=(n_frames, len(self.defoci), ny, nx),
+                                 maxshape=(None, len(self.defoci), ny, nx),
+                                 chunks=(1, 1, ny, nx), dtype=np.float32, **options)
+        self.file.create_dataset('noisy', shape=(n_frames, len(self.defoci), len(self.vac_levels),
+                                                 self.n_realizations, ny, nx),
+                                 maxshape=(None, len(self.defoci), len(self.vac_levels),
+                                           self.n_realizations, ny, nx),
+                                 chunks=(1, 1, 1, 1, ny, nx), dtype=np.uint16, **options)
+        if wave_dtype == 'complex64':
+            self.file.create_dataset('exit_waves', shape=(n_frames, ny, nx),
+                                     maxshape=(None, ny, nx), chunks=(1, ny, nx),
+                                     dtype=np.complex64, **options)
+        elif wave_dtype == 'float16':
+            # Real and imaginary parts in half precision
+            self.file.create_dataset('exit_waves', shape=(n_frames, ny, nx, 2),
+                                     maxshape=(None, ny, nx, 2), chunks=(1, ny, nx, 2),
+                                     dtype=np.float16, **options)
+
+    def _check_layout(self):
+        """Raise a ValueError if the open file was written with another layout."""
+        stored = json.loads(self.file.attrs['settings'])
+        current = json.loads(_json_attribute(self.settings))
+        for key in LAYOUT_KEYS:
+            if stored.get(key) != current.get(key):
+                raise ValueError(f'{self.path} has {key} = {stored.get(key)}, not {current.get(key)}')
+        stored_dtype = None
+        if 'exit_waves' in self.file:
+            stored_dtype = 'float16' if self.file['exit_waves'].dtype == np.float16 else 'complex64'
+        if stored_dtype != self.wave_dtype:
+            raise ValueError(f'{self.path} holds exit waves as {stored_dtype}, not {self.wave_dtype}')
+
+    @property
+    def store_exit_waves(self):
+        return self.wave_dtype is not None
+
+    @property
+    def completed_frames(self):
+        """Names of the frames flagged complete, as far as they are written."""
+        complete = self.file['complete'][:]
+        return {name for name, frame in self.frame_index.items()
+                if frame < len(complete) and complete[frame]}
+
+    def write_image(self, clean_img_array, structure_name, defocus, noisy=None):
+        """
+        Queue a clean image and its noise realizations at every vacuum level.
+        The noise is drawn in the calling thread unless noisy (from
+        noisy_stack()) is given.
+        """
+        clean_img_array = np.asarray(clean_img_array)
+        if noisy is None:
+            noisy = noisy_stack(clean_img_array, structure_name, defocus, self.settings)
+        self._put(('image', structure_name, defocus, (clean_img_array, noisy)))
+
+    def write_exit_wave(self, exit_wave, structure_name):
+        self._put(('wave', structure_name, None, np.asarray(exit_wave)))
+
+    def mark_complete(self, structure_name):
+        """Queue the /complete flag of a frame, after the data queued for it."""
+        self._put(('complete', structure_name, None, None))
+
+    def flush(self):
+        """Block until everything queued so far is written and the file is flushed."""
+        flushed = threading.Event()
+        self._put(('flush', None, None, flushed))
+        flushed.wait()
+        if self.error is not None:
+            raise RuntimeError(f'Series writer failed: {self.error}')
+
+    def _put(self, item):
+        if self.error is not None:
+            raise RuntimeError(f'Series writer failed: {self.error}')
+        self.queue.put(item)
+
+    def _frame(self, structure_name):
+        """Index of a frame, appending it if it is new."""
+        if structure_name not in self.frame_index:
+            frame = len(self.frame_index)
+            self.frame_index[structure_name] = frame
+            for name in ('frames', 'complete', 'clean', 'noisy', 'exit_waves'):
+                if name in self.file and self.file[name].shape[0] <= frame:
+                    self.file[name].resize(frame + 1, axis=0)
+            self.file['frames'][frame] = structure_name
+        return self.frame_index[structure_name]
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _CLOSE:
+                return
+            kind, structure_name, defocus, data = item
+            if kind == 'flush':
+                try:
+                    if self.error is None:
+                        self.file.flush()
+                except Exception as e:
+                    self.error = f'{type(e).__name__}: {e}'
+                data.set()
+                continue
+            if self.error is not None:
+                continue
+            try:
+                frame = self._frame(structure_name)
+                if kind == 'image':
+                    self._write_image(frame, defocus, *data)
+                elif kind == 'wave':
+                    self._write_wave(frame, data)
+                else:
+                    self.file['complete'][frame] = True
+            except Exception as e:
+                self.error = f'{type(e).__name__}: {e}'
+
+    def _write_image(self, frame, defocus, clean_img_array, noisy):
+        i_defocus = self.defoci.index(defocus)
+        self.file['clean'][frame, i_defocus] = clean_img_array
+        self.file['noisy'][frame, i_defocus] = noisy
+
+    def _write_wave(self, frame, exit_wave):
+        if self.wave_dtype == 'complex64':
+            self.file['exit_waves'][frame] = exit_wave.astype(np.complex64)
+        elif self.wave_dtype == 'float16':
+            self.file['exit_waves'][frame] = np.stack([exit_wave.real, exit_wave.imag],
+                                                      axis=-1).astype(np.float16)
+
+    def close(self):
+        """Wait for the queued writes, then close the file."""
+        if self.thread.is_alive():
+            self.queue.put(_CLOSE)
+            self.thread.join()
+        if self.file:
+            self.file.close()
+        if self.error is not None:
+            raise RuntimeError(f'Series writer failed: {self.error}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SeriesCollector:
+    """
+    Collects the writes of a series in memory, with the write interface of
+    SeriesWriter, in a process that cannot write the container itself.
+    settings are those of the container (see SeriesWriter); the noise is
+    drawn here, in the worker. replay() queues the writes in the SeriesWriter
+    of the parent process.
+    """
+
+    def __init__(self, settings, wave_dtype=None):
+        self.settings = settings
+        self.wave_dtype = wave_dtype
+        self.items = []
+
+    @property
+    def store_exit_waves(self):
+        return self.wave_dtype is not None
+
+    def write_image(self, clean_img_array, structure_name, defocus):
+        clean_img_array = np.asarray(clean_img_array)
+        noisy = noisy_stack(clean_img_array, structure_name, defocus, self.settings)
+        self.items.append(('image', structure_name, defocus, (clean_img_array, noisy)))
+
+    def write_exit_wave(self, exit_wave, structure_name):
+        self.items.append(('wave', structure_name, None, np.asarray(exit_wave, dtype=np.complex64)))
+
+    def mark_complete(self, structure_name):
+        self.items.append(('complete', structure_name, None, None))
+
+    def replay(self, writer):
+        for kind, structure_name, defocus, data in self.items:
+            if kind == 'image':
+                writer.write_image(data[0], structure_name, defocus, noisy=data[1])
+            elif kind == 'wave':
+                writer.write_exit_wave(data, structure_name)
+            else:
+                writer.mark_complete(structure_name)
+        self.items = []
+
+
+class SeriesReader:
+    """
+    Random access to a series container by frame (index or structure name),
+    defocus value and vacuum level.
+    """
+
+    def __init__(self, path):
+        _require_h5py()
+        self.file = h5py.File(path, 'r')
+        self.frames = [name.decode() if isinstance(name, bytes) else name
+                       for name in self.file['frames'][:]]
+        self.frame_index = {name: i for i, name in enumerate(self.frames)}
+        self.defoci = [float(defocus) for defocus in self.file['defoci'][:]]
+        self.vac_levels = [float(vac_level) for vac_level in self.file['vac_levels'][:]]
+        self.settings = json.loads(self.file.attrs['settings'])
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _frame(self, frame):
+        return self.frame_index[frame] if isinstance(frame, str) else frame
+
+    def clean(self, frame, defocus=None):
+        """Clean image of a frame at one defocus (default: the first)."""
+        i_defocus = 0 if defocus is None else self.defoci.index(defocus)
+        return self.file['clean'][self._frame(frame), i_defocus]
+
+    def noisy(self, frame, vac_level, defocus=None, realization=0):
+        """Noisy image of a frame at one vacuum level and defocus."""
+        i_defocus = 0 if defocus is None else self.defoci.index(defocus)
+        return self.file['noisy'][self._frame(frame), i_defocus,
+                                  self.vac_levels.index(vac_level), realization]
+
+    def exit_wave(self, frame):
+        """Exit wave of a frame as complex64."""
+        if 'exit_waves' not in self.file:
+            raise KeyError('This container holds no exit waves')
+        wave = self.file['exit_waves'][self._frame(frame)]
+        if wave.dtype == np.float16:
+            wave = wave[..., 0].astype(np.float32) + 1j * wave[..., 1].astype(np.float32)
+        return wave.astype(np.complex64)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
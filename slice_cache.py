@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Content-addressed cache for celslc phase gratings.
+
+Slicing is one of the two most expensive steps of a simulation, but the
+phase gratings only depend on the .cel file contents and the slicing
+parameters (ht, nx, ny, nz, absorb, dwf, buni). Entries are therefore stored
+under a hash of exactly those inputs, so re-running a series with only the
+wavimg parameters changed, or simulating an identical structure twice, never
+slices again.
+
+Each cache entry is a directory named after its key. celslc (or the NumPy
+backend) writes into a private temporary directory (unique per process and
+thread) which is renamed into place once complete, so concurrent workers
+never see half-written entries. The modification time of an entry directory
+is refreshed on every hit and the least recently used entries are deleted
+whenever the total cache size exceeds the disk budget.
+
+An entry returned by get_or_create() is marked as in use by a marker file in
+the .in_use sub-directory until the caller calls release(); marked entries
+are never evicted, everything else is, so the cache only exceeds its budget
+by the entries that are being read at that moment. Markers left behind by
+killed workers are removed by clear_stale().
+
+Only the standard library is required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+## Name of the slice files inside a cache entry (celslc appends _###.sli)
+SLICE_PREFIX = 'slc'
+
+## Sub-directory of the in-use marker files
+IN_USE_DIR = '.in_use'
+
+
+def slice_key(cel_file, ht, nx, ny, nz, absorb, dwf, buni, backend='drprobe'):
+    """Hash of the .cel contents and every parameter that changes the slices."""
+    digest = hashlib.sha256()
+    with open(cel_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    parameters = {'ht': ht, 'nx': nx, 'ny': ny, 'nz': nz, 'absorb': bool(absorb),
+                  'dwf': bool(dwf), 'buni': buni, 'backend': backend}
+    digest.update(json.dumps(parameters, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def directory_size(path):
+    """Total size in bytes of all files below path."""
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+class SliceCache:
+    """
+    Size-bounded, least-recently-used store of slice files.
+
+    cache_dir is created if needed. max_bytes is the disk budget; None
+    disables eviction. Entries between get_or_create() and release() are
+    not evicted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = os.path.normpath(cache_dir)
+        self.max_bytes = max_bytes
+        self.in_use_dir = os.path.join(self.cache_dir, IN_USE_DIR)
+        os.makedirs(self.in_use_dir, exist_ok=True)
+        # Marker files of the entries this object has handed out, by key
+        self.markers = {}
+        self.lock = threading.Lock()
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key):
+        """
+        Slice file prefix of a cached entry, or None on a miss.
+        A hit marks the entry as most recently used.
+        """
+        entry = self.entry_dir(key)
+        if not os.path.isdir(entry):
+            return None
+        os.utime(entry, None)
+        return os.path.join(entry, SLICE_PREFIX)
+
+    def get_or_create(self, key, build):
+        """
+        Slice file prefix for key, calling build(prefix) to create the slice
+        files on a miss. build receives a prefix inside a temporary directory
+        that is moved into the cache once it returns. The entry is in use,
+        and not evicted, until release(prefix) is called.
+        """
+        # Marked before the lookup, so an evicting worker sees the marker first
+        self._acquire(key)
+        try:
+            prefix = self.lookup(key)
+            if prefix is None:
+                prefix = self._create(key, build)
+        except BaseException:
+            self._release_key(key)
+            raise
+        return prefix
+
+    def release(self, prefix):
+        """
+        Let the entry of a prefix returned by get_or_create() be evicted
+        again, and evict entries if the cache is over its budget.
+        """
+        self._release_key(os.path.basename(os.path.dirname(prefix)))
+        self.evict()
+
+    def _acquire(self, key):
+        handle, marker = tempfile.mkstemp(prefix=f'{key}.', dir=self.in_use_dir)
+        os.close(handle)
+        with self.lock:
+            self.markers.setdefault(key, []).append(marker)
+
+    def _release_key(self, key):
+        with self.lock:
+            markers = self.markers.get(key)
+            if not markers:
+                return
+            marker = markers.pop()
+            if not markers:
+                del self.markers[key]
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+
+    def in_use(self):
+        """Keys of the entries that any worker has marked as in use."""
+        return {name.split('.')[0] for name in os.listdir(self.in_use_dir)}
+
+    def _create(self, key, build):
+        temp_dir = tempfile.mkdtemp(prefix=f'.{key}.', suffix='.tmp', dir=self.cache_dir)
+        try:
+            build(os.path.join(temp_dir, SLICE_PREFIX))
+            try:
+                os.rename(temp_dir, self.entry_dir(key))
+            except OSError:
+                # Another worker finished the same entry first
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        self.evict()
+        return self.lookup(key)
+
+    def entries(self):
+        """(last used time, size in bytes, key) of every complete entry."""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = self.entry_dir(key)
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            entries.append((os.path.getmtime(entry), directory_size(entry), key))
+        return entries
+
+    def evict(self):
+        """
+        Delete least recently used entries that are not in use until the
+        cache fits max_bytes. Returns the keys of the deleted entries.
+        """
+        if self.max_bytes is None:
+            return []
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for last_used, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key in self.in_use():
+                continue
+            # Move the entry out of sight first; a worker that marked it in the
+            # meantime gets it back, one that looks it up later builds it again
+            doomed = os.path.join(self.cache_dir, f'.{key}.evicted')
+            try:
+                os.rename(self.entry_dir(key), doomed)
+            except OSError:
+                continue
+            if key in self.in_use():
+                try:
+                    os.rename(doomed, self.entry_dir(key))
+                    continue
+                except OSError:
+                    # The worker has already built the entry again
+                    pass
+            shutil.rmtree(doomed, ignore_errors=True)
+            total -= size
+            removed.append(key)
+        return removed
+
+    def clear_stale(self, max_age=24*3600):
+        """
+        Remove temporary directories and in-use markers left behind by killed
+        workers (anything older than max_age seconds).
+        """
+        now = time.time()
+        for name in os.listdir(self.in_use_dir):
+            path = os.path.join(self.in_use_dir, name)
+            if now - os.path.getmtime(path) > max_age:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('.') and name != IN_USE_DIR and now - os.path.getmtime(path) > max_age:
+                shutil.rmtree(path, ignore_errors=True)
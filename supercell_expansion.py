@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Array-backed supercell expansion, for single files or whole directories.
+
+Same semantics as Expand_supercell.py: every supercell dimension is scaled
+by expansion_factor (rounded to 0.001 Angstrom) and raised to min_dimension
+if it is smaller; the new cell is orthogonal and the model is shifted by
+half of the added length along each axis so that it stays centered.
+
+Instead of appending every site to a dummy-initialized Structure and then
+translating all sites, the expanded structure is built in one call from the
+species and the shifted Cartesian coordinate arrays. Directories of .cif
+files are expanded on a process pool without any dialogs.
+
+Usage:
+    python supercell_expansion.py CIF_DIR SAVE_DIR [--expansion-factor 1.2]
+        [--min-dimension 15] [--jobs N]
+
+The 'numpy' and 'pymatgen' packages are required.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from pymatgen.core import Lattice, Structure
+
+
+def expanded_abc(abc, expansion_factor=1.20, min_dimension=15):
+    """Expanded supercell dimensions, in Angstrom."""
+    abc = [round(expansion_factor * lattice_param, 3) for lattice_param in abc]
+    return [lattice_param if lattice_param > min_dimension else min_dimension
+            for lattice_param in abc]
+
+
+def expand_structure(structure, expansion_factor=1.20, min_dimension=15):
+    """Expanded, centered copy of a pymatgen structure in an orthogonal supercell."""
+    abc = expanded_abc(structure.lattice.abc, expansion_factor, min_dimension)
+    latt = Lattice.from_parameters(abc[0], abc[1], abc[2], 90, 90, 90)
+    translation_vector = 0.5 * (np.array(abc) - np.array(structure.lattice.abc))
+    # to_unit_cell matches the default of translate_sites in Expand_supercell.py
+    return Structure(latt, structure.species_and_occu,
+                     structure.cart_coords + translation_vector,
+                     coords_are_cartesian=True, to_unit_cell=True)
+
+
+def expand_file(structure_file, save_directory, expansion_factor=1.20, min_dimension=15):
+    """Expand one .cif file and save it as <name>_expanded.cif; returns the saved file."""
+    structure_name = os.path.splitext(os.path.basename(structure_file))[0]
+    expanded = expand_structure(Structure.from_file(structure_file),
+                                expansion_factor, min_dimension)
+    save_filename = os.path.join(save_directory, structure_name + '_expanded.cif')
+    expanded.to(filename=save_filename)
+    return save_filename
+
+
+def expand_directory(cif_directory, save_directory, expansion_factor=1.20,
+                     min_dimension=15, jobs=None):
+    """
+    Expand every .cif file of cif_directory on a process pool.
+    Returns (saved files, {file: error message}).
+    """
+    os.makedirs(save_directory, exist_ok=True)
+    cif_files = sorted(glob.glob(os.path.join(cif_directory, '*.cif')))
+    saved, errors = [], {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(expand_file, cif_file, save_directory,
+                               expansion_factor, min_dimension): cif_file
+                   for cif_file in cif_files}
+        for future, cif_file in futures.items():
+            try:
+                saved.append(future.result())
+            except Exception as e:
+                errors[cif_file] = f'{type(e).__name__}: {e}'
+    return saved, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Expand the supercells of a directory of .cif files.')
+    parser.add_argument('cif_directory', help='Directory containing the .cif files')
+    parser.add_argument('save_directory', help='Directory where the expanded .cif files are saved')
+    parser.add_argument('--expansion-factor', type=float, default=1.20,
+                        help='Scaling factor of the supercell dimensions')
+    parser.add_argument('--min-dimension', type=float, default=15,
+                        help='Minimum supercell dimension after expansion, in Angstrom')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes')
+    args = parser.parse_args()
+
+    saved, errors = expand_directory(args.cif_directory, args.save_directory,
+                                     args.expansion_factor, args.min_dimension, args.jobs)
+    print(f'{len(saved)} expanded, {len(errors)} failed')
+    for cif_file, error in errors.items():
+        print(f'{cif_file}: {error}')
+
+
+if __name__ == '__main__':
+    main()
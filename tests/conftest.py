@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the tests. The scripts live at the top level of the
+repository, so it is put on the import path here.
+"""
+
+## Import necessary modules
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy_multislice as nms
+
+
+@pytest.fixture
+def structure():
+    """Small random Pt structure in a 1.6 x 1.6 x 1.2 nm cell."""
+    rng = np.random.default_rng(0)
+    n_atoms = 24
+    return nms.CelStructure('test', (1.6, 1.6, 1.2, 90.0, 90.0, 90.0), ['Pt'] * n_atoms,
+                            rng.random((n_atoms, 3)), np.ones(n_atoms),
+                            np.full(n_atoms, 0.005))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Resumable batch runs with the numpy backend."""
+
+## Import necessary modules
+import importlib.util
+import json
+import os
+import pytest
+import batch_runner
+import multislice_pipeline as pipeline
+from pipeline_benchmark import benchmark_parameters, synthetic_cel
+
+CELL = (1.6, 1.6, 1.2)
+SETTINGS = {'backend': 'numpy', 'nx': 32, 'ny': 32, 'nz': 4, 'defoci': [8],
+            'vac_levels': [10], 'n_realizations': 1}
+
+
+@pytest.fixture
+def batch(tmp_path):
+    cel_files = []
+    for i in range(3):
+        cel_files.append(str(tmp_path / f'frame_{i}.cel'))
+        synthetic_cel(cel_files[-1], 10 + i, CELL, seed=i)
+    msa_prm, wav_prm = benchmark_parameters(CELL, 32, 32, 4, backend='numpy')
+    msa_file, wav_file = str(tmp_path / 'msa.json'), str(tmp_path / 'wav.json')
+    pipeline.save_parameters(msa_file, msa_prm)
+    pipeline.save_parameters(wav_file, wav_prm)
+    directories = [str(tmp_path / d) for d in ('output', 'clean', 'noisy')]
+    return cel_files, directories, msa_file, wav_file
+
+
+def run(batch, **kwargs):
+    cel_files, directories, msa_file, wav_file = batch
+    return batch_runner.run_batch(cel_files, *directories, msa_file, wav_file,
+                                  settings=SETTINGS, jobs=2, **kwargs)
+
+
+def test_parameters_round_trip(batch):
+    msa_prm, wav_prm = batch_runner.load_parameters(*batch[2:])
+    expected = benchmark_parameters(CELL, 32, 32, 4, backend='numpy')[1]
+    assert wav_prm.aberrations_dict == expected.aberrations_dict
+    assert tuple(wav_prm.wave_sampling) == expected.wave_sampling
+
+
+def test_resume_skips_finished_structures(batch):
+    records = run(batch)
+    assert sorted(record['structure'] for record in records) == ['frame_0', 'frame_1', 'frame_2']
+    assert all(record['status'] == 'done' for record in records)
+    manifest_path = os.path.join(batch[1][0], batch_runner.MANIFEST_NAME)
+    manifest = batch_runner.read_manifest(manifest_path)
+    assert sorted(manifest) == sorted(batch[0])
+    assert run(batch) == []
+
+    # A job killed mid-write leaves a cut-off line; that structure runs again
+    with open(manifest_path, 'r') as f:
+        lines = f.readlines()
+    kept = [line for line in lines if json.loads(line)['structure'] != 'frame_1']
+    with open(manifest_path, 'w') as f:
+        f.writelines(kept + ['{"structure": "frame_1", "cel"'])
+    records = run(batch)
+    assert [record['structure'] for record in records] == ['frame_1']
+
+
+def test_failed_structures_are_retried_on_request(batch):
+    cel_files, directories, msa_file, wav_file = batch
+    with open(cel_files[0], 'w') as f:
+        f.write('not a cel file\n')
+    records = run(batch)
+    failed = [record['structure'] for record in records if record['status'] == 'failed']
+    assert failed == ['frame_0']
+    assert run(batch) == []
+    assert [record['structure'] for record in run(batch, retry_failed=True)] == ['frame_0']
+
+
+def test_backend_check(batch):
+    msa_file, wav_file = batch[2:]
+    batch_runner.check_backend({'backend': 'numpy'}, msa_file, wav_file)
+    with pytest.raises(ValueError):
+        batch_runner.check_backend({'backend': 'drprobe'}, msa_file, wav_file)
+    if importlib.util.find_spec('drprobe') is None:
+        with pytest.raises(ImportError):
+            batch_runner.check_backend({'backend': 'numpy'}, 'msa.prm', 'wav.prm')
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Conversion and up-to-date checks of cif_to_cel."""
+
+## Import necessary modules
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('pymatgen')
+
+import numpy_multislice as nms
+from cif_to_cel import convert_directory
+
+CIF = """data_Pt
+_symmetry_space_group_name_H-M   'P 1'
+_cell_length_a   3.9242
+_cell_length_b   3.9242
+_cell_length_c   3.9242
+_cell_angle_alpha   90
+_cell_angle_beta   90
+_cell_angle_gamma   90
+_symmetry_Int_Tables_number   1
+loop_
+ _symmetry_equiv_pos_as_xyz
+ 'x, y, z'
+loop_
+ _atom_site_label
+ _atom_site_type_symbol
+ _atom_site_fract_x
+ _atom_site_fract_y
+ _atom_site_fract_z
+ _atom_site_occupancy
+ _atom_site_B_iso_or_equiv
+ Pt1  Pt  0.0  0.0  0.0  1  0.35(2)
+ Pt2  Pt  0.0  0.5  0.5  1  0.35(2)
+ Pt3  Pt  0.5  0.0  0.5  1  0.35(2)
+ Pt4  Pt  0.5  0.5  0.0  1  0.35(2)
+"""
+
+
+@pytest.fixture
+def cif_directory(tmp_path):
+    cif_dir = tmp_path / 'cif'
+    cif_dir.mkdir()
+    for name in ('a', 'b'):
+        (cif_dir / f'{name}.cif').write_text(CIF)
+    return str(cif_dir), str(tmp_path / 'cel')
+
+
+def test_conversion_and_b_factors(cif_directory):
+    cif_dir, cel_dir = cif_directory
+    converted, skipped, errors = convert_directory(cif_dir, cel_dir, jobs=1)
+    assert (len(converted), skipped, errors) == (2, [], {})
+    structure = nms.read_cel(os.path.join(cel_dir, 'a.cel'))
+    assert len(structure.symbols) == 4
+    np.testing.assert_allclose(structure.cell[:3], 0.39242, atol=1e-5)
+    # B = 0.35 A^2 = 0.0035 nm^2
+    np.testing.assert_allclose(structure.biso, 0.0035, atol=1e-6)
+
+
+@pytest.mark.parametrize('check', ['mtime', 'hash'])
+def test_up_to_date_files_are_skipped(cif_directory, check):
+    cif_dir, cel_dir = cif_directory
+    convert_directory(cif_dir, cel_dir, jobs=1, check=check)
+    converted, skipped, errors = convert_directory(cif_dir, cel_dir, jobs=1, check=check)
+    assert converted == [] and len(skipped) == 2 and errors == {}
+
+
+@pytest.mark.parametrize('check', ['mtime', 'hash'])
+def test_changes_trigger_conversion(cif_directory, check):
+    cif_dir, cel_dir = cif_directory
+    convert_directory(cif_dir, cel_dir, jobs=1, check=check)
+    # A changed rotation converts everything again, even with newer .cel files
+    converted, skipped, errors = convert_directory(cif_dir, cel_dir, axis=(0, 0, 1),
+                                                   angle=10.0, jobs=1, check=check)
+    assert len(converted) == 2 and skipped == []
+    # A changed .cif file is converted again, the other one is skipped
+    cif_file = os.path.join(cif_dir, 'a.cif')
+    with open(cif_file, 'a') as f:
+        f.write('\n')
+    os.utime(cif_file, (os.path.getmtime(cif_file) + 10,) * 2)
+    converted, skipped, errors = convert_directory(cif_dir, cel_dir, axis=(0, 0, 1),
+                                                   angle=10.0, jobs=1, check=check)
+    assert converted == [cif_file] and skipped == [os.path.join(cif_dir, 'b.cif')]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Convergence search for nx and nz."""
+
+## Import necessary modules
+import numpy as np
+import numpy_multislice as nms
+import convergence_optimizer as co
+
+
+def test_fourier_resample_round_trip():
+    # Band-limited, so that no Nyquist frequency is split by the upsampling
+    image = co.fourier_resample(np.random.default_rng(0).random((15, 15)), 32, 32)
+    upsampled = co.fourier_resample(image, 64, 64)
+    np.testing.assert_allclose(upsampled.mean(), image.mean())
+    np.testing.assert_allclose(co.fourier_resample(upsampled, 32, 32), image, atol=1e-12)
+
+
+def test_detail_missing_from_coarse_grid_counts_as_error(structure):
+    search = co.ConvergenceSearch(structure)
+    x = np.arange(64) / 64
+    fine = np.tile(1 + 0.1 * np.cos(2 * np.pi * 4 * x) + 0.1 * np.cos(2 * np.pi * 24 * x), (64, 1))
+    coarse = co.fourier_resample(fine, 32, 32)
+    search.runs = {(64, 1): {'images': fine[None], 'seconds': 1.0, 'ny': 64},
+                   (32, 1): {'images': coarse[None], 'seconds': 1.0, 'ny': 32}}
+    # The 24-cycle term cannot be represented on the 32-pixel grid
+    assert search.error(32, 1, (64, 1)) > 0.5
+    assert search.error(64, 1, (64, 1)) < 1e-12
+
+
+def test_search_simulates_every_setting_once(structure, monkeypatch):
+    calls = []
+    exit_wave = nms.exit_wave
+
+    def counted(structure, ht, nx, ny, nz, **kwargs):
+        calls.append((nx, nz))
+        return exit_wave(structure, ht, nx, ny, nz, **kwargs)
+
+    monkeypatch.setattr(nms, 'exit_wave', counted)
+    result = co.find_sampling(structure, tolerance=0.5, sizes=[32, 64], slices=[2, 4],
+                              defoci=(0.0, 5.0), current=(64, 64, 4))
+    assert len(calls) == len(set(calls))
+    assert (result['nx'], result['ny']) in [(32, 32), (64, 64)]
+    assert result['error'] <= 0.5 or not result['converged']
+    assert result['predicted_seconds_numpy'] > 0
+    assert result['current']['predicted_seconds_numpy'] > 0
+    assert result['reference'] == {'nx': 64, 'ny': 64, 'nz': 4}
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""Batched defocus series against single-image calculations."""
+
+## Import necessary modules
+import numpy as np
+import numpy_multislice as nms
+from defocus_series import image_series
+
+IMAGING = dict(ht=300, aberrations={5: (1000.0, 0.0)}, focus_spread=4.0,
+               convergence=0.2, vibration=(0.01, 0.02, 30.0), oa_radius=20.0)
+
+
+def test_series_matches_single_images(structure):
+    wave = nms.exit_wave(structure, 300, 64, 64, 6)
+    sampling = (structure.cell[0] / 64, structure.cell[1] / 64)
+    defoci = [-8.0, 0.0, 4.0, 12.0]
+    images = image_series(wave, defoci, sampling, chunk_size=3, **IMAGING)
+    assert images.shape == (len(defoci), 64, 64)
+    for defocus, image in zip(defoci, images):
+        single = nms.image_from_wave(wave, sampling, defocus=defocus, **IMAGING)
+        np.testing.assert_allclose(image, single, rtol=1e-5, atol=1e-6)
+
+
+def test_cs_grid_shape_and_values(structure):
+    wave = nms.exit_wave(structure, 300, 64, 64, 6)
+    sampling = (structure.cell[0] / 64, structure.cell[1] / 64)
+    images = image_series(wave, [0.0, 5.0], sampling, cs_values=[-500.0, 1000.0], **IMAGING)
+    assert images.shape == (1, 2, 2, 64, 64)
+    aberrations = {5: (-500.0, 0.0)}
+    single = nms.image_from_wave(wave, sampling, defocus=5.0,
+                                 **dict(IMAGING, aberrations=aberrations))
+    np.testing.assert_allclose(images[0, 0, 1], single, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Tiled and region-of-interest simulations against the full cell."""
+
+## Import necessary modules
+import numpy as np
+import numpy_multislice as nms
+from domain_decomposition import SEAM_TOLERANCE, roi_window, simulate_tiled
+
+
+def wide_structure():
+    """A 4 x 4 nm cell, large enough for tiles with a generous overlap."""
+    rng = np.random.default_rng(2)
+    n_atoms = 60
+    return nms.CelStructure('wide', (4.0, 4.0, 0.8, 90.0, 90.0, 90.0), ['Pt'] * n_atoms,
+                            rng.random((n_atoms, 3)), np.ones(n_atoms),
+                            np.full(n_atoms, 0.005))
+
+
+def test_tiled_matches_full_cell():
+    structure = wide_structure()
+    result = simulate_tiled(structure, 300, 128, 128, 4, tiles=(2, 2), overlap=24,
+                            defoci=(0.0, 8.0), max_workers=2, reference=True)
+    assert result['images'].shape == (2, 128, 128)
+    assert result['seam_error'] < SEAM_TOLERANCE
+    full_wave = nms.exit_wave(structure, 300, 128, 128, 4)
+    difference = np.sqrt(np.mean(np.abs(result['wave'] - full_wave)**2))
+    assert difference < 0.01 * np.sqrt(np.mean(np.abs(full_wave)**2))
+    # The weak-phase images have little contrast, so their relative errors are larger
+    for errors in result['errors']:
+        assert errors['correlation'] > 0.99
+
+
+def test_roi_window_clamps_to_cell(structure):
+    # Every atom selected: the box cannot be larger than the cell
+    (ix0, iy0, nx_box, ny_box), (x, y) = roi_window(structure, np.ones(24, bool), 64, 64,
+                                                    padding=5.0)
+    assert (ix0, iy0, nx_box, ny_box) == (0, 0, 64, 64)
+    assert 0 <= x.start < x.stop <= 64 and 0 <= y.start < y.stop <= 64
+
+
+def test_roi_window_wraps_around_cell(structure):
+    mask = np.zeros(24, bool)
+    mask[0] = True
+    xyz = structure.xyz.copy()
+    xyz[0] = (0.01, 0.01, 0.5)
+    (ix0, iy0, nx_box, ny_box), (x, y) = roi_window(structure._replace(xyz=xyz), mask, 64, 64,
+                                                    padding=0.2)
+    assert nx_box < 64 and ny_box < 64
+    assert 0 <= ix0 < 64 and 0 <= iy0 < 64
+    # The atom pixel lies inside the region of the box, counted from the wrapped origin
+    assert x.start <= (0 - ix0) % 64 < x.stop
+    assert y.start <= (0 - iy0) % 64 < y.stop
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Periodic clash detection between particle and support atoms."""
+
+## Import necessary modules
+import numpy as np
+from embedded_atom_removal import SupportIndex
+
+BOX = (10.0, 10.0, 10.0)
+CUTOFFS = {('Pt', 'O'): 1.7, ('Pt', 'Ce'): 2.6}
+
+
+def support():
+    return SupportIndex(['Ce', 'O'], [[5.0, 5.0, 5.0], [0.2, 5.0, 5.0]], BOX, cutoffs=CUTOFFS)
+
+
+def test_pair_cutoffs_and_periodic_images():
+    index = support()
+    coords = np.array([[5.0, 7.0, 5.0],    # 2.0 from Ce: clash (cutoff 2.6)
+                       [5.0, 8.0, 5.0],    # 3.0 from Ce: free
+                       [9.0, 5.0, 5.0],    # 1.2 from O across the cell edge: clash
+                       [1.5, 5.0, 5.0]])   # 1.3 from O: clash, 3.5 from Ce
+    np.testing.assert_array_equal(index.clashes(['Pt'] * 4, coords), [True, False, True, True])
+    isolated = SupportIndex(['Ce', 'O'], [[5.0, 5.0, 5.0], [0.2, 5.0, 5.0]], BOX,
+                            cutoffs=CUTOFFS, periodic=False)
+    np.testing.assert_array_equal(isolated.clashes(['Pt'] * 4, coords), [True, False, False, True])
+
+
+def test_batched_clashes_match_single_queries():
+    index = support()
+    rng = np.random.default_rng(0)
+    coords = rng.random((3, 2, 20, 3)) * 10
+    batched = index.clashes(['Pt'] * 20, coords)
+    assert batched.shape == (3, 2, 20)
+    for i in range(3):
+        for j in range(2):
+            np.testing.assert_array_equal(batched[i, j], index.clashes(['Pt'] * 20, coords[i, j]))
+
+
+def test_report_single_and_batched():
+    index = support()
+    coords = np.array([[5.0, 7.0, 5.0], [5.0, 8.0, 5.0]])
+    report = index.report(['Pt', 'Pt'], coords)
+    assert len(report) == 1
+    atom, species, nearest, distance = report[0]
+    assert (atom, species, nearest) == (0, 'Pt', 0) and abs(distance - 2.0) < 1e-12
+
+    batched = index.report(['Pt', 'Pt'], np.stack([coords, coords[::-1], coords + 5.0]))
+    assert len(batched) == 3
+    assert batched[0] == report
+    assert [entry[0] for entry in batched[1]] == [1]
+    assert batched[2] == []
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Streaming frozen-phonon accumulation against batch statistics."""
+
+## Import necessary modules
+import numpy as np
+import numpy_multislice as nms
+from defocus_series import image_series
+from frozen_phonons import (FrozenPhononAccumulator, configuration_seeds, displaced_structure,
+                            displacement_b_factors, frozen_phonon_average)
+
+IMAGING = {'sampling': (0.05, 0.05), 'ht': 300, 'aberrations': {}}
+
+
+def test_accumulator_matches_batch_statistics():
+    rng = np.random.default_rng(3)
+    waves = rng.standard_normal((7, 8, 8)) + 1j * rng.standard_normal((7, 8, 8))
+    images = rng.random((7, 2, 8, 8))
+    accumulator = FrozenPhononAccumulator()
+    for wave, image in zip(waves, images):
+        accumulator.update(wave, image)
+    assert accumulator.count == 7
+    mean_wave = waves.mean(axis=0)
+    assert np.allclose(accumulator.mean_wave, mean_wave)
+    assert np.allclose(accumulator.wave_variance, np.mean(np.abs(waves - mean_wave)**2, axis=0))
+    assert np.allclose(accumulator.mean_images, images.mean(axis=0))
+    assert np.allclose(accumulator.image_variance, images.var(axis=0))
+
+
+def test_average_is_independent_of_workers(structure):
+    n_configurations = 4
+    defoci = (0.0, 8.0)
+    runs = [frozen_phonon_average(structure, n_configurations, 300, 32, 32, 4, defoci=defoci,
+                                  imaging=IMAGING, seed=1, max_workers=workers)
+            for workers in (1, 3)]
+    assert np.allclose(runs[0].mean_wave, runs[1].mean_wave)
+    assert np.allclose(runs[0].mean_images, runs[1].mean_images)
+
+    # Same configurations, simulated and averaged in one batch
+    b_values = displacement_b_factors(structure)
+    waves, images = [], []
+    for seed in configuration_seeds(1, structure.title, n_configurations):
+        configuration = displaced_structure(structure, b_values, seed)
+        waves.append(nms.exit_wave(configuration, 300, 32, 32, 4, dwf=False))
+        images.append(image_series(waves[-1], defoci, **IMAGING))
+    waves, images = np.array(waves), np.array(images, dtype=np.float64)
+    assert np.allclose(runs[0].mean_wave, waves.mean(axis=0))
+    assert np.allclose(runs[0].wave_variance,
+                       np.mean(np.abs(waves - waves.mean(axis=0))**2, axis=0))
+    assert np.allclose(runs[0].mean_images, images.mean(axis=0))
+    assert np.allclose(runs[0].image_variance, images.var(axis=0))
+    assert runs[0].image_variance.max() > 0
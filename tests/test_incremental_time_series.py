@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Incremental re-simulation against full multislice runs."""
+
+## Import necessary modules
+import numpy as np
+import numpy_multislice as nms
+from incremental_time_series import IncrementalSimulator
+
+SETTINGS = dict(ht=300, nx=64, ny=64, nz=12)
+
+
+def moved(structure, atom, shift):
+    xyz = structure.xyz.copy()
+    xyz[atom] = np.mod(xyz[atom] + shift, 1.0)
+    return structure._replace(xyz=xyz)
+
+
+def test_incremental_matches_full_run(structure):
+    simulator = IncrementalSimulator(**SETTINGS, checkpoint_interval=4)
+    frames = [structure, moved(structure, 0, (0.05, 0.0, 0.0)),
+              moved(moved(structure, 0, (0.05, 0.0, 0.0)), 5, (0.0, 0.03, 0.0))]
+    for frame in frames:
+        wave = simulator.simulate(frame)
+        full = nms.exit_wave(frame, SETTINGS['ht'], SETTINGS['nx'], SETTINGS['ny'],
+                             SETTINGS['nz'])
+        np.testing.assert_allclose(wave, full, rtol=0, atol=1e-5)
+
+
+def test_only_changed_slices_are_recomputed(structure):
+    simulator = IncrementalSimulator(**SETTINGS)
+    simulator.simulate(structure)
+    assert len(simulator.last_changed) == SETTINGS['nz']
+    simulator.simulate(moved(structure, 0, (0.05, 0.0, 0.0)))
+    assert len(simulator.last_changed) == 1
+
+
+def test_unchanged_frame_returns_previous_wave(structure):
+    simulator = IncrementalSimulator(**SETTINGS)
+    first = simulator.simulate(structure)
+    second = simulator.simulate(structure)
+    assert simulator.last_changed == []
+    np.testing.assert_array_equal(first, second)
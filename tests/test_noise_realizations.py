@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Seeded noise realizations."""
+
+## Import necessary modules
+import csv
+import os
+import numpy as np
+import pytest
+from PIL import Image
+import noise_realizations
+from noise_realizations import NoiseStackWriter, noisy_frame, noisy_realizations, realization_seed
+
+
+def clean_image():
+    return np.random.default_rng(1).random((32, 32)).astype(np.float32)
+
+
+def test_same_seed_reproduces_realizations():
+    seed = realization_seed(7, 'frame_0001', 8.0, 100)
+    first = noisy_realizations(clean_image(), 100, 3, seed)
+    second = noisy_realizations(clean_image(), 100, 3, realization_seed(7, 'frame_0001', 8.0, 100))
+    np.testing.assert_array_equal(first, second)
+    assert first.shape == (3, 32, 32)
+
+
+def test_seeds_differ_between_combinations():
+    base = noisy_realizations(clean_image(), 100, 1, realization_seed(7, 'frame_0001', 8.0, 100))
+    for seed in (realization_seed(8, 'frame_0001', 8.0, 100),
+                 realization_seed(7, 'frame_0002', 8.0, 100),
+                 realization_seed(7, 'frame_0001', 4.0, 100)):
+        assert not np.array_equal(base, noisy_realizations(clean_image(), 100, 1, seed))
+
+
+def test_noisy_frame_reproduces_stack_entry():
+    stack = noisy_realizations(clean_image(), 50, 4, realization_seed(3, 'frame', 0.0, 50))
+    for realization in range(4):
+        np.testing.assert_array_equal(noisy_frame(clean_image(), 50, realization, 3, 'frame', 0.0),
+                                      stack[realization])
+
+
+@pytest.mark.parametrize('use_tifffile', [True, False])
+def test_stack_writer_writes_one_file_per_level(tmp_path, monkeypatch, use_tifffile):
+    if not use_tifffile:
+        monkeypatch.setattr(noise_realizations, 'tifffile', None)
+    elif noise_realizations.tifffile is None:
+        pytest.skip('tifffile is not installed')
+    images = {'frame_a': clean_image(), 'frame_b': 2 * clean_image()}
+    with NoiseStackWriter(str(tmp_path), [10, 100], n_realizations=2, base_seed=4) as writer:
+        for name, image in images.items():
+            writer.write(image, name, name + '_img', 8.0)
+    assert sorted(os.listdir(str(tmp_path))) == [
+        'vac_int-100counts.tif', 'vac_int-100counts_frames.csv',
+        'vac_int-10counts.tif', 'vac_int-10counts_frames.csv']
+    with open(str(tmp_path / 'vac_int-100counts_frames.csv'), newline='') as f:
+        rows = list(csv.DictReader(f))
+    stack = Image.open(str(tmp_path / 'vac_int-100counts.tif'))
+    assert stack.n_frames == len(rows) == 4
+    for row in rows:
+        stack.seek(int(row['frame']))
+        name = row['image'][:-len('_img')]
+        expected = noisy_frame(images[name], 100, int(row['realization']), 4, name, 8.0)
+        np.testing.assert_array_equal(np.array(stack), expected)
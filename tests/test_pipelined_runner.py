@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Pipelined stages against the sequential pipeline."""
+
+## Import necessary modules
+import os
+import numpy as np
+import multislice_pipeline as pipeline
+import numpy_multislice as nms
+from pipeline_benchmark import benchmark_parameters, synthetic_cel
+from pipelined_runner import run_pipelined
+
+CELL = (1.6, 1.6, 1.2)
+SETTINGS = {'backend': 'numpy', 'nx': 32, 'ny': 32, 'nz': 6, 'defoci': [0, 8],
+            'vac_levels': [10], 'n_realizations': 1, 'noise_seed': 1}
+
+
+def setup(tmp_path, name, n_structures=2):
+    directories = [str(tmp_path / name / d) for d in ('output', 'clean', 'noisy')]
+    for directory in directories:
+        os.makedirs(directory)
+    cel_files = []
+    for i in range(n_structures):
+        cel_files.append(str(tmp_path / f'frame_{i}.cel'))
+        if not os.path.isfile(cel_files[-1]):
+            synthetic_cel(cel_files[-1], 12, CELL, seed=i)
+    return cel_files, directories
+
+
+def test_pipelined_matches_sequential(tmp_path):
+    msa_prm, wav_prm = benchmark_parameters(CELL, 32, 32, 6, backend='numpy')
+    cel_files, directories = setup(tmp_path, 'sequential')
+    for cel_file in cel_files:
+        pipeline.simulate_structure(cel_file, *directories, msa_prm, wav_prm, SETTINGS)
+    cel_files, pipelined_directories = setup(tmp_path, 'pipelined')
+    finished, failures = run_pipelined(cel_files, *pipelined_directories, msa_prm, wav_prm,
+                                       SETTINGS, max_sliced=2)
+    assert sorted(finished) == ['frame_0', 'frame_1'] and failures == []
+    for name in finished:
+        for defocus in (0, 8):
+            dat = f'{name}/img/{name}_6slc_32x32_{defocus}nmDefocus.dat'
+            sequential = np.fromfile(os.path.join(directories[0], dat), dtype=np.float32)
+            pipelined = np.fromfile(os.path.join(pipelined_directories[0], dat), dtype=np.float32)
+            np.testing.assert_array_equal(pipelined, sequential)
+        # The numpy gratings stay in memory: no slice files are written
+        assert not os.path.exists(os.path.join(pipelined_directories[0], name, 'slc'))
+
+
+def test_failed_slicing_is_cleaned_up(tmp_path, monkeypatch):
+    msa_prm, wav_prm = benchmark_parameters(CELL, 32, 32, 6, backend='numpy')
+    cel_files, directories = setup(tmp_path, 'failing')
+    slice_stage = pipeline.slice_stage
+
+    def failing_slice_stage(job, *args, **kwargs):
+        if job['structure_name'] == 'frame_0':
+            os.makedirs(job['slc_dir'])
+            raise RuntimeError('slicing failed')
+        return slice_stage(job, *args, **kwargs)
+
+    monkeypatch.setattr(pipeline, 'slice_stage', failing_slice_stage)
+    finished, failures = run_pipelined(cel_files, *directories, msa_prm, wav_prm, SETTINGS)
+    assert finished == ['frame_1']
+    assert [(name, stage) for name, stage, _ in failures] == [('frame_0', 'slice')]
+    assert not os.path.exists(os.path.join(directories[0], 'frame_0', 'slc'))
+
+
+def test_in_memory_gratings_match_exit_wave(tmp_path):
+    msa_prm, wav_prm = benchmark_parameters(CELL, 32, 32, 6, backend='numpy')
+    cel_files, directories = setup(tmp_path, 'memory', 1)
+    job = pipeline.prepare_stage(cel_files[0], *directories, msa_prm, wav_prm, SETTINGS)
+    pipeline.slice_stage(job, slices_in_memory=True)
+    assert job['gratings'].shape == (6, 32, 32)
+    pipeline.propagate_stage(job)
+    assert 'gratings' not in job
+    expected = nms.exit_wave(nms.read_cel(cel_files[0]), 300, 32, 32, 6,
+                             tilt=(msa_prm.tilt_x, msa_prm.tilt_y))
+    np.testing.assert_allclose(job['exit_wave'], expected, atol=1e-5)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Writing, appending and reading series containers."""
+
+## Import necessary modules
+import numpy as np
+import pytest
+
+pytest.importorskip('h5py')
+
+from noise_realizations import noisy_realizations, realization_seed
+from series_container import SeriesCollector, SeriesReader, SeriesWriter
+
+SETTINGS = {'nx': 16, 'ny': 8, 'defoci': [0.0, 8.0], 'vac_levels': [10, 100],
+            'n_realizations': 2, 'noise_seed': 5}
+
+
+def image(value):
+    return np.full((8, 16), value, dtype=np.float32)
+
+
+def write_frame(container, name, value):
+    for defocus in SETTINGS['defoci']:
+        container.write_image(image(value + defocus), name, defocus)
+    container.write_exit_wave(np.full((8, 16), value + 1j, dtype=np.complex64), name)
+    container.mark_complete(name)
+
+
+def test_write_and_read(tmp_path):
+    path = str(tmp_path / 'series.h5')
+    with SeriesWriter(path, SETTINGS, frame_names=['a', 'b'], wave_dtype='complex64') as writer:
+        write_frame(writer, 'b', 2.0)
+        write_frame(writer, 'a', 1.0)
+    with SeriesReader(path) as reader:
+        assert reader.frames == ['a', 'b'] and len(reader) == 2
+        np.testing.assert_array_equal(reader.clean('b', 8.0), image(10.0))
+        np.testing.assert_array_equal(reader.exit_wave(0), np.full((8, 16), 1 + 1j))
+        # The noise is that of noise_realizations.py
+        seed = realization_seed(5, 'a', 8.0, 100)
+        expected = noisy_realizations(image(9.0), 100, 2, seed)
+        np.testing.assert_array_equal(reader.noisy('a', 100, 8.0, realization=1), expected[1])
+
+
+def test_append_continues_and_tracks_completion(tmp_path):
+    path = str(tmp_path / 'series.h5')
+    writer = SeriesWriter(path, SETTINGS, frame_names=['a', 'b'])
+    write_frame(writer, 'a', 1.0)
+    writer.flush()
+    assert writer.completed_frames == {'a'}
+    writer.close()
+
+    writer = SeriesWriter(path, SETTINGS, frame_names=['a', 'b', 'c'], append=True)
+    assert writer.completed_frames == {'a'}
+    write_frame(writer, 'c', 3.0)
+    writer.close()
+    with SeriesReader(path) as reader:
+        assert reader.frames == ['a', 'b', 'c']
+        np.testing.assert_array_equal(reader.clean('a', 0.0), image(1.0))
+        np.testing.assert_array_equal(reader.clean('c', 0.0), image(3.0))
+
+
+def test_append_rejects_other_layout(tmp_path):
+    path = str(tmp_path / 'series.h5')
+    SeriesWriter(path, SETTINGS, frame_names=['a']).close()
+    with pytest.raises(ValueError):
+        SeriesWriter(path, dict(SETTINGS, nx=32), append=True)
+
+
+def test_collector_replay_matches_direct_writes(tmp_path):
+    direct, replayed = str(tmp_path / 'direct.h5'), str(tmp_path / 'replayed.h5')
+    with SeriesWriter(direct, SETTINGS, frame_names=['a'], wave_dtype='float16') as writer:
+        write_frame(writer, 'a', 1.0)
+    collector = SeriesCollector(SETTINGS, wave_dtype='float16')
+    write_frame(collector, 'a', 1.0)
+    with SeriesWriter(replayed, SETTINGS, frame_names=['a'], wave_dtype='float16') as writer:
+        collector.replay(writer)
+        writer.flush()
+        assert writer.completed_frames == {'a'}
+    with SeriesReader(direct) as first, SeriesReader(replayed) as second:
+        for name in ('clean', 'noisy', 'exit_waves'):
+            np.testing.assert_array_equal(first.file[name][:], second.file[name][:])
+
+
+def test_batch_resume_checks_container(tmp_path):
+    from batch_runner import _check_container, _open_container
+    path = str(tmp_path / 'series.h5')
+    cel_files = [str(tmp_path / f'{name}.cel') for name in ('a', 'b')]
+    writer = _open_container(path, cel_files, SETTINGS, 'msa.prm', 'wav.prm', None)
+    write_frame(writer, 'a', 1.0)
+    writer.close()
+    manifest = {cel_file: {'cel': cel_file, 'structure': name, 'status': 'done'}
+                for cel_file, name in zip(cel_files, ('a', 'b'))}
+    writer = _open_container(path, cel_files, SETTINGS, 'msa.prm', 'wav.prm', None)
+    # 'b' is listed as done, but never reached the container
+    assert list(_check_container(manifest, writer)) == [cel_files[0]]
+    writer.close()
+
+    # A damaged container is moved aside and started again
+    with open(path, 'wb') as f:
+        f.write(b'not an HDF5 file')
+    writer = _open_container(path, cel_files, SETTINGS, 'msa.prm', 'wav.prm', None)
+    assert writer.completed_frames == set()
+    writer.close()
+    assert (tmp_path / 'series.h5.damaged').exists()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Eviction and concurrent use of the slice cache."""
+
+## Import necessary modules
+import os
+import threading
+import time
+from slice_cache import SliceCache, directory_size
+
+
+def builder(size):
+    def build(prefix):
+        with open(prefix + '_001.sli', 'wb') as f:
+            f.write(b'\0' * size)
+    return build
+
+
+def test_released_entries_stay_within_budget(tmp_path):
+    cache = SliceCache(str(tmp_path), max_bytes=1000)
+    for i in range(10):
+        cache.release(cache.get_or_create(f'key{i}', builder(500)))
+    assert directory_size(str(tmp_path)) <= 1000
+    # The most recently used entries are kept
+    assert sorted(key for _, _, key in cache.entries()) == ['key8', 'key9']
+
+
+def test_entries_in_use_are_not_evicted(tmp_path):
+    cache = SliceCache(str(tmp_path), max_bytes=1000)
+    held = cache.get_or_create('held', builder(500))
+    for i in range(5):
+        cache.release(cache.get_or_create(f'key{i}', builder(500)))
+    assert os.path.isfile(held + '_001.sli')
+    assert directory_size(str(tmp_path)) <= 1000
+    cache.release(held)
+    assert cache.in_use() == set()
+    cache.release(cache.get_or_create('other', builder(500)))
+    cache.release(cache.get_or_create('another', builder(500)))
+    assert not os.path.isdir(cache.entry_dir('held'))
+
+
+def test_hit_does_not_build_again(tmp_path):
+    cache = SliceCache(str(tmp_path))
+    calls = []
+    build = lambda prefix: (calls.append(prefix), builder(10)(prefix))
+    first = cache.get_or_create('key', build)
+    second = cache.get_or_create('key', build)
+    assert first == second and len(calls) == 1
+    assert cache.in_use() == {'key'}
+    cache.release(first)
+    cache.release(second)
+    assert cache.in_use() == set()
+
+
+def test_concurrent_creation_gives_one_complete_entry(tmp_path):
+    cache = SliceCache(str(tmp_path))
+    barrier = threading.Barrier(4)
+    prefixes = []
+
+    def build(prefix):
+        barrier.wait(timeout=10)
+        builder(100)(prefix)
+
+    def worker():
+        prefixes.append(cache.get_or_create('key', build))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(prefixes)) == 1
+    assert os.path.getsize(prefixes[0] + '_001.sli') == 100
+    # No temporary directories are left behind
+    assert sorted(os.listdir(str(tmp_path))) == ['.in_use', 'key']
+
+
+def test_clear_stale_removes_markers_of_killed_workers(tmp_path):
+    cache = SliceCache(str(tmp_path), max_bytes=100)
+    cache.get_or_create('orphan', builder(500))
+    marker = os.path.join(cache.in_use_dir, os.listdir(cache.in_use_dir)[0])
+    old = time.time() - 2 * 24 * 3600
+    os.utime(marker, (old, old))
+    cache.clear_stale()
+    assert cache.in_use() == set()
+    assert cache.evict() == ['orphan']
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Tilt grids and the files written by the tilt-series engine."""
+
+## Import necessary modules
+import os
+import numpy as np
+import pytest
+import numpy_multislice as nms
+import tilt_series
+
+
+def test_grid_order_and_composed_rotations():
+    tilts, matrices = tilt_series.tilt_grid([0, 2, 4], [0, 3], [5])
+    # a varies fastest, as in the nested c/b/a loops of the rotation script
+    np.testing.assert_array_equal(tilts[:4], [[0, 0, 5], [2, 0, 5], [4, 0, 5], [0, 3, 5]])
+    a, b, c = tilts[4]
+    sequential = (tilt_series.rotation_matrices(tilt_series.C_AXIS, [c])[0]
+                  @ tilt_series.rotation_matrices(tilt_series.B_AXIS, [b])[0]
+                  @ tilt_series.rotation_matrices(tilt_series.A_AXIS, [a])[0])
+    np.testing.assert_allclose(matrices[4], sequential)
+    np.testing.assert_allclose(matrices @ matrices.transpose(0, 2, 1),
+                               np.broadcast_to(np.eye(3), matrices.shape), atol=1e-12)
+
+
+def test_rotation_about_anchor():
+    coords = np.array([[6.0, 5.0, 5.0]])
+    matrices = tilt_series.rotation_matrices(tilt_series.C_AXIS, [90, 180])
+    rotated = tilt_series.rotate_about_anchor(coords, matrices, [5.0, 5.0, 5.0])
+    np.testing.assert_allclose(rotated[:, 0], [[5.0, 6.0, 5.0], [4.0, 5.0, 5.0]], atol=1e-12)
+
+
+def test_labels():
+    assert tilt_series.tilt_label(2, 0, 10) == '002a000b010c'
+    assert tilt_series.tilt_label(2.5, 0, 0) == '002.5a000.0b000.0c'
+
+
+def test_series_keeps_occupancies_and_b_factors(tmp_path):
+    pytest.importorskip('pymatgen')
+    from pymatgen.core import Lattice, Structure
+    structure = Structure(Lattice.cubic(10.0), ['Ce', {'Pt': 0.5}, 'Pt'],
+                          [[0.1, 0.1, 0.1], [0.5, 0.5, 0.5], [0.6, 0.5, 0.5]],
+                          site_properties={'b_iso': [0.3, 0.5, 0.7]})
+    written = tilt_series.write_tilt_series(structure, str(tmp_path), 'test', [0, 90], [0], [0],
+                                            write_cel=True)
+    assert [os.path.basename(cif_file) for cif_file in written] == [
+        'test_000a000b000c.cif', 'test_090a000b000c.cif']
+    cel = nms.read_cel(str(tmp_path / 'test_090a000b000c.cel'))
+    np.testing.assert_allclose(cel.occupancy, [1.0, 0.5, 1.0])
+    np.testing.assert_allclose(cel.biso, [0.003, 0.005, 0.007])
+    # The support atom stays, the particle rotates about the cell center (A axis)
+    np.testing.assert_allclose(cel.xyz[0], [0.1, 0.1, 0.1])
+    np.testing.assert_allclose(cel.xyz[2], [0.6, 0.5, 0.5], atol=1e-8)
+
+    # The .cif files read back with the same occupancies and B factors (pymatgen may reorder sites)
+    species, coords, occupancy, b_iso = tilt_series.structure_arrays(
+        tilt_series.read_structure(written[1]))[3:]
+    assert sorted(zip(species, occupancy, b_iso)) == pytest.approx(
+        [('Ce', 1.0, 0.3), ('Pt', 0.5, 0.5), ('Pt', 1.0, 0.7)])
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+Batched rotation engine for supported-particle tilt series.
+
+The particle (e.g. Pt) atoms of a base structure are rotated about an anchor
+point (by default the center of the supercell) for every combination of
+tilts about the A, B and C axes. Tilts are applied sequentially about A,
+then B, then C, as in
+rotate_supported_pt_particle_and_delete_embedded_atoms_JLV_10092020.py.
+
+Instead of rebuilding a pymatgen Structure and calling rotate_sites for every
+combination, the particle coordinates are kept in one NumPy array, the
+composed rotation matrices of the whole a x b x c grid are built at once and
+applied with a single batched matrix multiply (in chunks of orientations to
+bound memory). The particle atoms are always taken from the unrotated base
+structure, so every orientation rotates the same set of atoms. Rotated
+structures are written straight to P1 .cif (and optionally .cel) files,
+with the occupancies and isotropic B factors of the base structure
+(read_structure keeps the B factors of a .cif file).
+
+The 'numpy' package is required; 'pymatgen' is used to read the base .cif file.
+
+@author: Joshua Vincent, Arizona State University (jvincen5@asu.edu)
+"""
+
+## Import necessary modules
+import itertools
+import os
+import numpy as np
+import numpy_multislice as nms
+
+## Orientations rotated per batched matrix multiply
+ORIENTATION_CHUNK = 256
+
+## Principal axes of the supercell
+A_AXIS, B_AXIS, C_AXIS = np.eye(3)
+
+
+def rotation_matrices(axis, angles):
+    """Right-handed rotation matrices (n, 3, 3) about axis for angles in degrees."""
+    axis = np.asarray(axis, dtype=float)
+    x, y, z = axis / np.linalg.norm(axis)
+    theta = np.radians(np.atleast_1d(np.asarray(angles, dtype=float)))
+    cos, sin = np.cos(theta)[:, None, None], np.sin(theta)[:, None, None]
+    cross = np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+    outer = np.outer([x, y, z], [x, y, z])
+    return cos * np.eye(3) + sin * cross + (1 - cos) * outer
+
+
+def tilt_grid(a_tilts, b_tilts, c_tilts):
+    """
+    Tilt combinations and their composed rotation matrices.
+
+    Returns (tilts, matrices) where tilts is an (n, 3) array of (a, b, c)
+    tilts in degrees, ordered like the nested c/b/a loops of the rotation
+    script, and matrices the (n, 3, 3) rotations R_c @ R_b @ R_a.
+    """
+    tilts = np.array([(a, b, c) for c, b, a
+                      in itertools.product(c_tilts, b_tilts, a_tilts)], dtype=float)
+    matrices = (rotation_matrices(C_AXIS, tilts[:, 2])
+                @ rotation_matrices(B_AXIS, tilts[:, 1])
+                @ rotation_matrices(A_AXIS, tilts[:, 0]))
+    return tilts, matrices
+
+
+def rotate_about_anchor(coords, matrices, anchor):
+    """Cartesian coords (n_atoms, 3) rotated by every matrix: (n_matrices, n_atoms, 3)."""
+    anchor = np.asarray(anchor, dtype=float)
+    return np.einsum('mij,nj->mni', matrices, coords - anchor) + anchor
+
+
+def wrap_to_unit_cell(coords, lattice_matrix):
+    """Fractional coordinates in [0, 1) of Cartesian coords (..., 3)."""
+    frac = coords @ np.linalg.inv(lattice_matrix)
+    return np.mod(frac, 1.0)
+
+
+def tilt_label(a_tilt, b_tilt, c_tilt):
+    """File name suffix of a tilt combination, e.g. 002a000b000c or 002.5a000.0b000.0c."""
+    tilts = (a_tilt, b_tilt, c_tilt)
+    if all(float(tilt).is_integer() for tilt in tilts):
+        return '{:03d}a{:03d}b{:03d}c'.format(*(int(tilt) for tilt in tilts))
+    return '{:05.1f}a{:05.1f}b{:05.1f}c'.format(*tilts)
+
+
+def write_cif(cif_file, lattice_abc, lattice_angles, species, frac_coords, data_name,
+              occupancy=None, b_iso=None):
+    """
+    Write a P1 .cif file from species and fractional coordinate arrays.
+    occupancy defaults to 1 for every site; b_iso (A^2) is written as
+    _atom_site_B_iso_or_equiv when given.
+    """
+    n_atoms = len(species)
+    occupancy = np.ones(n_atoms) if occupancy is None else np.asarray(occupancy, dtype=float)
+    a, b, c = lattice_abc
+    alpha, beta, gamma = lattice_angles
+    volume = a * b * c * np.sqrt(1 - np.cos(np.radians(alpha))**2 - np.cos(np.radians(beta))**2
+                                 - np.cos(np.radians(gamma))**2 + 2 * np.cos(np.radians(alpha))
+                                 * np.cos(np.radians(beta)) * np.cos(np.radians(gamma)))
+    lines = [f'data_{data_name}',
+             "_symmetry_space_group_name_H-M   'P 1'",
+             f'_cell_length_a   {a:.8f}', f'_cell_length_b   {b:.8f}',
+             f'_cell_length_c   {c:.8f}', f'_cell_angle_alpha   {alpha:.8f}',
+             f'_cell_angle_beta   {beta:.8f}', f'_cell_angle_gamma   {gamma:.8f}',
+             '_symmetry_Int_Tables_number   1', f'_cell_volume   {volume:.8f}',
+             'loop_', ' _symmetry_equiv_pos_site_id', ' _symmetry_equiv_pos_as_xyz',
+             "  1  'x, y, z'",
+             'loop_', ' _atom_site_type_symbol', ' _atom_site_label',
+             ' _atom_site_symmetry_multiplicity', ' _atom_site_fract_x',
+             ' _atom_site_fract_y', ' _atom_site_fract_z', ' _atom_site_occupancy']
+    if b_iso is None:
+        extra = [''] * n_atoms
+    else:
+        lines.append(' _atom_site_B_iso_or_equiv')
+        extra = [f'  {b:.6f}' for b in b_iso]
+    lines.extend(f'  {symbol}  {symbol}{i}  1  {x:.8f}  {y:.8f}  {z:.8f}  {occ:.6g}{b}'
+                 for i, (symbol, (x, y, z), occ, b)
+                 in enumerate(zip(species, frac_coords, occupancy, extra)))
+    with open(cif_file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def structure_arrays(structure):
+    """
+    (lattice matrix, abc, angles, species list, Cartesian coords, occupancies,
+    B factors in A^2) of a pymatgen structure. A partially occupied site
+    gives one entry per species; B factors come from the 'b_iso' site
+    property (see read_structure) and are 0 without it.
+    """
+    lattice = structure.lattice
+    species, coords, occupancy, b_iso = [], [], [], []
+    for site in structure:
+        for element, occ in site.species.items():
+            species.append(element.symbol)
+            coords.append(site.coords)
+            occupancy.append(occ)
+            b_iso.append(site.properties.get('b_iso', 0.0))
+    return (np.array(lattice.matrix), tuple(lattice.abc), tuple(lattice.angles), species,
+            np.array(coords).reshape(-1, 3), np.array(occupancy, dtype=float),
+            np.array(b_iso, dtype=float))
+
+
+def read_structure(cif_file):
+    """
+    Full unit cell of a .cif file as a pymatgen Structure, with the isotropic
+    B factors of the file (A^2) as the 'b_iso' site property.
+    """
+    from pymatgen.io.cif import CifParser
+    from cif_to_cel import site_b_factors
+    parser = CifParser(cif_file)
+    structure = parser.parse_structures(primitive=False)[0]
+    # site_b_factors gives nm^2
+    b_factors = site_b_factors(next(iter(parser.as_dict().values())))
+    structure.add_site_property('b_iso', [100 * b_factors.get(getattr(site, 'label', None), 0.0)
+                                          for site in structure])
+    return structure
+
+
+def write_tilt_series(structure, save_directory, structure_name, a_tilts, b_tilts, c_tilts,
+                      particle_species='Pt', anchor=None, remove_atoms=None,
+                      suffix='', write_cel=False, clash_index=None, drop_clashes=True):
+    """
+    Rotate the particle atoms of a pymatgen structure over a tilt grid and
+    write one .cif file per orientation.
+
+    anchor defaults to the center of the supercell. remove_atoms is an
+    optional function (orientation index, species list, frac coords) ->
+    boolean mask of atoms to delete, applied before writing; suffix is added
+    to the file names of structures treated this way or with clash_index. With write_cel, a
+    Dr. Probe .cel file is written next to every .cif file.
+
+    clash_index is an optional embedded_atom_removal.SupportIndex. The
+    particle atoms of each chunk of orientations are then checked against it
+    in one batched query; clashing atoms are deleted if drop_clashes is True,
+    and the number of clashes per file is written to clash_report.csv.
+    Returns the list of written .cif files.
+    """
+    lattice_matrix, abc, angles, species, coords, occupancy, b_iso = structure_arrays(structure)
+    species = np.array(species)
+    particle = species == particle_species
+    if anchor is None:
+        anchor = 0.5 * lattice_matrix.sum(axis=0)
+    # Only the rotated atoms are wrapped back into the cell, as with rotate_sites(to_unit_cell=True)
+    base_frac = coords @ np.linalg.inv(lattice_matrix)
+
+    tilts, matrices = tilt_grid(a_tilts, b_tilts, c_tilts)
+    written, clash_counts = [], []
+    for start in range(0, len(tilts), ORIENTATION_CHUNK):
+        chunk = slice(start, start + ORIENTATION_CHUNK)
+        rotated_cart = rotate_about_anchor(coords[particle], matrices[chunk], anchor)
+        rotated = wrap_to_unit_cell(rotated_cart, lattice_matrix)
+        if clash_index is not None:
+            # One query for all orientations of the chunk
+            clashes = clash_index.clashes(species[particle], rotated_cart)
+        for offset, (tilt, particle_frac) in enumerate(zip(tilts[chunk], rotated)):
+            frac = base_frac.copy()
+            frac[particle] = particle_frac
+            keep = np.ones(len(species), dtype=bool)
+            name = structure_name + '_' + tilt_label(*tilt)
+            if remove_atoms is not None:
+                keep &= ~remove_atoms(start + offset, species, frac)
+            if remove_atoms is not None or clash_index is not None:
+                name += suffix
+            if clash_index is not None:
+                clash_counts.append((name, int(clashes[offset].sum())))
+                if drop_clashes:
+                    keep[np.flatnonzero(particle)[clashes[offset]]] = False
+            frac, keep_species = frac[keep], species[keep]
+            cif_file = os.path.join(save_directory, name + '.cif')
+            write_cif(cif_file, abc, angles, keep_species, frac, name,
+                      occupancy[keep], b_iso[keep])
+            if write_cel:
+                # .cel files are in nm
+                cel = nms.CelStructure(name, tuple(np.array(abc) / 10) + tuple(angles),
+                                       list(keep_species), frac, occupancy[keep],
+                                       b_iso[keep] / 100)
+                nms.write_cel(os.path.join(save_directory, name + '.cel'), cel)
+            written.append(cif_file)
+    if clash_index is not None:
+        with open(os.path.join(save_directory, 'clash_report.csv'), 'w') as f:
+            f.write('structure,clashing_atoms\n')
+            f.writelines(f'{name},{count}\n' for name, count in clash_counts)
+    return written
+
+
+def below_plane(species, frac, particle_species='Pt', axis=1, threshold=0.49):
+    """Mask of particle atoms whose fractional coordinate along axis is below threshold."""
+    return (species == particle_species) & (frac[:, axis] < threshold)